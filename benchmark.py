@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import argparse
+import tempfile
+import traceback
+import resource
+import cv2
+import numpy as np
+
+from launcher import Launcher, __version__
+from src.camera import Camera
+from src.face_recognition import FaceRecognition
+from src.gallery import Gallery, storage_report
+from src.ann import IVFIndex
+from src.detector import create_detector
+from src.tracker import iou
+from src.utils import Utils, DefaultHelpParser
+from src.logger import init_logger
+
+log = logging.getLogger('fr3onn')
+
+
+def get_percentiles(samples):
+    """ Latency statistics in milliseconds """
+    if not samples:
+        return {}
+    samples = np.asarray(samples) * 1000
+    return {'mean': float(samples.mean()), 'p50': float(np.percentile(samples, 50)),
+            'p90': float(np.percentile(samples, 90)), 'p99': float(np.percentile(samples, 99)),
+            'max': float(samples.max()), 'count': len(samples)}
+
+
+def get_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / float(1 << 20)
+    except (IOError, OSError):
+        return get_peak_rss_mb()
+
+
+def get_peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def create_synthetic_video(path, frames=300, width=640, height=480, fps=30, seed=0):
+    """ Writes a video with a moving bright blob over a noisy background """
+    rng = np.random.RandomState(seed)
+    background = rng.randint(0, 256, (height, width, 3)).astype(np.uint8)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    for i in range(frames):
+        frame = background.copy()
+        x = int((width - 160) * (0.5 + 0.5 * np.sin(i / 20.0)))
+        cv2.ellipse(frame, (x + 80, height // 2), (60, 80), 0, 0, 360, (180, 190, 220), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def create_synthetic_encodings(n, samples_per_person=5, seed=0):
+    """ Encodings clustered by person, spread similar to dlib face encodings """
+    rng = np.random.RandomState(seed)
+    people = max(n // samples_per_person, 1)
+    centers = rng.normal(scale=0.1, size=(people, Gallery.ENCODING_SIZE))
+    encodings = centers[np.arange(n) % people] + rng.normal(scale=0.03, size=(n, Gallery.ENCODING_SIZE))
+    return encodings.astype(np.float32)
+
+
+class Benchmark:
+    def __init__(self, args):
+        self.args = args
+        self.utils = Utils()
+        self.work_dir = tempfile.mkdtemp(prefix='fr3onn_benchmark_')
+        self.video = args.video or create_synthetic_video(os.path.join(self.work_dir, 'synthetic.avi'),
+                                                          args.frames, args.width, args.height)
+        self.db_dir = args.db_dir or os.path.join(self.work_dir, 'db')
+
+    def cleanup(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def run_camera(self):
+        report = {}
+        for threaded in (False, True):
+            camera = Camera(self.video, threaded)
+            latencies = []
+            start = time.time()
+            while True:
+                frame_start = time.time()
+                frame = camera.get_frame()
+                if frame is None:
+                    break
+                latencies.append(time.time() - frame_start)
+            elapsed = time.time() - start
+            mode = 'threaded' if threaded else 'blocking'
+            report[mode] = {'read': get_percentiles(latencies), 'frames': len(latencies),
+                            'fps': len(latencies) / elapsed if elapsed else 0.0}
+            if threaded:
+                report[mode].update(camera.get_stats())
+            camera.stop()
+            log.info('Camera {}: {} frames, {:.1f} fps.'.format(mode, len(latencies), report[mode]['fps']))
+        return report
+
+    def run_stages(self):
+        face_recognition = FaceRecognition(detection_scale=self.args.detection_scale)
+        encodings = create_synthetic_encodings(1000)
+        face_recognition.gallery.extend(list(range(len(encodings))), encodings)
+        timings = {'detect': [], 'select': [], 'encode': [], 'match': [], 'total': []}
+        camera = Camera(self.video)
+        for _ in range(self.args.stage_frames):
+            frame = camera.get_frame()
+            if frame is None:
+                break
+            start = time.time()
+            face_locations = face_recognition.detect(frame)
+            detected = time.time()
+            face_location = face_recognition.select_face(face_locations, frame.shape)
+            selected = time.time()
+            # synthetic frames have no real faces, encode the central region to measure the encoder anyway
+            if face_location is None:
+                h, w = frame.shape[:2]
+                face_location = (h // 2 - 75, w // 2 + 75, h // 2 + 75, w // 2 - 75)
+            strangers_face_encodings = face_recognition.encode(face_recognition.crop(frame, face_location))
+            encoded = time.time()
+            face_recognition.identify(strangers_face_encodings or [encodings[0]])
+            matched = time.time()
+            timings['detect'].append(detected - start)
+            timings['select'].append(selected - detected)
+            timings['encode'].append(encoded - selected)
+            timings['match'].append(matched - encoded)
+            timings['total'].append(matched - start)
+        report = {stage: get_percentiles(samples) for stage, samples in timings.items()}
+        for stage in ('detect', 'select', 'encode', 'match', 'total'):
+            if report[stage]:
+                log.info('Stage {:<7} p50 {p50:8.2f} ms, p90 {p90:8.2f} ms, p99 {p99:8.2f} ms'
+                         .format(stage, **report[stage]))
+        return report
+
+    def run_detectors(self):
+        """ Throughput of face detectors on the same frames, faces are compared with the first detector """
+        frames = []
+        camera = Camera(self.video)
+        while len(frames) < self.args.stage_frames:
+            frame = camera.get_frame()
+            if frame is None:
+                break
+            frames.append(frame)
+        camera.stop()
+        report = {}
+        reference = None
+        for name in self.args.detectors:
+            face_recognition = FaceRecognition(detection_scale=self.args.detection_scale, detector=create_detector(
+                name, self.args.cascade_model, self.args.dnn_model, self.args.dnn_config))
+            try:
+                face_recognition.detector.prepare()
+            except Exception as ex:
+                log.warning('Detector {} was skipped: {}'.format(name, ex))
+                report[name] = {'error': str(ex)}
+                continue
+            latencies = []
+            boxes = []
+            for frame in frames:
+                start = time.time()
+                boxes.append(face_recognition.detect(frame))
+                latencies.append(time.time() - start)
+            elapsed = sum(latencies)
+            line = {'detect': get_percentiles(latencies), 'fps': len(frames) / elapsed if elapsed else 0.0,
+                    'faces': sum(len(found) for found in boxes)}
+            if reference is None:
+                reference = boxes
+            elif any(reference):
+                # share of faces of the first detector which were found by this one as well
+                matched = sum(1 for expected, found in zip(reference, boxes) for box in expected
+                              if any(iou(box, other) >= 0.5 for other in found))
+                line['agreement'] = matched / float(sum(len(expected) for expected in reference))
+            report[name] = line
+            log.info('Detector {:<9} {:8.1f} fps, p50 {:8.2f} ms, {} faces'
+                     .format(name, line['fps'], line['detect'].get('p50', 0.0), line['faces']))
+        return report
+
+    def run_gallery(self):
+        report = []
+        for size in self.args.gallery_sizes:
+            encodings = create_synthetic_encodings(size)
+            rss = get_rss_mb()
+            start = time.time()
+            gallery = Gallery()
+            gallery.extend(list(range(size)), encodings)
+            build = time.time() - start
+            rng = np.random.RandomState(1)
+            queries = encodings[rng.choice(size, min(size, 200))] + \
+                rng.normal(scale=0.02, size=(min(size, 200), Gallery.ENCODING_SIZE)).astype(np.float32)
+            latencies = []
+            for query in queries:
+                start = time.time()
+                gallery.match(query)
+                latencies.append(time.time() - start)
+            line = {'size': size, 'build_s': build, 'match': get_percentiles(latencies),
+                    'rss_delta_mb': get_rss_mb() - rss, 'peak_rss_mb': get_peak_rss_mb()}
+            if self.args.ann_lists and size >= self.args.ann_lists * 4:
+                start = time.time()
+                gallery.set_index(IVFIndex(self.args.ann_lists, self.args.ann_probes))
+                line['ann_build_s'] = time.time() - start
+                latencies = []
+                for query in queries:
+                    start = time.time()
+                    gallery.match(query)
+                    latencies.append(time.time() - start)
+                line['ann_match'] = get_percentiles(latencies)
+            line['storage'] = storage_report(encodings, queries)
+            report.append(line)
+            log.info('Gallery {:>7}: build {:.3f} s, match p50 {:.3f} ms, peak RSS {:.1f} MB'
+                     .format(size, build, line['match']['p50'], line['peak_rss_mb']))
+        return report
+
+    def run_launcher(self):
+        # every frame is recognized, a latency budget is not checked
+        argv = ['--camera', self.video, '--gpio', 'fake', '--db_dir', self.db_dir, '--every_frame',
+                '--startup_wait'] + self.args.launcher_args
+        start = time.time()
+        launcher = Launcher(argv)
+        constructed = time.time()
+        exit_code = launcher.main()
+        elapsed = time.time() - start
+        door = launcher.doors[0].get_stats()
+        report = {'argv': argv, 'exit_code': exit_code, 'startup_s': constructed - start, 'elapsed_s': elapsed,
+                  'frames': door['frames'], 'processed': door['processed'],
+                  'fps': door['frames'] / (elapsed - (constructed - start)) if elapsed > constructed - start else 0.0,
+                  'processed_fps': door['fps'], 'latency_ms': door['latency_ms'], 'peak_rss_mb': get_peak_rss_mb(),
+                  'startup': launcher.get_startup_times()}
+        return report
+
+    def run(self):
+        report = {'version': __version__, 'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                  'platform': {'python': platform.python_version(), 'machine': platform.machine(),
+                               'processor': platform.processor(), 'cpus': os.cpu_count(),
+                               'opencv': cv2.__version__, 'numpy': np.__version__},
+                  'video': self.video}
+        suites = self.args.suites
+        if 'camera' in suites:
+            report['camera'] = self.run_camera()
+        if 'stages' in suites:
+            report['stages'] = self.run_stages()
+        if 'detectors' in suites:
+            report['detectors'] = self.run_detectors()
+        if 'gallery' in suites:
+            report['gallery'] = self.run_gallery()
+        if 'launcher' in suites:
+            report['launcher'] = self.run_launcher()
+        report['peak_rss_mb'] = get_peak_rss_mb()
+        return report
+
+
+def flatten(report, prefix=''):
+    values = {}
+    if isinstance(report, dict):
+        for key, value in report.items():
+            values.update(flatten(value, '{}{}.'.format(prefix, key)))
+    elif isinstance(report, list):
+        for item in report:
+            # gallery lines are identified by their size, storage lines by storage
+            key = item.get('size', item.get('storage', report.index(item))) if isinstance(item, dict) \
+                else report.index(item)
+            values.update(flatten(item, '{}{}.'.format(prefix, key)))
+    elif isinstance(report, (int, float)) and not isinstance(report, bool):
+        values[prefix[:-1]] = report
+    return values
+
+
+def compare(old, new):
+    """ Logs metrics which are present in both reports with relative change """
+    old, new = flatten(old), flatten(new)
+    log.info('{:<50} {:>12} {:>12} {:>8}'.format('metric', 'baseline', 'current', 'change'))
+    for key in sorted(set(old) & set(new)):
+        change = (new[key] - old[key]) / float(old[key]) * 100 if old[key] else 0.0
+        log.info('{:<50} {:>12.3f} {:>12.3f} {:>7.1f}%'.format(key, old[key], new[key], change))
+
+
+def create_parser():
+    parser = DefaultHelpParser(prog='fr3onn benchmark', description='Reproducible benchmarks of FR3ONN '
+                                                                    'with recorded or synthetic video',
+                               formatter_class=argparse.RawTextHelpFormatter, add_help=True)
+    parser.add_argument('--video', metavar='VIDEO', required=False, default=None,
+                        help='Recorded video to replay, synthetic video by default')
+    parser.add_argument('--frames', metavar='FRAMES', required=False, default=300, type=int,
+                        help='Number of frames of synthetic video, 300 by default')
+    parser.add_argument('--width', metavar='WIDTH', required=False, default=640, type=int,
+                        help='Width of synthetic video, 640 by default')
+    parser.add_argument('--height', metavar='HEIGHT', required=False, default=480, type=int,
+                        help='Height of synthetic video, 480 by default')
+    parser.add_argument('--stage_frames', metavar='STAGE_FRAMES', required=False, default=50, type=int,
+                        help='Number of frames for per-stage latency, 50 by default')
+    parser.add_argument('--gallery_sizes', metavar='SIZE', required=False, nargs='+', type=int,
+                        default=[10, 100, 1000, 10000, 100000],
+                        help='Numbers of synthetic encodings, 10 100 1000 10000 100000 by default')
+    parser.add_argument('--ann_lists', metavar='ANN_LISTS', required=False, default=0, type=int,
+                        help='Also measure IVF index with ANN_LISTS cells for large galleries')
+    parser.add_argument('--ann_probes', metavar='ANN_PROBES', required=False, default=8, type=int,
+                        help='Number of cells scanned per face, 8 by default')
+    parser.add_argument('-s', '--detection_scale', metavar='DETECTION_SCALE', required=False, default=1.0,
+                        type=float, help='Scale of frame copy used for face detection, 1.0 by default')
+    parser.add_argument('--detectors', metavar='DETECTOR', required=False, nargs='+',
+                        default=['hog', 'haar', 'lbp', 'haar+hog'],
+                        help='Face detectors to compare, hog haar lbp haar+hog by default.\n'
+                             'cnn is slow without GPU, dnn needs --dnn_model')
+    parser.add_argument('--cascade_model', metavar='CASCADE_MODEL', required=False, default=None,
+                        help='Path to cascade XML for haar and lbp detectors, OpenCV data by default')
+    parser.add_argument('--dnn_model', metavar='DNN_MODEL', required=False, default=None,
+                        help='Path to model of dnn detector')
+    parser.add_argument('--dnn_config', metavar='DNN_CONFIG', required=False, default=None,
+                        help='Path to config of dnn detector')
+    parser.add_argument('-d', '--db_dir', metavar='DB_DIR', required=False, default=None,
+                        help='Database for launcher benchmark, empty one by default')
+    parser.add_argument('--suites', metavar='SUITE', required=False, nargs='+',
+                        default=['camera', 'stages', 'detectors', 'gallery', 'launcher'],
+                        choices=['camera', 'stages', 'detectors', 'gallery', 'launcher'],
+                        help='Benchmarks to run, all by default')
+    parser.add_argument('--launcher_args', metavar='ARGS', required=False, default='',
+                        help='Extra launcher arguments in quotes, e.g. "--pipeline threads"')
+    parser.add_argument('-o', '--output', metavar='OUTPUT', required=False, default='benchmark.json',
+                        help='Path to JSON report, benchmark.json by default')
+    parser.add_argument('--compare', metavar='BASELINE', required=False, default=None,
+                        help='JSON report of a previous run to compare with')
+    return parser
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    args.launcher_args = args.launcher_args.split()
+    utils = Utils()
+    log_folder = os.path.join(os.getcwd(), 'logs', utils.get_formatted_datetime())
+    init_logger(log_folder)
+    benchmark = None
+    try:
+        log.info(utils.line_double)
+        log.info('Face Recognition with 3D imaging, OpenCV and Neural Nets: benchmark')
+        log.info(utils.line_double)
+        benchmark = Benchmark(args)
+        report = benchmark.run()
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        log.info(utils.line_double)
+        log.info('Report was written to {}.'.format(os.path.abspath(args.output)))
+        if args.compare:
+            with open(args.compare) as f:
+                compare(json.load(f), report)
+        log.info(utils.line_double)
+    except KeyboardInterrupt:
+        log.error('PROGRAM WAS INTERRUPTED')
+        return -1
+    except Exception as ex:
+        log.error('Something goes wrong **FAILED**:\n{} '.format(ex))
+        log.error('Error: {}'.format(traceback.format_exc()))
+        return -2
+    finally:
+        if benchmark is not None:
+            benchmark.cleanup()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
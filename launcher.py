@@ -29,43 +29,86 @@ import sys
 import logging
 import argparse
 import traceback
-import mraa
 import time
+import threading
 
-from src.camera import Camera
+# imports of fr3onn modules are the first startup step
+IMPORT_STARTED = time.time()
+
+from src.camera import Camera, REALSENSE
+from src.liveness import DepthLiveness
+from src.detector import DETECTORS, create_detector, is_valid_detector
+from src.door import Door
+from src.controller import GpioController
+from src.scheduler import CameraScheduler, FrameScheduler
+from src.pipeline import Pipeline, Stage, DROP_OLDEST
+from src.motion import MotionDetector
 from src.face_recognition import FaceRecognition
+from src.gallery import STORAGES
 from src.db import DataBase
-from src.utils import Utils
+from src.watcher import DatabaseWatcher
+from src.server import RecognitionServer, RecognitionClient, LOOPBACK
+from src.enrollment import select_enrollment_frames
+from src.utils import Utils, DefaultHelpParser
+from src import gpio
+from src import metrics
+from src import batch
+from src import server
 from src.logger import init_logger
+from src.lazy import StartupTask
 from src import logger
 
+IMPORT_TIME = time.time() - IMPORT_STARTED
+
 __version__ = '0.0.2'
 
 log = logging.getLogger('fr3onn')
 
-
-class DefaultHelpParser(argparse.ArgumentParser):
-    # Display help message in case of error
-    # http://stackoverflow.com/questions/4042452/display-help-message-with-python-argparse-when-script-is-called-without-any-argu
-    def error(self, message):
-        sys.stderr.write('error: %s\n' % message)
-        self.print_help()
-        sys.exit(-2)
+PIPELINE_FLUSH_TIMEOUT = 10.0
 
 
 class Launcher:
-    def __init__(self):
-        self.args = self.create_parser().parse_args()
+    def __init__(self, argv=None):
+        # startup is timed from here, a launcher may be created long after the module was imported
+        self.started = time.time()
+        parser = self.create_parser()
+        self.args = parser.parse_args(argv)
+        try:
+            self.gpio = gpio.get_backend(self.args.gpio)
+        except Exception as ex:
+            parser.error(str(ex))
+        for pins in ('lock_pins', 'light_pins', 'door_sensor_pins'):
+            if len(getattr(self.args, pins)) != len(self.args.camera):
+                parser.error('--{} should have one pin per camera'.format(pins))
+        if self.args.server and not self.args.server_crops and (self.args.depth or REALSENSE in self.args.camera):
+            parser.error('depth with --server needs --server_crops: liveness is checked on the door')
+        if not is_valid_detector(self.args.detector):
+            parser.error('--detector should be one of {} or two of them joined by "+"'.format(', '.join(DETECTORS)))
+        if self.args.server and self.args.pipeline:
+            parser.error('--pipeline can not be used with --server, frames are processed by the server')
         self.db = DataBase()
         self.utils = Utils()
-        self.face_recognition = FaceRecognition()
-        self.camera = Camera(int(self.args.camera) if str(self.args.camera).isdigit() else self.args.camera)
-        self.lock = mraa.Gpio(20)
-        self.green_light = mraa.Gpio(32)
-        self.is_door_opened = mraa.Gpio(26)
-        self.quit = mraa.Gpio(18)
-        self.remember_new_face = mraa.Gpio(16)
-        self.pin = mraa.Gpio(12)
+        self.controller = GpioController(self.gpio)
+        self.face_recognition = FaceRecognition(detection_scale=self.args.detection_scale,
+                                                detection_grayscale=self.args.detection_grayscale,
+                                                gallery_storage=self.args.gallery_storage,
+                                                detector=self.create_detector())
+        self.doors = [self.create_door(i) for i in range(len(self.args.camera))]
+        self.scheduler = CameraScheduler(self.doors)
+        self.quit = None
+        self.remember_new_face = None
+        self.pin = None
+        self.quit_pressed = threading.Event()
+        self.remember_new_face_pressed = threading.Event()
+        self.pipeline = None
+        self.pipeline_doors = {}
+        self.metrics_server = None
+        self.watcher = None
+        self.server = None
+        # deny-all but capture until the gallery and models are loaded in background
+        self.ready = False
+        self.tasks = []
+        self.background = []
         self.exit_code = 0
         self.log_folder = None
         self.create_logger()
@@ -74,11 +117,131 @@ class Launcher:
     def create_parser():
         parser = DefaultHelpParser(prog='fr3onn', description='Face Recognition with 3D imaging, '
                                                               'OpenCV and Neural Nets',
-                                   formatter_class=argparse.RawTextHelpFormatter, add_help=True)
-        parser.add_argument('-c', '--camera', metavar='CAMERA', required=False, default=0,
-                            help='Device index, 0 by default')
+                                   formatter_class=argparse.RawTextHelpFormatter, add_help=True,
+                                   epilog='Run "launcher.py batch -h" for offline processing of video files '
+                                          'and image folders,\n"launcher.py server -h" for recognition server')
+        parser.add_argument('-c', '--camera', metavar='CAMERA', required=False, default=['0'], nargs='+',
+                            help='Device indexes or video files, one per door, 0 by default')
+        parser.add_argument('--lock_pins', metavar='LOCK_PIN', required=False, default=[20], nargs='+', type=int,
+                            help='Lock GPIO pins, one per camera, 20 by default')
+        parser.add_argument('--light_pins', metavar='LIGHT_PIN', required=False, default=[32], nargs='+', type=int,
+                            help='Green light GPIO pins, one per camera, 32 by default')
+        parser.add_argument('--door_sensor_pins', metavar='DOOR_SENSOR_PIN', required=False, default=[26], nargs='+',
+                            type=int, help='Door sensor GPIO pins, one per camera, 26 by default')
         parser.add_argument('-d', '--db_dir', metavar='DB_DIR', required=False, default=None,
                             help='Path to database, <FR3ONN_DIR>/db by default')
+        parser.add_argument('--db_rescan', required=False, action='store_true',
+                            help='Compare database folder with the store: import images copied by hand,\n'
+                                 'forget deleted ones and encode changed ones again. Not done on a normal start')
+        parser.add_argument('-s', '--detection_scale', metavar='DETECTION_SCALE', required=False, default=1.0,
+                            type=float, help='Scale of frame copy used for face detection, 1.0 by default.\n'
+                                             'Encoding always uses the full resolution face sub-image')
+        parser.add_argument('-g', '--detection_grayscale', action='store_true',
+                            help='Detect faces on grayscale copy of frame')
+        parser.add_argument('--detector', metavar='DETECTOR', required=False, default='hog',
+                            help='Face detector: hog (dlib HOG, default), cnn (dlib CNN, slow without GPU),\n'
+                                 'haar or lbp (OpenCV cascades, fast), dnn (OpenCV SSD, needs --dnn_model).\n'
+                                 'Two detectors joined by "+" are cascaded: regions found by the first one\n'
+                                 'are checked by the second one, e.g. haar+hog')
+        parser.add_argument('--cascade_model', metavar='CASCADE_MODEL', required=False, default=None,
+                            help='Path to cascade XML for haar and lbp detectors, OpenCV data by default')
+        parser.add_argument('--dnn_model', metavar='DNN_MODEL', required=False, default=None,
+                            help='Path to model of dnn detector, e.g. res10_300x300_ssd_iter_140000.caffemodel')
+        parser.add_argument('--dnn_config', metavar='DNN_CONFIG', required=False, default=None,
+                            help='Path to config of dnn detector, e.g. deploy.prototxt')
+        parser.add_argument('--dnn_confidence', metavar='DNN_CONFIDENCE', required=False, default=0.5, type=float,
+                            help='Minimal confidence of dnn detector, 0.5 by default')
+        parser.add_argument('--track_interval', metavar='TRACK_INTERVAL', required=False, default=0, type=float,
+                            help='Track the selected face between frames and encode it again only when\n'
+                                 'the track is new, lost or older than TRACK_INTERVAL seconds,\n'
+                                 '0 (encode every processed frame) by default. Not used with --pipeline')
+        parser.add_argument('--recent_identities', metavar='RECENT_IDENTITIES', required=False, default=0, type=int,
+                            help='Match faces against RECENT_IDENTITIES recently granted identities first,\n'
+                                 'the whole database is matched only if none of them is close enough,\n'
+                                 '0 (always match the whole database) by default')
+        parser.add_argument('--recent_tolerance', metavar='RECENT_TOLERANCE', required=False, default=0.4, type=float,
+                            help='Maximal distance to a recent identity to accept it without matching\n'
+                                 'the whole database, stricter than the usual 0.6, 0.4 by default')
+        parser.add_argument('-m', '--motion_threshold', metavar='MOTION_THRESHOLD', required=False, default=0,
+                            type=float, help='Recognize faces only when the fraction of changed pixels of the scene\n'
+                                             'exceeds MOTION_THRESHOLD (e.g. 0.01), 0 (always) by default')
+        parser.add_argument('-b', '--latency_budget', metavar='LATENCY_BUDGET', required=False, default=1.0,
+                            type=float, help='End-to-end recognition latency budget in seconds, 1.0 by default.\n'
+                                             'Frames are recognized back to back while a face is present, an empty\n'
+                                             'scene is checked as rarely as the budget allows')
+        parser.add_argument('--face_hold', metavar='FACE_HOLD', required=False, default=2.0, type=float,
+                            help='Seconds after the last seen face to keep recognizing every frame, 2 by default')
+        parser.add_argument('--every_frame', required=False, action='store_true',
+                            help='Recognize every frame regardless of the latency budget, e.g. to benchmark\n'
+                                 'recognition on a recorded video')
+        parser.add_argument('--depth', metavar='DEPTH', required=False, default=None,
+                            help='Depth aligned to camera frames: recorded .npy file or folder of 16-bit PNGs (mm),\n'
+                                 '"synthetic" (face-like relief) or "synthetic_flat" (a photo) for testing.\n'
+                                 'Camera "realsense" provides depth itself')
+        parser.add_argument('--liveness_relief', metavar='LIVENESS_RELIEF', required=False, default=5.0, type=float,
+                            help='Minimal depth relief of a face in mm, flatter faces are rejected before encoding,\n'
+                                 '5 by default, 0 disables the check')
+        parser.add_argument('-t', '--threaded_capture', action='store_true',
+                            help='Grab camera frames in a background thread and always process the freshest one.\n'
+                                 'Always used with several cameras')
+        parser.add_argument('-p', '--pipeline', metavar='PIPELINE', required=False, default=None,
+                            choices=['threads', 'processes'],
+                            help='Run detection and encoding of frames concurrently in a pipeline\n'
+                                 'of threads or processes, serial processing by default')
+        parser.add_argument('--pipeline_workers', metavar='PIPELINE_WORKERS', required=False, default=2, type=int,
+                            help='Number of workers of detection and encoding pipeline stages, 2 by default')
+        parser.add_argument('-w', '--workers', metavar='WORKERS', required=False, default=None, type=int,
+                            help='Number of processes to encode database images, all cores by default')
+        parser.add_argument('--gallery_storage', metavar='GALLERY_STORAGE', required=False, default='float32',
+                            choices=STORAGES, help='Storage of known face encodings: float32 (by default), '
+                                                   'float16 or int8 (4 times less memory)')
+        parser.add_argument('--storage_report', required=False, action='store_true',
+                            help='Log memory, latency and distance errors of every gallery storage '
+                                 'against float64 on the database')
+        parser.add_argument('--templates', required=False, action='store_true',
+                            help='Match against per-person templates (centroid and medoids of encodings of all '
+                                 'images of a person) instead of every image')
+        parser.add_argument('--template_medoids', metavar='TEMPLATE_MEDOIDS', required=False, default=2, type=int,
+                            help='Number of medoids in addition to centroid in a person template, 2 by default')
+        parser.add_argument('--enroll_frames', metavar='ENROLL_FRAMES', required=False, default=5, type=int,
+                            help='Number of frames captured when remember new face button is pressed, 5 by default')
+        parser.add_argument('--enroll_min_face', metavar='ENROLL_MIN_FACE', required=False, default=80, type=int,
+                            help='Minimal face size in pixels of an enrolled frame, 80 by default')
+        parser.add_argument('--enroll_min_sharpness', metavar='ENROLL_MIN_SHARPNESS', required=False, default=50.0,
+                            type=float, help='Minimal sharpness (variance of Laplacian) of the face on an enrolled '
+                                             'frame, 50 by default')
+        parser.add_argument('--server', metavar='SERVER', required=False, default=None,
+                            help='URL of recognition server (http://<host>:<port>) to send frames to,\n'
+                                 '"loopback" runs the server in this process for testing')
+        parser.add_argument('--server_crops', required=False, action='store_true',
+                            help='Detect faces locally and send only face crops to recognition server')
+        parser.add_argument('--server_port', metavar='SERVER_PORT', required=False, default=8500, type=int,
+                            help='Port of loopback recognition server, 8500 by default')
+        parser.add_argument('--watch_db', required=False, action='store_true',
+                            help='Pick up images added to or removed from database folder without restart')
+        parser.add_argument('--watch_interval', metavar='WATCH_INTERVAL', required=False, default=2.0, type=float,
+                            help='Polling interval of database folder in seconds when inotify is not available, '
+                                 '2 by default')
+        parser.add_argument('--ann_lists', metavar='ANN_LISTS', required=False, default=0, type=int,
+                            help='Number of cells of approximate nearest neighbour index,\n'
+                                 '0 (exact search) by default')
+        parser.add_argument('--ann_probes', metavar='ANN_PROBES', required=False, default=8, type=int,
+                            help='Number of cells scanned per face, 8 by default')
+        parser.add_argument('--ann_pq', metavar='ANN_PQ', required=False, default=0, type=int,
+                            help='Number of product quantization sub-vectors, 0 (no quantization) by default')
+        parser.add_argument('--ann_report', action='store_true',
+                            help='Log recall vs latency of ANN index against exact search after initialization')
+        parser.add_argument('--startup_wait', required=False, action='store_true',
+                            help='Wait for the database and models before capturing, e.g. to recognize every frame\n'
+                                 'of a recorded video. By default doors capture and deny access while they load')
+        parser.add_argument('--metrics_port', metavar='METRICS_PORT', required=False, default=0, type=int,
+                            help='Serve metrics in Prometheus text format on http://127.0.0.1:METRICS_PORT/metrics,\n'
+                                 'disabled by default')
+        parser.add_argument('--metrics_interval', metavar='METRICS_INTERVAL', required=False, default=60,
+                            type=float, help='Log metrics summary every METRICS_INTERVAL seconds, 60 by default,\n'
+                                             '0 to disable')
+        parser.add_argument('--gpio', metavar='GPIO', required=False, default='mraa', choices=gpio.BACKENDS,
+                            help='GPIO backend: mraa (default) or fake to run without Intel Joule')
         parser.add_argument('-v', '--version', action='version', help='Show version and exit', version=__version__)
         return parser
 
@@ -94,55 +257,304 @@ class Launcher:
         log.info('Python:      {}'.format(sys.executable))
         log.info(self.utils.line_double)
 
-    def open_lock(self):
-        self.lock.write(1)
-        time.sleep(1)
-        self.lock.write(0)
+    def create_door(self, i):
+        camera = self.args.camera[i]
+        # several cameras are read concurrently, otherwise blocking reads would serialize them
+        threaded = self.args.threaded_capture or len(self.args.camera) > 1
+        if self.args.server:
+            face_recognition = RecognitionClient(self.get_server_url(), FaceRecognition(
+                detection_scale=self.args.detection_scale, detection_grayscale=self.args.detection_grayscale,
+                detector=self.create_detector())
+                if self.args.server_crops else None)
+        # the first door uses the main instance, others share its gallery
+        elif i == 0:
+            face_recognition = self.face_recognition
+        else:
+            face_recognition = FaceRecognition(detection_scale=self.args.detection_scale,
+                                               detection_grayscale=self.args.detection_grayscale,
+                                               gallery=self.face_recognition.gallery,
+                                               detector=self.create_detector())
+        motion_detector = MotionDetector(self.args.motion_threshold) if self.args.motion_threshold else None
+        # no budget: every frame is recognized
+        frame_scheduler = FrameScheduler(camera, None if self.args.every_frame else self.args.latency_budget,
+                                         self.args.face_hold)
+        # cameras are opened concurrently by main()
+        door_camera = Camera(int(camera) if camera.isdigit() else camera, threaded, depth=self.args.depth, lazy=True)
+        if door_camera.has_depth() and self.args.liveness_relief:
+            # with a recognition server faces are detected and checked on the door
+            liveness = DepthLiveness(self.args.liveness_relief / 1000.0)
+            self.get_local_face_recognition(face_recognition).set_liveness(liveness)
+        return Door(camera, door_camera, face_recognition, self.controller,
+                    self.args.lock_pins[i], self.args.light_pins[i], self.args.door_sensor_pins[i],
+                    motion_detector, frame_scheduler=frame_scheduler)
+
+    def create_detector(self):
+        """ Every FaceRecognition instance has its own detector, OpenCV networks are not shared by threads """
+        return create_detector(self.args.detector, self.args.cascade_model, self.args.dnn_model, self.args.dnn_config,
+                               self.args.dnn_confidence)
+
+    def get_local_face_recognition(self, face_recognition):
+        """ FaceRecognition which detects faces of a door, None if frames are sent to server as is """
+        return face_recognition.face_recognition if self.args.server else face_recognition
+
+    def get_server_url(self):
+        return 'http://127.0.0.1:{}'.format(self.args.server_port) if self.args.server == LOOPBACK else self.args.server
+
+    def is_remote(self):
+        """ Recognition is done by another process, local database is not loaded """
+        return self.args.server is not None and self.args.server != LOOPBACK
+
+    def get_face_recognitions(self):
+        """ Local FaceRecognition instances sharing the gallery """
+        return [self.face_recognition] + [door.face_recognition for door in self.doors
+                                          if isinstance(door.face_recognition, FaceRecognition) and
+                                          door.face_recognition is not self.face_recognition]
 
-    def green_light_on(self):
-        self.green_light.write(1)
+    def create_pipeline(self):
+        processes = self.args.pipeline == 'processes'
+        workers = self.args.pipeline_workers
+        # frames of every door are detected by the main instance, so it checks liveness of all of them
+        if self.face_recognition.liveness is None and self.args.liveness_relief and \
+                any(door.camera.has_depth() for door in self.doors):
+            self.face_recognition.set_liveness(DepthLiveness(self.args.liveness_relief / 1000.0))
+        # stage functions are pickled for worker processes, they get a copy without the gallery and the cache
+        detection = self.face_recognition.get_detection_copy() if processes else self.face_recognition
+        # the freshest frames are more important than old ones, so capture never waits for detection
+        return Pipeline([Stage('detect', detection.get_live_face_crop, workers, processes,
+                               drop_policy=DROP_OLDEST),
+                         Stage('encode', self.face_recognition.encode, workers, processes),
+                         Stage('match', self.face_recognition.identify)])
 
-    def green_light_off(self):
-        self.green_light.write(0)
+    def enroll(self, door, frame):
+        """ Adds a new person from a burst of frames, only frames with a good face are kept """
+        if self.is_remote():
+            log.warning('New faces are added to database of recognition server {}.'.format(self.args.server))
+            return
+        if not self.ready:
+            log.warning('Database is not loaded yet, nobody was added.')
+            return
+        frames = [frame]
+        while len(frames) < self.args.enroll_frames:
+            frame = door.camera.get_frame()
+            if frame is None:
+                break
+            frames.append(frame)
+        selected = select_enrollment_frames(self.face_recognition, frames, self.args.enroll_min_face,
+                                            self.args.enroll_min_sharpness)
+        log.info('{} of {} frames passed quality checks.'.format(len(selected), len(frames)))
+        if not selected:
+            log.warning('No frame with one large and sharp face, nobody was added.')
+            return
+        # a unique name: images of one person are merged into one template
+        name = 'Registered User {}'.format(time.strftime('%Y%m%d_%H%M%S'))
+        file_names = [file_name for file_name in (self.db.add_person(name, frame) for frame in selected) if file_name]
+        if self.watcher is not None:
+            # the gallery is owned by the watcher, it encodes the new images in background
+            self.watcher.request_sync()
+        else:
+            self.face_recognition.add_new_face_encodings(file_names, self.get_face_recognitions())
+
+    def handle_recognition(self, door, name):
+        door_name = ' at door {}'.format(door.name) if len(self.doors) > 1 else ''
+        if name:
+            metrics.registry.inc('matches')
+            log.info(self.utils.line_double)
+            # a recognition server answers with the person name
+            person = name if self.args.server else self.db.get_person_name(name)
+            log.info('**Access PROVIDED** to {}{}'.format(person, door_name))
+            door.green_light_on()
+            if not door.is_door_opened.read():
+                door.open_lock()
+            log.info(self.utils.line_double)
+        else:
+            metrics.registry.inc('denials')
+            # logged once per minute with the number of repeats
+            log.info('**Access DENIED**{}'.format(door_name), extra={'rate_limit': True})
+            door.green_light_off()
+
+    def handle_pipeline_results(self):
+        for seq, name in self.pipeline.get_ready():
+            door, submitted = self.pipeline_doors.pop(seq)
+            door.add_processed(time.time() - submitted)
+            metrics.registry.histogram('recognize').observe(time.time() - submitted)
+            self.handle_recognition(door, name)
+        # forget frames dropped by the pipeline
+        for seq in [seq for seq in self.pipeline_doors if seq < self.pipeline.next_output]:
+            del self.pipeline_doors[seq]
+            metrics.registry.inc('frames_dropped')
+
+    def setup_gpio(self):
+        self.controller.start()
+        for door in self.doors:
+            door.setup()
+        # buttons are handled by interrupts instead of reading them on every frame
+        self.quit = self.controller.input(18, self.quit_pressed.set)
+        self.remember_new_face = self.controller.input(16, self.remember_new_face_pressed.set)
+        self.pin = self.controller.output(12)
+        self.pin.write(1)
+
+    def prepare_models(self):
+        """ Loads detector and encoder models of instances which detect faces """
+        detecting = [self.get_local_face_recognition(door.face_recognition) for door in self.doors]
+        if self.args.server == LOOPBACK:
+            detecting.append(self.face_recognition)
+        for face_recognition in detecting:
+            if face_recognition is not None:
+                face_recognition.prepare()
+
+    def load_gallery(self):
+        self.db.set_db_dir(self.args.db_dir)
+        if self.args.db_rescan:
+            self.db.rescan()
+        if self.is_remote():
+            log.info('Frames are recognized by server {}.'.format(self.args.server))
+            return
+        if self.args.templates:
+            self.face_recognition.set_templates(self.args.template_medoids, self.db.get_person_name)
+        if self.args.ann_lists:
+            self.face_recognition.set_ann_index(self.args.ann_lists, self.args.ann_probes, self.args.ann_pq)
+        self.face_recognition.initialize_face_encodings(self.db.get_all_persons(), self.db.get_encoding_cache(),
+                                                        self.args.workers)
+        if self.args.ann_report:
+            self.face_recognition.log_ann_report()
+        if self.args.storage_report:
+            self.face_recognition.log_storage_report(self.db.get_all_persons())
+
+    def on_ready(self):
+        """ Starts parts which need the gallery and models, doors leave deny-all state """
+        for task in self.background:
+            task.wait()
+        if self.args.server == LOOPBACK:
+            self.server = RecognitionServer(self.face_recognition, self.db.get_person_name, self.args.server_port)
+            self.server.start()
+        if self.args.pipeline:
+            self.pipeline = self.create_pipeline()
+            self.pipeline.start()
+        if self.args.watch_db and not self.is_remote():
+            if self.args.pipeline == 'processes':
+                log.warning('Pipeline worker processes keep the gallery they were started with.')
+            self.watcher = DatabaseWatcher(self.db, self.get_face_recognitions(),
+                                           self.args.watch_interval, workers=self.args.workers)
+            self.watcher.start(self.db.get_all_persons())
+        self.ready = True
+        self.log_startup([(task.name, task.elapsed) for task in self.background], 'recognition')
+
+    def log_startup(self, steps, stage):
+        steps = ', '.join('{} {:.2f} s'.format(name, elapsed) for name, elapsed in steps)
+        log.info('Startup:     {}; {} ready in {:.2f} s'.format(steps, stage, time.time() - self.started))
+        log.info(self.utils.line_double)
+
+    def get_startup_times(self):
+        times = {'imports': IMPORT_TIME}
+        times.update({task.name: task.elapsed for task in self.tasks + self.background if task.elapsed is not None})
+        return times
 
     def main(self):
         try:
             self.header()
-            self.db.set_db_dir(self.args.db_dir)
-            self.face_recognition.initialize_face_encodings(self.db.get_all_persons())
-            self.lock.dir(mraa.DIR_OUT)
-            self.green_light.dir(mraa.DIR_OUT)
-            self.is_door_opened.dir(mraa.DIR_IN)
-            self.quit.dir(mraa.DIR_IN)
-            self.remember_new_face.dir(mraa.DIR_IN)
-            self.pin.dir(mraa.DIR_OUT) 
-            self.pin.write(1)
-            process_this_frame = True
+            for face_recognition in self.get_face_recognitions():
+                face_recognition.set_tracker(self.args.track_interval)
+                face_recognition.set_recent(self.args.recent_identities, self.args.recent_tolerance)
+            # models and the gallery take the longest, doors capture and deny access meanwhile
+            self.background = [StartupTask('models', self.prepare_models).start(),
+                               StartupTask('gallery', self.load_gallery).start()]
+            self.tasks = [StartupTask('camera {}'.format(door.name), door.camera.open).start() for door in self.doors]
+            self.tasks.append(StartupTask('GPIO', self.setup_gpio).start())
+            for task in self.tasks:
+                task.wait()
+            self.log_startup([('imports', IMPORT_TIME)] + [(task.name, task.elapsed) for task in self.tasks],
+                             'capture')
+            if self.args.metrics_port:
+                self.metrics_server = metrics.MetricsServer(self.args.metrics_port)
+                self.metrics_server.start()
+            if self.args.startup_wait:
+                self.on_ready()
+            else:
+                log.info('Access is denied until the database and models are loaded.')
+            last_summary = time.time()
             while True:
-                frame = self.camera.get_frame()
-                if process_this_frame:
-                    name = self.face_recognition.recognize(frame)
-                    if name:
-                        log.info(self.utils.line_double)
-                        log.info('**Access PROVIDED** to {}'.format(self.db.get_formatted_person_name(name)))
-                        self.green_light_on()
-                        if not self.is_door_opened.read():
-                            self.open_lock()
-                        log.info(self.utils.line_double)
+                if not self.ready and all(task.is_done() for task in self.background):
+                    self.on_ready()
+                door = self.scheduler.next()
+                with metrics.registry.timer('camera'):
+                    frame = door.camera.get_frame()
+                if frame is None:
+                    log.info('No more frames from camera {}. Quit.'.format(door.name))
+                    break
+                door.frames += 1
+                metrics.registry.inc('frames_seen')
+                if self.args.metrics_interval and time.time() - last_summary >= self.args.metrics_interval:
+                    log.info(metrics.registry.get_summary())
+                    if self.pipeline is None:
+                        for summary_door in self.doors:
+                            summary_door.frame_scheduler.log_stats()
+                    last_summary = time.time()
+                # idle scene: nothing to recognize
+                active = door.motion_detector is None or door.motion_detector.is_active(frame)
+                if not self.ready:
+                    # deny-all but capture: nothing is recognized until the gallery is loaded
+                    metrics.registry.inc('frames_dropped')
+                elif self.pipeline is not None:
+                    # every frame is submitted, the pipeline drops ones it has no capacity for
+                    if active:
+                        # depth goes along with its frame, flat faces are rejected before encoding
+                        seq = self.pipeline.put((frame, door.camera.get_depth()))
+                        if seq is not None:
+                            self.pipeline_doors[seq] = (door, time.time())
                     else:
-                        log.info('**Access DENIED**')
-                        self.green_light_off()
-                process_this_frame = not process_this_frame 
-                if not self.remember_new_face.read() and frame is not None:
+                        metrics.registry.inc('frames_dropped')
+                    self.handle_pipeline_results()
+                elif active and door.frame_scheduler.should_process():
+                    with metrics.registry.timer('recognize') as timer:
+                        name = door.face_recognition.recognize(frame, door.camera.get_depth())
+                    door.add_processed(time.time() - timer.start)
+                    door.frame_scheduler.update(time.time() - timer.start, door.face_recognition.face_present)
+                    self.handle_recognition(door, name)
+                else:
+                    metrics.registry.inc('frames_dropped')
+                if self.remember_new_face_pressed.is_set():
+                    self.remember_new_face_pressed.clear()
                     log.info('Starting to add you to database...')
-                    name = 'Registered User'
-                    file_name = self.db.add_person(name, frame)
-                    self.face_recognition.add_new_face_encoding(file_name)
-                    while not self.remember_new_face.read():
-                        time.sleep(0.1)
-                if not self.quit.read() and frame is not None:
+                    self.enroll(door, frame)
+                if self.quit_pressed.is_set():
                     log.info('Tumbler switch was pressed. Quit.')
                     break
+            if self.pipeline is not None:
+                # frames in flight are recognized before the pipeline is stopped
+                flushed = self.pipeline.flush(PIPELINE_FLUSH_TIMEOUT)
+                self.handle_pipeline_results()
+                if not flushed:
+                    log.warning('Pipeline was not flushed in {:.0f} s, results of {} frames are lost.'
+                                .format(PIPELINE_FLUSH_TIMEOUT, len(self.pipeline_doors)))
+            for door in self.doors:
+                door.log_stats()
+                if door.camera.threaded:
+                    log.info('  Camera: {captured} frames captured, {dropped} dropped, {fps:.1f} fps.'
+                             .format(**door.camera.get_stats()))
+                if door.face_recognition.tracker is not None:
+                    door.face_recognition.tracker.log_stats()
+                if isinstance(door.face_recognition, FaceRecognition) and door.face_recognition.recent is not None:
+                    door.face_recognition.recent.log_stats()
+                if self.pipeline is None:
+                    door.frame_scheduler.log_stats()
+                if door.motion_detector is not None:
+                    door.motion_detector.log_stats()
+                # with pipeline processes the detector and the liveness check count in the workers,
+                # their work is reported by the metrics sent back with the results
+                local = self.get_local_face_recognition(door.face_recognition)
+                if self.args.pipeline == 'processes':
+                    local = None
+                if local is not None:
+                    local.detector.log_stats()
+                if local is not None and local.liveness is not None:
+                    local.liveness.log_stats()
+            if self.pipeline is not None:
+                self.pipeline.log_stats()
+            if self.watcher is not None:
+                self.watcher.log_stats()
+            if self.server is not None:
+                self.server.log_stats()
+            log.info(metrics.registry.get_summary())
         except KeyboardInterrupt:
             logger.switch_to_summary()
             log.info(self.utils.line_single)
@@ -156,8 +568,22 @@ class Launcher:
             log.error('Error: {}'.format(traceback.format_exc()))
             log.info(self.utils.line_single)
             self.exit_code = -2
+        finally:
+            if self.watcher is not None:
+                self.watcher.stop()
+            if self.server is not None:
+                self.server.stop()
+            self.controller.stop()
+            if self.pipeline is not None:
+                self.pipeline.stop()
+            if self.metrics_server is not None:
+                self.metrics_server.stop()
         return self.exit_code
 
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        sys.exit(batch.main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'server':
+        sys.exit(server.main(sys.argv[2:]))
     sys.exit(Launcher().main())
@@ -0,0 +1,230 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import logging
+import numpy as np
+
+log = logging.getLogger('fr3onn')
+
+
+def squared_distances(data, centroids):
+    """ Matrix of squared Euclidean distances between rows of data and centroids """
+    squared = (data * data).sum(axis=1)[:, None] - 2 * data.dot(centroids.T) + (centroids * centroids).sum(axis=1)
+    return np.maximum(squared, 0)
+
+
+def kmeans(data, k, iterations=20, seed=0):
+    rng = np.random.RandomState(seed)
+    data = np.asarray(data, dtype=np.float32)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = squared_distances(data, centroids).argmin(axis=1)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, data)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # reseed empty clusters with random points
+        centroids[empty] = data[rng.choice(len(data), int(empty.sum()))]
+    return centroids
+
+
+class ProductQuantizer:
+    """ Splits vectors into m sub-vectors and encodes each with one byte (index of sub-centroid) """
+
+    def __init__(self, m=8, ksub=256, seed=0):
+        self.m = m
+        self.ksub = ksub
+        self.seed = seed
+        self.codebooks = None
+
+    def train(self, data):
+        dim = data.shape[1]
+        if dim % self.m:
+            raise Exception('Encoding size {} is not divisible by {} sub-quantizers'.format(dim, self.m))
+        sub = dim // self.m
+        self.codebooks = np.stack([kmeans(data[:, j * sub:(j + 1) * sub], self.ksub, seed=self.seed + j)
+                                   for j in range(self.m)]) if len(data) >= self.ksub else None
+        if self.codebooks is None:
+            raise Exception('At least {} vectors are needed to train product quantizer'.format(self.ksub))
+
+    def encode(self, data):
+        sub = self.codebooks.shape[2]
+        codes = np.empty((len(data), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = squared_distances(data[:, j * sub:(j + 1) * sub], self.codebooks[j]).argmin(axis=1)
+        return codes
+
+    def get_distance_table(self, vector):
+        sub = self.codebooks.shape[2]
+        return np.stack([((self.codebooks[j] - vector[j * sub:(j + 1) * sub]) ** 2).sum(axis=1)
+                         for j in range(self.m)])
+
+    def get_distances(self, table, codes):
+        # asymmetric distance: sum of precomputed per-subspace distances
+        return table[np.arange(self.m), codes].sum(axis=1)
+
+
+class IVFIndex:
+    """ Inverted file index: k-means coarse quantizer with nlist cells, only nprobe nearest cells are scanned
+
+    Cells keep contiguous copies of their vectors, so a probe is one matrix-vector product per cell.
+    With pq_m > 0 residuals are product-quantized instead and candidates are ranked by
+    approximate distance before exact re-ranking by the gallery.
+    """
+
+    def __init__(self, nlist=64, nprobe=8, pq_m=0, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.seed = seed
+        self.pq = ProductQuantizer(pq_m, seed=seed) if pq_m else None
+        self.centroids = None
+        self.lists = []
+        self.vectors = []
+        self.codes = []
+
+    def is_trained(self):
+        return self.centroids is not None
+
+    def get_min_size(self):
+        return max(self.nlist, self.pq.ksub if self.pq is not None else 0)
+
+    def reset(self):
+        self.centroids = None
+        self.lists = []
+        self.vectors = []
+        self.codes = []
+
+    def __len__(self):
+        return sum(len(rows) for rows in self.lists)
+
+    def build(self, matrix, rows):
+        """ Trains the coarse (and product) quantizer on matrix and fills cells with rows """
+        start = time.time()
+        matrix = np.asarray(matrix, dtype=np.float32)
+        # training on a sample is enough, 64 points per cell is a usual rule of thumb
+        rng = np.random.RandomState(self.seed)
+        sample = matrix[rng.choice(len(matrix), min(len(matrix), self.nlist * 64), replace=False)]
+        self.centroids = kmeans(sample, self.nlist, seed=self.seed)
+        assignment = squared_distances(matrix, self.centroids).argmin(axis=1)
+        if self.pq is not None:
+            self.pq.train(sample - self.centroids[squared_distances(sample, self.centroids).argmin(axis=1)])
+        self.lists = []
+        self.vectors = []
+        self.codes = []
+        for cell in range(len(self.centroids)):
+            members = np.flatnonzero(assignment == cell)
+            self.lists.append(np.asarray(rows)[members].astype(np.int64))
+            if self.pq is not None:
+                self.codes.append(self.pq.encode(matrix[members] - self.centroids[cell]))
+            else:
+                self.vectors.append(matrix[members])
+        log.info('ANN index: {} vectors in {} cells built in {:.2f} s.'
+                 .format(len(matrix), len(self.centroids), time.time() - start))
+
+    def add(self, row, encoding):
+        encoding = np.asarray(encoding, dtype=np.float32)
+        cell = int(squared_distances(encoding[None], self.centroids).argmin())
+        self.lists[cell] = np.append(self.lists[cell], row)
+        if self.pq is not None:
+            self.codes[cell] = np.vstack([self.codes[cell], self.pq.encode((encoding - self.centroids[cell])[None])])
+        else:
+            self.vectors[cell] = np.vstack([self.vectors[cell], encoding])
+
+    def remap(self, mapping):
+        """ Renumbers rows after gallery compaction, rows mapped to -1 are dropped """
+        for cell in range(len(self.lists)):
+            rows = mapping[self.lists[cell]]
+            keep = rows >= 0
+            self.lists[cell] = rows[keep]
+            if self.pq is not None:
+                self.codes[cell] = self.codes[cell][keep]
+            else:
+                self.vectors[cell] = self.vectors[cell][keep]
+
+    def is_exact(self):
+        return self.pq is None
+
+    def search(self, encoding, limit=None, nprobe=None):
+        """ Returns (rows, squared distances) of candidates from the nprobe nearest cells
+
+        Distances are exact without product quantization. With it they are approximate
+        and only limit nearest candidates are returned.
+        """
+        encoding = np.asarray(encoding, dtype=np.float32)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        cells = np.argpartition(squared_distances(encoding[None], self.centroids)[0], nprobe - 1)[:nprobe]
+        rows = []
+        distances = []
+        for cell in cells:
+            rows.append(self.lists[cell])
+            if self.pq is None:
+                distances.append(squared_distances(encoding[None], self.vectors[cell])[0])
+            else:
+                table = self.pq.get_distance_table(encoding - self.centroids[cell])
+                distances.append(self.pq.get_distances(table, self.codes[cell]))
+        rows = np.concatenate(rows)
+        distances = np.concatenate(distances)
+        if self.pq is not None and limit is not None and limit < len(rows):
+            nearest = np.argpartition(distances, limit - 1)[:limit]
+            rows, distances = rows[nearest], distances[nearest]
+        return rows, distances
+
+
+def recall_report(gallery, queries, k=1, nprobes=(1, 2, 4, 8, 16, 32, 64)):
+    """ Measures recall@k and latency of the gallery ANN index against exact search for every nprobe """
+    index = gallery.index
+    gallery.index = None
+    start = time.time()
+    exact = [[id_ for id_, _ in gallery.match(query, np.inf, k)] for query in queries]
+    exact_latency = (time.time() - start) / len(queries)
+    gallery.index = index
+    report = []
+    default_nprobe = index.nprobe
+    try:
+        for nprobe in nprobes:
+            if nprobe > index.nlist:
+                break
+            index.nprobe = nprobe
+            start = time.time()
+            approximate = [[id_ for id_, _ in gallery.match(query, np.inf, k)] for query in queries]
+            latency = (time.time() - start) / len(queries)
+            hits = sum(len(set(a) & set(e)) for a, e in zip(approximate, exact))
+            report.append({'nprobe': nprobe, 'recall': hits / float(sum(len(e) for e in exact)),
+                           'latency_ms': latency * 1000, 'exact_latency_ms': exact_latency * 1000})
+    finally:
+        index.nprobe = default_nprobe
+    return report
+
+
+def log_recall_report(report):
+    log.info('ANN recall vs latency (exact search {:.3f} ms per query):'
+             .format(report[0]['exact_latency_ms'] if report else 0))
+    log.info('  nprobe   recall   latency, ms   speedup')
+    for line in report:
+        log.info('  {:>6}   {:>6.3f}   {:>11.3f}   {:>7.1f}'.format(
+            line['nprobe'], line['recall'], line['latency_ms'],
+            line['exact_latency_ms'] / line['latency_ms'] if line['latency_ms'] else 0))
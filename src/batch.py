@@ -0,0 +1,227 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import json
+import time
+import logging
+import argparse
+import traceback
+
+from src.lazy import lazy_import
+from src.db import DataBase
+from src.face_recognition import FaceRecognition
+from src.detector import create_detector
+from src.enrollment import get_pool_context
+from src.utils import Utils, DefaultHelpParser
+from src.logger import init_logger, get_worker_records, init_worker_logger
+
+cv2 = lazy_import('cv2')
+
+log = logging.getLogger('fr3onn')
+
+IMAGE_PATTERN = r'^.*\.(jpg|jpeg|png|tiff|bmp)$'
+
+_face_recognition = None
+
+
+def _init_worker(gallery, tolerance, detection_scale, detection_grayscale, detector, records):
+    # the gallery and the detector are sent to every worker process once, models are loaded there
+    global _face_recognition
+    init_worker_logger(records)
+    _face_recognition = FaceRecognition(tolerance, detection_scale, detection_grayscale, gallery,
+                                        detector=detector)
+
+
+def _get_result(source, index, timestamp, frame):
+    result = {'source': source, 'frame': index, 'timestamp': timestamp}
+    if frame is None:
+        result['error'] = 'failed to read frame'
+        return result
+    details = _face_recognition.recognize_detailed(frame)
+    result['boxes'] = [list(box) for box in details['boxes']]
+    result['box'] = list(details['box']) if details['box'] is not None else None
+    result['match'] = details['match']
+    result['person'] = DataBase.get_formatted_person_name(details['match']) if details['match'] else None
+    result['best'] = details['best']
+    result['distance'] = details['distance']
+    return result
+
+
+def _process_chunk(task):
+    """ Processes a chunk of video frames or image files, runs in a worker process """
+    kind, source, items, step = task
+    results = []
+    if kind == 'images':
+        for index, image in items:
+            results.append(_get_result(image, index, None, cv2.imread(image)))
+        return results
+    start, stop = items
+    video = cv2.VideoCapture(source)
+    video.set(cv2.CAP_PROP_POS_FRAMES, start)
+    for index in range(start, stop):
+        ret, frame = video.read()
+        if not ret:
+            break
+        if (index - start) % step == 0:
+            results.append(_get_result(source, index, video.get(cv2.CAP_PROP_POS_MSEC) / 1000.0, frame))
+    video.release()
+    return results
+
+
+class BatchProcessor:
+    """ Recognizes faces on video files and image folders using a process pool, writes JSONL results """
+
+    def __init__(self, face_recognition, workers=None, step=1, chunk_size=64):
+        self.face_recognition = face_recognition
+        self.workers = workers or os.cpu_count() or 1
+        self.step = step
+        self.chunk_size = chunk_size
+        self.utils = Utils()
+
+    def get_tasks(self, inputs):
+        for source in inputs:
+            if os.path.isdir(source):
+                images = sorted(self.utils.get_files_from_folder_recursively(source, pattern=IMAGE_PATTERN))
+                images = list(enumerate(images))[::self.step]
+                for i in range(0, len(images), self.chunk_size):
+                    yield 'images', source, images[i:i + self.chunk_size], self.step
+            elif os.path.isfile(source) and os.path.splitext(source)[1].lower()[1:] in \
+                    ('jpg', 'jpeg', 'png', 'tiff', 'bmp'):
+                yield 'images', source, [(0, source)], self.step
+            else:
+                video = cv2.VideoCapture(source)
+                frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+                video.release()
+                if frames <= 0:
+                    log.warning('Unable to read {}, skipped.'.format(source))
+                    continue
+                # chunks are aligned to step, so every worker decodes only its own part of the video
+                chunk = self.chunk_size * self.step
+                for start in range(0, frames, chunk):
+                    yield 'video', source, (start, min(start + chunk, frames)), self.step
+
+    def run(self, inputs, output):
+        start = time.time()
+        summary = {'frames': 0, 'faces': 0, 'matches': 0, 'errors': 0}
+        # workers are not forked from this process: the logger listener thread runs here
+        pool = get_pool_context().Pool(self.workers, initializer=_init_worker,
+                                       initargs=(self.face_recognition.gallery, self.face_recognition.tolerance,
+                                                 self.face_recognition.detection_scale,
+                                                 self.face_recognition.detection_grayscale,
+                                                 self.face_recognition.detector, get_worker_records()))
+        try:
+            with open(output, 'w') as f:
+                # imap keeps the order of chunks, so results are written in input order
+                for results in pool.imap(_process_chunk, self.get_tasks(inputs)):
+                    for result in results:
+                        f.write(json.dumps(result) + '\n')
+                        summary['frames'] += 1
+                        summary['faces'] += 1 if result.get('box') else 0
+                        summary['matches'] += 1 if result.get('match') else 0
+                        summary['errors'] += 1 if 'error' in result else 0
+                    if summary['frames'] and summary['frames'] % (10 * self.chunk_size) < len(results):
+                        log.info('Processed {} frames ({:.1f} fps)'.format(
+                            summary['frames'], summary['frames'] / (time.time() - start)))
+        finally:
+            pool.close()
+            pool.join()
+        summary['elapsed'] = time.time() - start
+        summary['fps'] = summary['frames'] / summary['elapsed'] if summary['elapsed'] else 0.0
+        summary['workers'] = self.workers
+        return summary
+
+
+def create_parser():
+    parser = DefaultHelpParser(prog='fr3onn batch', description='Offline face recognition of video files '
+                                                                'and image folders',
+                               formatter_class=argparse.RawTextHelpFormatter, add_help=True)
+    parser.add_argument('inputs', metavar='INPUT', nargs='+', help='Video files, image files or image folders')
+    parser.add_argument('-o', '--output', metavar='OUTPUT', required=False, default='results.jsonl',
+                        help='Path to JSONL file with per-frame results, results.jsonl by default.\n'
+                             'Throughput summary is written to <OUTPUT>.summary.json')
+    parser.add_argument('-d', '--db_dir', metavar='DB_DIR', required=False, default=None,
+                        help='Path to database, <FR3ONN_DIR>/db by default')
+    parser.add_argument('--db_rescan', required=False, action='store_true',
+                        help='Compare database folder with the store: import images copied by hand,\n'
+                             'forget deleted ones and encode changed ones again. Not done on a normal start')
+    parser.add_argument('-w', '--workers', metavar='WORKERS', required=False, default=None, type=int,
+                        help='Number of processes, all cores by default')
+    parser.add_argument('--step', metavar='STEP', required=False, default=1, type=int,
+                        help='Process every STEP-th frame or image, 1 by default')
+    parser.add_argument('-s', '--detection_scale', metavar='DETECTION_SCALE', required=False, default=1.0,
+                        type=float, help='Scale of frame copy used for face detection, 1.0 by default')
+    parser.add_argument('-g', '--detection_grayscale', action='store_true',
+                        help='Detect faces on grayscale copy of frame')
+    parser.add_argument('--detector', metavar='DETECTOR', required=False, default='hog',
+                        help='Face detector: hog (by default), cnn, haar, lbp, dnn\n'
+                             'or two of them cascaded, e.g. haar+hog')
+    parser.add_argument('--cascade_model', metavar='CASCADE_MODEL', required=False, default=None,
+                        help='Path to cascade XML for haar and lbp detectors, OpenCV data by default')
+    parser.add_argument('--dnn_model', metavar='DNN_MODEL', required=False, default=None,
+                        help='Path to model of dnn detector')
+    parser.add_argument('--dnn_config', metavar='DNN_CONFIG', required=False, default=None,
+                        help='Path to config of dnn detector')
+    parser.add_argument('--dnn_confidence', metavar='DNN_CONFIDENCE', required=False, default=0.5, type=float,
+                        help='Minimal confidence of dnn detector, 0.5 by default')
+    return parser
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    utils = Utils()
+    log_folder = os.path.join(os.getcwd(), 'logs', utils.get_formatted_datetime())
+    init_logger(log_folder)
+    try:
+        log.info(utils.line_double)
+        log.info('Face Recognition with 3D imaging, OpenCV and Neural Nets: batch mode')
+        log.info(utils.line_double)
+        log.info('Log folder:  {}'.format(log_folder))
+        log.info('Output:      {}'.format(os.path.abspath(args.output)))
+        log.info(utils.line_double)
+        db = DataBase()
+        db.set_db_dir(args.db_dir)
+        if args.db_rescan:
+            db.rescan()
+        face_recognition = FaceRecognition(detection_scale=args.detection_scale,
+                                           detection_grayscale=args.detection_grayscale,
+                                           detector=create_detector(args.detector, args.cascade_model, args.dnn_model,
+                                                                    args.dnn_config, args.dnn_confidence))
+        face_recognition.detector.prepare()
+        face_recognition.initialize_face_encodings(db.get_all_persons(), db.get_encoding_cache(), args.workers)
+        summary = BatchProcessor(face_recognition, args.workers, args.step).run(args.inputs, args.output)
+        with open(args.output + '.summary.json', 'w') as f:
+            json.dump(summary, f, indent=2)
+        log.info(utils.line_double)
+        log.info('{frames} frames processed in {elapsed:.1f} s ({fps:.1f} fps) by {workers} workers: '
+                 '{faces} faces, {matches} matches, {errors} errors.'.format(**summary))
+        log.info(utils.line_double)
+    except KeyboardInterrupt:
+        log.error('PROGRAM WAS INTERRUPTED')
+        return -1
+    except Exception as ex:
+        log.error('Something goes wrong **FAILED**:\n{} '.format(ex))
+        log.error('Error: {}'.format(traceback.format_exc()))
+        return -2
+    return 0
@@ -22,21 +22,138 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
-import cv2
+import time
+import threading
+import collections
+
+from src.lazy import lazy_import
+from src.depth import RealSenseSource, create_depth_source, MISSING_DEPTH
+
+cv2 = lazy_import('cv2')
+
+# --camera value for Intel RealSense with aligned depth
+REALSENSE = 'realsense'
 
 
 class Camera:
-    def __init__(self, camera=0):
-        self.cam = cv2.VideoCapture(camera)
-        if not self.cam:
-            raise Exception("Camera {} is not accessible".format(camera))
+    def __init__(self, camera=0, threaded=False, buffer_size=2, depth=None, lazy=False):
+        self.camera = camera
+        self.depth_path = depth
+        self.cam = None
+        self.depth_source = None
+        self.threaded = threaded
+        self.depth = None
+        # ring buffer of (frame, timestamp, sequence number, depth), the newest frame is the last one
+        self.buffer = collections.deque(maxlen=buffer_size)
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.sequence = 0
+        self.last_sequence = 0
+        self.dropped_frames = 0
+        self.capture_fps = 0.0
+        # a lazy camera is opened by open(), e.g. concurrently with other startup steps
+        if not lazy:
+            self.open()
 
     def __del__(self):
-        self.cam.release()
+        self.stop()
+        if self.cam is not None:
+            self.cam.release()
+
+    def open(self):
+        if self.camera == REALSENSE:
+            self.cam = RealSenseSource()
+        else:
+            self.cam = cv2.VideoCapture(self.camera)
+            # recorded or synthetic depth read along with frames of the camera
+            self.depth_source = create_depth_source(self.depth_path)
+        if not self.cam:
+            raise Exception("Camera {} is not accessible".format(self.camera))
+        if self.threaded:
+            self.start()
 
     def get_obj(self):
         return self.cam
 
+    def has_depth(self):
+        return self.camera == REALSENSE or bool(self.depth_path)
+
+    def read(self):
+        """ Returns (ret, frame, depth), depth is None without depth source """
+        if isinstance(self.cam, RealSenseSource):
+            return self.cam.read()
+        ret, frame = self.cam.read()
+        depth = self.depth_source.read(frame.shape[:2]) if ret and self.depth_source is not None else None
+        return ret, frame, depth
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.capture, name='camera', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def capture(self):
+        last_time = None
+        while self.running:
+            ret, frame, depth = self.read()
+            now = time.time()
+            with self.condition:
+                if not ret:
+                    # end of video file or camera failure, consumers get None as with blocking read
+                    self.running = False
+                    self.buffer.append((None, now, self.sequence + 1, None))
+                else:
+                    self.buffer.append((frame, now, self.sequence + 1, depth))
+                self.sequence += 1
+                self.condition.notify_all()
+            if last_time is not None and now > last_time:
+                # exponential moving average of instant fps
+                self.capture_fps = 0.9 * self.capture_fps + 0.1 / (now - last_time) if self.capture_fps else \
+                    1.0 / (now - last_time)
+            last_time = now
+
+    def has_new_frame(self):
+        if not self.threaded:
+            return True
+        with self.condition:
+            return self.sequence > self.last_sequence or not self.running
+
+    def get_frame_info(self, timeout=1.0):
+        """ Returns (frame, timestamp, sequence number) of the freshest frame, its depth is in get_depth() """
+        if not self.threaded:
+            _, frame, self.depth = self.read()
+            self.sequence += 1
+            self.last_sequence = self.sequence
+            return frame, time.time(), self.sequence
+        with self.condition:
+            # wait for a frame which was not returned yet
+            self.condition.wait_for(lambda: self.sequence > self.last_sequence or not self.running, timeout)
+            if not self.buffer:
+                self.depth = None
+                return None, time.time(), self.last_sequence
+            frame, timestamp, sequence, self.depth = self.buffer[-1]
+            if sequence > self.last_sequence:
+                self.dropped_frames += sequence - self.last_sequence - 1
+                self.last_sequence = sequence
+            return frame, timestamp, sequence
+
     def get_frame(self):
-        _, frame = self.cam.read()
+        frame, _, _ = self.get_frame_info()
         return frame
+
+    def get_depth(self):
+        """ Depth in meters aligned to the last returned frame, None without depth source """
+        if self.depth is None and self.has_depth():
+            return MISSING_DEPTH
+        return self.depth
+
+    def get_stats(self):
+        return {'captured': self.sequence, 'dropped': self.dropped_frames, 'fps': self.capture_fps}
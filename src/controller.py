@@ -0,0 +1,170 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import heapq
+import logging
+import threading
+
+log = logging.getLogger('fr3onn')
+
+
+class OutputPin:
+    """ GPIO output which is written only when its value changes """
+
+    def __init__(self, gpio, pin):
+        self.pin = pin
+        self.gpio_pin = gpio.Gpio(pin)
+        self.gpio_pin.dir(gpio.DIR_OUT)
+        self.value = None
+        self.pulse_end = 0.0
+        self.lock = threading.Lock()
+
+    def write(self, value):
+        with self.lock:
+            if value != self.value:
+                self.gpio_pin.write(value)
+                self.value = value
+
+
+class InputPin:
+    """ GPIO input with value cached from edge interrupts (or polling), on_press is called on falling edge """
+
+    def __init__(self, gpio, pin, on_press=None, debounce=0.2):
+        self.pin = pin
+        self.gpio_pin = gpio.Gpio(pin)
+        self.gpio_pin.dir(gpio.DIR_IN)
+        self.on_press = on_press
+        self.debounce = debounce
+        self.last_press = 0.0
+        self.value = self.gpio_pin.read()
+
+    def read(self):
+        return self.value
+
+    def update(self, *args):
+        value = self.gpio_pin.read()
+        if value == self.value:
+            return
+        self.value = value
+        # buttons and sensors are active low
+        if not value and self.on_press is not None and time.time() - self.last_press >= self.debounce:
+            self.last_press = time.time()
+            self.on_press()
+
+
+class GpioController:
+    """ Drives GPIO outputs from its own timer thread and delivers input changes via interrupts
+
+    Lock pulses do not block the caller. Inputs use edge interrupts of the backend (mraa ISR);
+    if a pin does not support them, it is polled by the controller thread every poll_interval.
+    """
+
+    def __init__(self, gpio, poll_interval=0.02):
+        self.gpio = gpio
+        self.poll_interval = poll_interval
+        self.events = []
+        self.event_counter = 0
+        self.polled = []
+        self.pulsed = set()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+
+    def output(self, pin):
+        return OutputPin(self.gpio, pin)
+
+    def input(self, pin, on_press=None):
+        input_pin = InputPin(self.gpio, pin, on_press)
+        try:
+            input_pin.gpio_pin.isr(self.gpio.EDGE_BOTH, input_pin.update, None)
+        except Exception as ex:
+            log.warning('Interrupts are not available on GPIO {} ({}), it will be polled.'.format(pin, ex))
+            with self.condition:
+                self.polled.append(input_pin)
+                # the running thread may wait without timeout, it starts polling now
+                self.condition.notify()
+        return input_pin
+
+    def schedule(self, delay, func):
+        with self.condition:
+            # counter keeps heap order stable for events with the same time
+            heapq.heappush(self.events, (time.time() + delay, self.event_counter, func))
+            self.event_counter += 1
+            self.condition.notify()
+
+    def pulse(self, output_pin, duration=1.0):
+        """ Sets output to 1 for duration seconds, a pulse during another one extends it """
+        with output_pin.lock:
+            output_pin.pulse_end = max(output_pin.pulse_end, time.time() + duration)
+        output_pin.write(1)
+        self.pulsed.add(output_pin)
+        self.schedule(duration, lambda: self.end_pulse(output_pin))
+
+    @staticmethod
+    def end_pulse(output_pin):
+        with output_pin.lock:
+            if time.time() < output_pin.pulse_end:
+                return
+        output_pin.write(0)
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='gpio', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.events = []
+        # do not leave the lock open
+        for output_pin in self.pulsed:
+            with output_pin.lock:
+                output_pin.pulse_end = 0.0
+            output_pin.write(0)
+
+    def run(self):
+        while True:
+            with self.condition:
+                if not self.running:
+                    return
+                timeout = self.poll_interval if self.polled else None
+                if self.events:
+                    delay = max(self.events[0][0] - time.time(), 0)
+                    timeout = delay if timeout is None else min(timeout, delay)
+                self.condition.wait(timeout)
+                due = []
+                while self.events and self.events[0][0] <= time.time():
+                    due.append(heapq.heappop(self.events)[2])
+                polled = list(self.polled)
+            for func in due:
+                func()
+            for input_pin in polled:
+                input_pin.update()
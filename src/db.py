@@ -25,9 +25,13 @@
 import os
 import uuid
 import logging
-import cv2
 
+from src.lazy import lazy_import
 from src.utils import Utils
+from src.person_store import PersonStore
+from src.templates import get_template_person
+
+cv2 = lazy_import('cv2')
 
 log = logging.getLogger('fr3onn')
 
@@ -37,30 +41,46 @@ class DataBase:
         self.name = None
         self.working_dir = os.getcwd()
         self.db_dir = os.path.join(self.working_dir, 'db')
+        self.store = None
         self.utils = Utils()
 
     def add_person(self, name, frame):
+        file_name = None
         try:
             log.info("Adding {} to database...".format(name))
             file_name = os.path.join(self.db_dir, '{0}-{1}.jpg'.format(name, str(uuid.uuid4())))
-            cv2.imwrite(file_name, frame)
+            if not cv2.imwrite(file_name, frame):
+                raise Exception('unable to write {}'.format(file_name))
+            self.store.add_image(name, file_name)
             log.info("{0} was added to database to {1} file.".format(name, file_name))
             return file_name
         except Exception as ex:
             log.error("Failed to add person to database: {}".format(ex))
+            # image without a record in the store would be imported under a parsed name by the next rescan
+            if file_name is not None and os.path.isfile(file_name):
+                os.remove(file_name)
 
     @staticmethod
     def get_formatted_person_name(file_path):
-        return file_path.split('/')[-1].split('-')[0]
+        # used where the store is not available (e.g. batch workers)
+        name = get_template_person(file_path)
+        return name if name is not None else PersonStore.parse_person_name(file_path)
+
+    def get_person_name(self, file_path):
+        """ Person name of an image path or a template id """
+        name = get_template_person(file_path)
+        if name is None and self.store is not None:
+            name = self.store.get_person_name(file_path)
+        return name if name is not None else self.get_formatted_person_name(file_path)
 
     def remove_person(self, name):
-        log.info("Removing all {}-* images from database...".format(name))
-        files = self.utils.get_files_from_folder_recursively(self.get_db_dir(), pattern='^{}-.*$'.format(name))
+        log.info("Removing person {} from database...".format(name))
+        files = self.store.remove_person(name)
         if files:
             for file in files:
                 if os.path.isfile(file):
                     os.remove(file)
-                log.info("Person with name {} was successfully removed from database.".format(name))
+            log.info("Person with name {} was successfully removed from database.".format(name))
         else:
             log.warning("Person with name {} is not in database. Nothing to remove.".format(name))
 
@@ -75,9 +95,18 @@ class DataBase:
                 log.info("Using database from {} folder.".format(self.db_dir))
         except Exception as ex:
             raise Exception('Unable to initialize database folder: {}'.format(ex))
+        self.store = PersonStore(self.db_dir)
+
+    def rescan(self):
+        """ Compares the folder with the store (--db_rescan): imports new, forgets deleted and rehashes all images """
+        return self.store.import_folder(rehash=True)
 
     def get_db_dir(self):
         return self.db_dir
 
+    def get_encoding_cache(self):
+        # encodings are kept in the person store
+        return self.store
+
     def get_all_persons(self):
-        return self.utils.get_files_from_folder_recursively(self.db_dir, pattern=r'^.*\.(jpg|png|tiff|bmp)$')
+        return self.store.get_images()
@@ -0,0 +1,142 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import logging
+import numpy as np
+
+try:
+    import pyrealsense2 as rs
+except ImportError:
+    rs = None
+
+from src.lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+
+log = logging.getLogger('fr3onn')
+
+SYNTHETIC = 'synthetic'
+SYNTHETIC_FLAT = 'synthetic_flat'
+
+# depth of a frame of a camera with depth which has none for it, e.g. recorded depth is over:
+# unlike None (a camera without depth) it fails the liveness check
+MISSING_DEPTH = np.zeros((0, 0), dtype=np.float32)
+
+
+class RealSenseSource:
+    """ Colour frames from Intel RealSense camera with depth (in meters) aligned to them
+
+    Has read() and release() of cv2.VideoCapture, read() returns (ret, frame, depth).
+    """
+
+    def __init__(self, width=640, height=480, fps=30):
+        if rs is None:
+            raise Exception('pyrealsense2 is not installed')
+        self.pipeline = rs.pipeline()
+        config = rs.config()
+        config.enable_stream(rs.stream.color, width, height, rs.format.bgr8, fps)
+        config.enable_stream(rs.stream.depth, width, height, rs.format.z16, fps)
+        profile = self.pipeline.start(config)
+        self.depth_scale = profile.get_device().first_depth_sensor().get_depth_scale()
+        # depth pixels are mapped to colour pixels, so a face box is valid for both
+        self.align = rs.align(rs.stream.color)
+
+    def read(self):
+        try:
+            frames = self.align.process(self.pipeline.wait_for_frames())
+        except RuntimeError:
+            return False, None, None
+        color = frames.get_color_frame()
+        depth = frames.get_depth_frame()
+        if not color or not depth:
+            return False, None, None
+        return True, np.asanyarray(color.get_data()).copy(), \
+            np.asanyarray(depth.get_data()).astype(np.float32) * self.depth_scale
+
+    def release(self):
+        self.pipeline.stop()
+
+
+class RecordedDepth:
+    """ Depth frames recorded along with a video: .npy array (frames x height x width) or a folder of 16-bit PNGs
+
+    Values are converted to meters with scale (millimeters by default).
+    """
+
+    def __init__(self, path, scale=0.001):
+        self.scale = scale
+        self.index = 0
+        if os.path.isdir(path):
+            self.files = sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith('.png'))
+            self.frames = None
+        else:
+            self.files = None
+            self.frames = np.load(path, mmap_mode='r')
+
+    def read(self, shape):
+        if self.frames is not None:
+            if self.index >= len(self.frames):
+                return None
+            depth = self.frames[self.index]
+        else:
+            if self.index >= len(self.files):
+                return None
+            depth = cv2.imread(self.files[self.index], cv2.IMREAD_ANYDEPTH)
+        self.index += 1
+        return depth.astype(np.float32) * self.scale
+
+
+class SyntheticDepth:
+    """ Depth for testing without a depth camera: a face-like relief or a flat tilted plane (a photo) """
+
+    def __init__(self, flat=False, distance=0.6, relief=0.04, tilt=0.1):
+        self.flat = flat
+        self.distance = distance
+        self.relief = relief
+        self.tilt = tilt
+        self.depth = None
+
+    def read(self, shape):
+        if self.depth is None or self.depth.shape != tuple(shape):
+            y, x = np.mgrid[-1:1:shape[0] * 1j, -1:1:shape[1] * 1j].astype(np.float32)
+            if self.flat:
+                self.depth = self.distance + self.tilt * x
+            else:
+                # the centre is the closest point, like a nose; repeats every quarter of the frame
+                # so any face box contains curved relief
+                self.depth = self.distance + self.relief * (np.sin(4 * np.pi * x) ** 2 + np.sin(4 * np.pi * y) ** 2)
+            self.depth = self.depth.astype(np.float32)
+        return self.depth
+
+
+def create_depth_source(depth):
+    """ depth is a path to recorded depth, 'synthetic' or 'synthetic_flat' """
+    if not depth:
+        return None
+    if depth in (SYNTHETIC, SYNTHETIC_FLAT):
+        return SyntheticDepth(flat=depth == SYNTHETIC_FLAT)
+    if not os.path.exists(depth):
+        raise Exception('Depth source {} does not exist'.format(depth))
+    return RecordedDepth(depth)
@@ -0,0 +1,279 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import time
+import logging
+import threading
+
+from src.lazy import lazy_import, load
+from src.tracker import iou
+
+cv2 = lazy_import('cv2')
+face_recognition = lazy_import('face_recognition')
+
+log = logging.getLogger('fr3onn')
+
+HOG = 'hog'
+CNN = 'cnn'
+HAAR = 'haar'
+LBP = 'lbp'
+DNN = 'dnn'
+DETECTORS = (HOG, CNN, HAAR, LBP, DNN)
+CASCADE_FILES = {HAAR: 'haarcascade_frontalface_default.xml', LBP: 'lbpcascade_frontalface_improved.xml'}
+
+
+class Detector:
+    """ Finds (top, right, bottom, left) boxes of faces on an image
+
+    The model is loaded on first use and is not pickled, so detectors can be sent to worker processes.
+    """
+
+    name = None
+
+    def __init__(self):
+        self.model = None
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.faces = 0
+        self.time = 0.0
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['model'] = None
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def load(self):
+        return None
+
+    def get_model(self):
+        if self.model is None:
+            with self.lock:
+                if self.model is None:
+                    self.model = self.load()
+        return self.model
+
+    def prepare(self):
+        """ Loads the model at once, so a missing model file is reported before the first frame """
+        self.get_model()
+
+    def find(self, image):
+        raise NotImplementedError()
+
+    def detect(self, image):
+        start = time.time()
+        boxes = self.find(image)
+        self.time += time.time() - start
+        self.frames += 1
+        self.faces += len(boxes)
+        return boxes
+
+    def get_stats(self):
+        return {'name': self.name, 'frames': self.frames, 'faces': self.faces,
+                'time_ms': self.time / self.frames * 1000 if self.frames else 0.0}
+
+    def log_stats(self):
+        log.info('  Detector {name}: {faces} faces on {frames} frames, {time_ms:.2f} ms per frame.'
+                 .format(**self.get_stats()))
+
+
+class DlibDetector(Detector):
+    """ HOG or CNN (MMOD) face detector of dlib, upsample finds smaller faces at higher cost """
+
+    def __init__(self, model=HOG, upsample=1):
+        Detector.__init__(self)
+        self.name = model
+        self.upsample = upsample
+
+    def load(self):
+        # dlib models are loaded by import of face_recognition
+        return load(face_recognition)
+
+    def find(self, image):
+        return face_recognition.face_locations(image, self.upsample, self.name)
+
+
+class CascadeDetector(Detector):
+    """ Haar or LBP cascade of OpenCV, the fastest and the least accurate one """
+
+    def __init__(self, kind=HAAR, path=None, scale_factor=1.1, min_neighbors=5, min_size=30):
+        Detector.__init__(self)
+        self.name = kind
+        self.path = path
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+
+    def get_path(self):
+        if self.path:
+            return self.path
+        # cascades shipped with OpenCV: data/haarcascades and data/lbpcascades next to each other
+        data = getattr(getattr(cv2, 'data', None), 'haarcascades', None)
+        if data:
+            for folder in (data, os.path.join(os.path.dirname(os.path.normpath(data)), 'lbpcascades')):
+                path = os.path.join(folder, CASCADE_FILES[self.name])
+                if os.path.isfile(path):
+                    return path
+        raise Exception('Cascade {} was not found in OpenCV data, set path to it with --cascade_model'
+                        .format(CASCADE_FILES[self.name]))
+
+    def load(self):
+        if not hasattr(cv2, 'CascadeClassifier'):
+            raise Exception('OpenCV {} has no cascade classifiers'.format(cv2.__version__))
+        path = self.get_path()
+        model = cv2.CascadeClassifier(path)
+        if model.empty():
+            raise Exception('Failed to load cascade {}'.format(path))
+        return model
+
+    def find(self, image):
+        model = self.get_model()
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        rects = model.detectMultiScale(cv2.equalizeHist(gray), scaleFactor=self.scale_factor,
+                                       minNeighbors=self.min_neighbors, minSize=(self.min_size, self.min_size))
+        return [(int(y), int(x + w), int(y + h), int(x)) for x, y, w, h in rects]
+
+
+class DnnDetector(Detector):
+    """ SSD face detector of OpenCV DNN module, e.g. res10_300x300_ssd Caffe or TensorFlow model """
+
+    def __init__(self, model, config=None, confidence=0.5, size=300, mean=(104.0, 177.0, 123.0)):
+        Detector.__init__(self)
+        self.name = DNN
+        self.model_path = model
+        self.config_path = config
+        self.confidence = confidence
+        self.size = size
+        self.mean = mean
+
+    def load(self):
+        if not self.model_path:
+            raise Exception('DNN face detector needs a model file, set it with --dnn_model')
+        try:
+            return cv2.dnn.readNet(self.model_path, self.config_path or '')
+        except Exception as ex:
+            raise Exception('Failed to load DNN model {}: {}'.format(self.model_path, ex))
+
+    def find(self, image):
+        model = self.get_model()
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        img_h, img_w = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.resize(image, (self.size, self.size)), 1.0, (self.size, self.size),
+                                     self.mean)
+        # a network keeps its input between calls, so it is not shared by threads
+        with self.lock:
+            model.setInput(blob)
+            detections = model.forward()
+        boxes = []
+        for detection in detections.reshape(-1, 7):
+            if detection[2] < self.confidence:
+                continue
+            left, top = max(int(detection[3] * img_w), 0), max(int(detection[4] * img_h), 0)
+            right, bottom = min(int(detection[5] * img_w), img_w), min(int(detection[6] * img_h), img_h)
+            if right > left and bottom > top:
+                boxes.append((top, right, bottom, left))
+        return boxes
+
+
+class CascadedDetector(Detector):
+    """ A cheap detector proposes regions, only they are checked by an accurate one
+
+    Regions are extended by margin and upscaled to min_size, so the accurate detector finds faces
+    which are smaller than its window on the original frame.
+    """
+
+    def __init__(self, proposer, verifier, margin=0.3, min_size=96):
+        Detector.__init__(self)
+        self.name = '{}+{}'.format(proposer.name, verifier.name)
+        self.proposer = proposer
+        self.verifier = verifier
+        self.margin = margin
+        self.min_size = min_size
+        self.proposals = 0
+        self.verified = 0
+
+    def prepare(self):
+        self.proposer.prepare()
+        self.verifier.prepare()
+
+    def find(self, image):
+        img_h, img_w = image.shape[:2]
+        boxes = []
+        for top, right, bottom, left in self.proposer.detect(image):
+            self.proposals += 1
+            margin_y, margin_x = int((bottom - top) * self.margin), int((right - left) * self.margin)
+            top, bottom = max(top - margin_y, 0), min(bottom + margin_y, img_h)
+            left, right = max(left - margin_x, 0), min(right + margin_x, img_w)
+            region = image[top:bottom, left:right]
+            if not region.size:
+                continue
+            scale = max(1.0, self.min_size / float(min(region.shape[:2])))
+            if scale > 1.0:
+                region = cv2.resize(region, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+            found = self.verifier.detect(region)
+            self.verified += 1 if found else 0
+            for box_top, box_right, box_bottom, box_left in found:
+                box = (top + int(box_top / scale), min(left + int(box_right / scale), right),
+                       min(top + int(box_bottom / scale), bottom), left + int(box_left / scale))
+                # overlapping proposals find the same face
+                if all(iou(box, other) < 0.5 for other in boxes):
+                    boxes.append(box)
+        return boxes
+
+    def get_stats(self):
+        stats = Detector.get_stats(self)
+        stats.update({'proposer': self.proposer.name, 'verifier': self.verifier.name,
+                      'proposals': self.proposals, 'rejected': self.proposals - self.verified})
+        return stats
+
+    def log_stats(self):
+        log.info('  Detector {name}: {faces} faces on {frames} frames, {time_ms:.2f} ms per frame, '
+                 '{proposals} regions proposed by {proposer}, {rejected} rejected by {verifier}.'
+                 .format(**self.get_stats()))
+
+
+def create_detector(name=HOG, cascade_model=None, dnn_model=None, dnn_config=None, dnn_confidence=0.5):
+    """ Creates a detector by name, "proposer+verifier" for a cascaded one, e.g. "haar+hog" """
+    if '+' in name:
+        proposer, verifier = name.split('+', 1)
+        return CascadedDetector(create_detector(proposer, cascade_model, dnn_model, dnn_config, dnn_confidence),
+                                create_detector(verifier, cascade_model, dnn_model, dnn_config, dnn_confidence))
+    if name in (HOG, CNN):
+        return DlibDetector(name)
+    if name in (HAAR, LBP):
+        return CascadeDetector(name, cascade_model)
+    if name == DNN:
+        return DnnDetector(dnn_model, dnn_config, dnn_confidence)
+    raise Exception('Unknown face detector: {}'.format(name))
+
+
+def is_valid_detector(name):
+    parts = name.split('+')
+    return len(parts) <= 2 and all(part in DETECTORS for part in parts)
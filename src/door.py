@@ -0,0 +1,87 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import logging
+
+from src import metrics
+from src.scheduler import FrameScheduler
+
+log = logging.getLogger('fr3onn')
+
+
+class Door:
+    """ Entrance served by one camera with its own lock, green light and door sensor """
+
+    def __init__(self, name, camera, face_recognition, controller, lock_pin, green_light_pin, is_door_opened_pin,
+                 motion_detector=None, lock_time=1.0, frame_scheduler=None):
+        self.name = name
+        self.camera = camera
+        self.face_recognition = face_recognition
+        self.controller = controller
+        self.lock_pin = lock_pin
+        self.green_light_pin = green_light_pin
+        self.is_door_opened_pin = is_door_opened_pin
+        self.lock_time = lock_time
+        self.lock = None
+        self.green_light = None
+        self.is_door_opened = None
+        self.motion_detector = motion_detector
+        self.frame_scheduler = frame_scheduler if frame_scheduler is not None else FrameScheduler(name)
+        self.frames = 0
+        self.processed = 0
+        self.busy_time = 0.0
+        self.latency = 0.0
+        self.start_time = time.time()
+
+    def setup(self):
+        self.lock = self.controller.output(self.lock_pin)
+        self.green_light = self.controller.output(self.green_light_pin)
+        self.is_door_opened = self.controller.input(self.is_door_opened_pin)
+
+    def open_lock(self):
+        # the controller thread closes the lock, recognition goes on meanwhile
+        metrics.registry.inc('lock_pulses')
+        self.controller.pulse(self.lock, self.lock_time)
+
+    def green_light_on(self):
+        self.green_light.write(1)
+
+    def green_light_off(self):
+        self.green_light.write(0)
+
+    def add_processed(self, latency):
+        metrics.registry.inc('frames_processed')
+        self.processed += 1
+        self.busy_time += latency
+        self.latency = 0.9 * self.latency + 0.1 * latency if self.latency else latency
+
+    def get_stats(self):
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        return {'name': self.name, 'frames': self.frames, 'processed': self.processed,
+                'fps': self.processed / elapsed, 'latency_ms': self.latency * 1000}
+
+    def log_stats(self):
+        log.info('Door {name}: {frames} frames, {processed} processed, {fps:.1f} fps, latency {latency_ms:.1f} ms.'
+                 .format(**self.get_stats()))
@@ -0,0 +1,126 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import time
+import logging
+import multiprocessing
+
+from src.lazy import lazy_import
+from src.logger import get_worker_records, init_worker_logger
+
+cv2 = lazy_import('cv2')
+face_recognition = lazy_import('face_recognition')
+
+log = logging.getLogger('fr3onn')
+
+
+def encode_image(image):
+    face = face_recognition.load_image_file(image)
+    encodings = face_recognition.face_encodings(face)
+    return encodings[0] if encodings else None
+
+
+def _encode_indexed_image(args):
+    # runs in a worker process: errors are returned, not raised, so one bad file does not abort the pool
+    i, image = args
+    try:
+        return i, encode_image(image), None
+    except Exception as ex:
+        return i, None, str(ex)
+
+
+def get_pool_context():
+    """ Start method of encoding workers
+
+    The gallery is loaded in background while cameras and GPIO are served by other threads, a forked
+    worker could inherit a lock held by one of them. Workers are forked by a single-threaded forkserver
+    instead, it imports face_recognition once, so dlib models are still shared by the workers.
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(['face_recognition'])
+    return context
+
+
+def encode_images(images, workers=None):
+    """ Encodes images across a process pool
+
+    Returns a list of (encoding, error) tuples in the same order as images.
+    encoding is None if there is no face on the image or it failed to load.
+    """
+    results = [(None, None)] * len(images)
+    if not images:
+        return results
+    workers = min(workers or os.cpu_count() or 1, len(images))
+    log.info('Encoding {} images using {} worker(s)...'.format(len(images), workers))
+    start = time.time()
+    step = max(1, len(images) // 10)
+    tasks = enumerate(images)
+    if workers == 1:
+        outputs = map(_encode_indexed_image, tasks)
+        pool = None
+    else:
+        pool = get_pool_context().Pool(workers, initializer=init_worker_logger, initargs=(get_worker_records(),))
+        outputs = pool.imap_unordered(_encode_indexed_image, tasks, chunksize=max(1, len(images) // (workers * 8)))
+    try:
+        for done, (i, encoding, error) in enumerate(outputs, 1):
+            results[i] = (encoding, error)
+            if error is not None:
+                log.warning('Failed to encode {}: {}'.format(images[i], error))
+            if done % step == 0 or done == len(images):
+                log.info('Encoded {}/{} images ({:.1f} s)'.format(done, len(images), time.time() - start))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return results
+
+
+def get_sharpness(image):
+    """ Variance of Laplacian, low for blurred images """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    return cv2.Laplacian(gray, cv2.CV_64F).var()
+
+
+def select_enrollment_frames(recognizer, frames, min_face_size=80, min_sharpness=50.0):
+    """ Keeps frames with exactly one face which is large and sharp enough, the sharpest first
+
+    recognizer is a FaceRecognition instance used for detection.
+    """
+    selected = []
+    for frame in frames:
+        face_locations = recognizer.detect(frame)
+        if len(face_locations) != 1:
+            continue
+        top, right, bottom, left = face_locations[0]
+        if min(bottom - top, right - left) < min_face_size:
+            continue
+        sharpness = get_sharpness(recognizer.crop(frame, face_locations[0]))
+        if sharpness < min_sharpness:
+            continue
+        selected.append((sharpness, frame))
+    selected.sort(key=lambda item: -item[0])
+    return [frame for _, frame in selected]
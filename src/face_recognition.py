@@ -22,104 +22,391 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import time
 import logging
-import face_recognition
-# TODO: import RealSense here
+import numpy as np
+
+from src.lazy import lazy_import, load
+from src.enrollment import encode_image, encode_images
+from src.gallery import Gallery, storage_report, log_storage_report
+from src.ann import IVFIndex, recall_report, log_recall_report
+from src.tracker import FaceTracker
+from src.templates import PersonTemplates
+from src.detector import DlibDetector
+from src.recent import RecentIdentities
+from src import metrics
+
+cv2 = lazy_import('cv2')
+face_recognition = lazy_import('face_recognition')
 
 log = logging.getLogger('fr3onn')
 
 
 class FaceRecognition:
-    def __init__(self):
-        self.face_encodings = []
-        self.face_file_names = []
+    def __init__(self, tolerance=0.6, detection_scale=1.0, detection_grayscale=False, gallery=None,
+                 gallery_storage='float32', detector=None):
+        # gallery can be shared by several instances, e.g. one per camera
+        self.gallery = gallery if gallery is not None else Gallery(storage=gallery_storage)
+        self.tolerance = tolerance
+        self.detection_scale = detection_scale
+        self.detection_grayscale = detection_grayscale
+        # dlib HOG detector by default, see src.detector for others
+        self.detector = detector if detector is not None else DlibDetector()
+        self.tracker = None
+        self.encoding_cache = None
+        self.templates = None
+        # whether the last recognized frame had a face, used by frame scheduling
+        self.face_present = False
+        self.liveness = None
+        self.recent = None
+
+    def get_encoding(self, image):
+        if self.encoding_cache is None:
+            return encode_image(image)
+        found, encoding = self.encoding_cache.get(image)
+        if not found:
+            encoding = encode_image(image)
+            self.encoding_cache.put(image, encoding)
+        return encoding
+
+    def get_encodings(self, images, workers=None, trusted=False):
+        """ Encodings of images from the cache or encoded in a process pool
+
+        Cached encodings of changed files are refreshed, unless the cache is trusted, e.g. at start:
+        then they are all read at once without checking the files.
+        """
+        encodings = [None] * len(images)
+        missed = []
+        if self.encoding_cache is None:
+            cached = [(False, None)] * len(images)
+        elif trusted:
+            cached = self.encoding_cache.get_many(images)
+        else:
+            cached = [self.encoding_cache.get(image) for image in images]
+        for i, (found, encoding) in enumerate(cached):
+            encodings[i] = encoding
+            if not found:
+                missed.append(i)
+        if self.encoding_cache is not None:
+            log.info('{} of {} encodings were taken from cache.'.format(len(images) - len(missed), len(images)))
+        results = encode_images([images[i] for i in missed], workers)
+        for i, (encoding, error) in zip(missed, results):
+            if error is not None:
+                # do not cache failures, the file will be retried on the next start
+                continue
+            encodings[i] = encoding
+            if self.encoding_cache is not None:
+                self.encoding_cache.put(images[i], encoding)
+        return encodings
 
-    def initialize_face_encodings(self, images):
+    def initialize_face_encodings(self, images, encoding_cache=None, workers=None):
         log.info('Initialize encodings of known faces from database...')
         try:
             # clean previous face encodings and file names
-            self.face_encodings = []
-            self.face_file_names = []
-            for image in images:
-                face = face_recognition.load_image_file(image)
-                if face_recognition.face_encodings(face):
-                    self.face_encodings.append(face_recognition.face_encodings(face)[0])
-                self.face_file_names.append(image)
+            self.gallery.clear()
+            if self.templates is not None:
+                self.templates.clear()
+            self.encoding_cache = encoding_cache
+            if self.encoding_cache is not None:
+                self.encoding_cache.prune(images)
+            encodings = self.get_encodings(images, workers, trusted=True)
+            self.update_gallery(self.gallery, images, encodings)
+            self.gallery.build_index()
+            if self.encoding_cache is not None:
+                self.encoding_cache.save()
         except Exception as ex:
             raise Exception('Failed to initialize encodings: {}'.format(ex))
-        log.info('Initialization finished successfully. {} faces were processed.'.format(len(images)))
+        if self.templates is not None:
+            log.info('Initialization finished successfully. {} faces were processed, {} templates of {} persons '
+                     'are used for matching.'.format(len(images), len(self.gallery), len(self.templates)))
+        else:
+            log.info('Initialization finished successfully. {} faces were processed, {} of them have encodings.'
+                     .format(len(images), len(self.gallery)))
+
+    def set_templates(self, medoids, get_person_name):
+        """ Matches against per-person templates (centroid and medoids) instead of every image """
+        self.templates = PersonTemplates(get_person_name, medoids)
+
+    def update_gallery(self, gallery, added, encodings, removed=()):
+        """ Puts encodings of added images to gallery and evicts removed ones """
+        if self.templates is None:
+            for image in list(removed) + list(added):
+                gallery.remove(image)
+            # images without a face are not added, so ids always stay aligned with encodings
+            gallery.extend([image for image, encoding in zip(added, encodings) if encoding is not None],
+                           [encoding for encoding in encodings if encoding is not None])
+            return
+        names = set(self.templates.remove(image) for image in removed)
+        for image, encoding in zip(added, encodings):
+            if encoding is not None:
+                names |= self.templates.add(image, encoding)
+            else:
+                names.add(self.templates.remove(image))
+        names.discard(None)
+        self.templates.update_gallery(gallery, sorted(names))
 
     def add_new_face_encoding(self, image):
+        self.add_new_face_encodings([image])
+
+    def add_new_face_encodings(self, images, sharing=()):
+        """ Adds images to a copy of the gallery and publishes it to this instance and those sharing the gallery """
         log.info('Create encoding for new face...')
         try:
-            face = face_recognition.load_image_file(image)
-            if face_recognition.face_encodings(face):
-                self.face_encodings.append(face_recognition.face_encodings(face)[0])
-            self.face_file_names.append(image)
+            encodings = [self.get_encoding(image) for image in images]
+            for image, encoding in zip(images, encodings):
+                if encoding is None:
+                    log.warning('No face was found on {}.'.format(image))
+            self.publish_gallery(images, encodings, (), sharing)
+            if self.encoding_cache is not None:
+                self.encoding_cache.save()
         except Exception as ex:
             raise Exception('Failed to create encoding: {}'.format(ex))
         log.info('Creating finished successfully.')
 
+    def remove_face_encoding(self, image, sharing=()):
+        self.publish_gallery([], [], [image], sharing)
+        if self.encoding_cache is not None:
+            self.encoding_cache.remove(image)
+            self.encoding_cache.save()
+
+    def publish_gallery(self, added, encodings, removed, sharing=()):
+        """ Copy on write: the gallery in use is never modified, recognition keeps using it until the swap """
+        gallery = self.gallery.copy()
+        self.update_gallery(gallery, added, encodings, removed)
+        if gallery.index is not None and not gallery.index.is_trained():
+            gallery.build_index()
+        for instance in [self] + [instance for instance in sharing if instance is not self]:
+            instance.set_gallery(gallery)
+
+    def set_gallery(self, gallery):
+        """ Replaces the gallery at once, calls in progress finish with the previous one """
+        self.gallery = gallery
+
+    def set_ann_index(self, nlist, nprobe=8, pq_m=0):
+        self.gallery.set_index(IVFIndex(nlist, nprobe, pq_m) if nlist else None)
+
+    def log_ann_report(self, queries=200, noise=0.02):
+        if self.gallery.index is None or not self.gallery.index.is_trained():
+            log.warning('ANN index is not built, nothing to report.')
+            return
+        # queries are known encodings slightly shifted, as a stranger's face of a known person would be
+        encodings = self.gallery.get_encodings()
+        rng = np.random.RandomState(0)
+        queries = encodings[rng.choice(len(encodings), min(queries, len(encodings)), replace=False)]
+        queries = queries + rng.normal(scale=noise, size=queries.shape).astype(queries.dtype)
+        log_recall_report(recall_report(self.gallery, queries))
+
+    def log_storage_report(self, images, queries=200, noise=0.02):
+        """ Compares gallery storages on the original float64 encodings of images """
+        encodings = [encoding for encoding in self.get_encodings(images, trusted=True) if encoding is not None]
+        if not encodings:
+            log.warning('No encodings in database, nothing to report.')
+            return
+        encodings = np.array(encodings)
+        rng = np.random.RandomState(0)
+        queries = encodings[rng.choice(len(encodings), min(queries, len(encodings)), replace=False)]
+        queries = queries + rng.normal(scale=noise, size=queries.shape)
+        log_storage_report(storage_report(encodings, queries, self.tolerance))
+
+    def get_detection_copy(self):
+        """ Instance with the detector and the liveness check only, small and picklable for worker processes """
+        face_recognition = FaceRecognition(self.tolerance, self.detection_scale, self.detection_grayscale,
+                                           detector=self.detector)
+        face_recognition.liveness = self.liveness
+        return face_recognition
+
+    def set_liveness(self, liveness):
+        """ Checks depth of the selected face before encoding it, e.g. with DepthLiveness """
+        self.liveness = liveness
+
+    def is_live(self, frame, depth, face_location):
+        """ Flat faces are rejected before the expensive encoding, frames of cameras without depth are not checked
+
+        A camera with depth gives MISSING_DEPTH for a frame without depth, its face is rejected as well.
+        """
+        if self.liveness is None or depth is None or face_location is None:
+            return True
+        with metrics.registry.timer('liveness'):
+            live = self.liveness.is_live(depth, face_location, frame.shape)
+        if live:
+            return True
+        if not depth.size:
+            metrics.registry.inc('depth_missing')
+            log.warning('Face was rejected: no depth for the frame.', extra={'rate_limit': True})
+        else:
+            metrics.registry.inc('spoofs')
+            log.warning('Flat face was rejected by depth check.', extra={'rate_limit': True})
+        return False
+
+    def prepare(self):
+        """ Loads detector and encoder models at once, e.g. in a background thread at start """
+        self.detector.prepare()
+        load(face_recognition)
+
+    def set_tracker(self, verify_interval, retry_interval=0.5):
+        self.tracker = FaceTracker(verify_interval, retry_interval) if verify_interval else None
+
+    def set_recent(self, capacity, tolerance=0.4):
+        """ Matches faces against recently granted identities first, see RecentIdentities """
+        self.recent = RecentIdentities(capacity, tolerance) if capacity else None
+
     def get_face_encodings(self):
-        return self.face_encodings
+        return self.gallery.get_encodings()
 
     def get_file_names(self):
-        return self.face_file_names
+        return self.gallery.get_ids()
 
-    def recognize(self, frame):
-        name = None
-        try:
-            # Find all sub-images of faces -
-            # see result: https://github.com/ageitgey/face_recognition#find-faces-in-pictures
-            # face_locations = face_recognition.face_locations(frame)
-            sel_top = 0
-            sel_right = 0
-            sel_bottom = 0
-            sel_left = 0
-            LOW_THRSHOLD = 64 * 64  # simple NMS
-            any_selection = False
-            dist_to_centre = 0
+    def match(self, encoding, k=1, gallery=None):
+        return (gallery if gallery is not None else self.gallery).match(encoding, self.tolerance, k)
+
+    def detect(self, frame):
+        # Find all sub-images of faces -
+        # see result: https://github.com/ageitgey/face_recognition#find-faces-in-pictures
+        with metrics.registry.timer('detect'):
+            image = frame
+            if self.detection_scale != 1.0:
+                image = cv2.resize(image, (0, 0), fx=self.detection_scale, fy=self.detection_scale,
+                                   interpolation=cv2.INTER_AREA)
+            if self.detection_grayscale and image.ndim == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            face_locations = self.detector.detect(image)
+            if self.detection_scale == 1.0:
+                return face_locations
+            # map boxes back to the original frame
             img_h, img_w = frame.shape[:2]
-            centre_x = img_w / 2
-            centre_y = img_h / 2
-            face_locations = face_recognition.face_locations(frame)
-            for face_location in face_locations:
-                top, right, bottom, left = face_location
-                width = bottom - top
-                height = right - left
-                delta_x = top + width / 2
-                delta_y = left + height / 2
-                if width * height > LOW_THRSHOLD:
-                    if not any_selection:
-                        sel_top = top
-                        sel_right = right
-                        sel_bottom = bottom
-                        sel_left = left
-                        any_selection = True
-                        dist_to_centre = (centre_x - delta_x) * (centre_x - delta_x) + \
-                                         (centre_y - delta_y) * (centre_y - delta_y)
-                    dist = (centre_x - delta_x) * (centre_x - delta_x) + \
-                           (centre_y - delta_y) * (centre_y - delta_y)
-                    if dist < dist_to_centre:
-                        sel_top = top
-                        sel_right = right
-                        sel_bottom = bottom
-                        sel_left = left
-                        dist_to_centre = dist
-            # ? do we need to extend region?
-
-            # TODO: somehow check depth of such sub-images using realsense
-            # if an sub-image is flat, do not create face encoding for it
-            # probably sub-image should be passed to face_recognition.face_encodings rather than frame
-            strangers_face_encodings = face_recognition.face_encodings(frame[sel_top:sel_bottom, sel_left:sel_right])
+            return [(max(int(round(top / self.detection_scale)), 0),
+                     min(int(round(right / self.detection_scale)), img_w),
+                     min(int(round(bottom / self.detection_scale)), img_h),
+                     max(int(round(left / self.detection_scale)), 0))
+                    for top, right, bottom, left in face_locations]
+
+    @staticmethod
+    def select_face(face_locations, frame_shape):
+        sel_top = 0
+        sel_right = 0
+        sel_bottom = 0
+        sel_left = 0
+        LOW_THRSHOLD = 64 * 64  # simple NMS
+        any_selection = False
+        dist_to_centre = 0
+        img_h, img_w = frame_shape[:2]
+        centre_x = img_w / 2
+        centre_y = img_h / 2
+        for face_location in face_locations:
+            top, right, bottom, left = face_location
+            width = right - left
+            height = bottom - top
+            delta_x = left + width / 2
+            delta_y = top + height / 2
+            if width * height > LOW_THRSHOLD:
+                if not any_selection:
+                    sel_top = top
+                    sel_right = right
+                    sel_bottom = bottom
+                    sel_left = left
+                    any_selection = True
+                    dist_to_centre = (centre_x - delta_x) * (centre_x - delta_x) + \
+                                     (centre_y - delta_y) * (centre_y - delta_y)
+                dist = (centre_x - delta_x) * (centre_x - delta_x) + \
+                       (centre_y - delta_y) * (centre_y - delta_y)
+                if dist < dist_to_centre:
+                    sel_top = top
+                    sel_right = right
+                    sel_bottom = bottom
+                    sel_left = left
+                    dist_to_centre = dist
+        # ? do we need to extend region?
+        if not any_selection:
+            return None
+        return sel_top, sel_right, sel_bottom, sel_left
+
+    @staticmethod
+    def crop(frame, face_location):
+        if face_location is None:
+            return None
+        top, right, bottom, left = face_location
+        return frame[top:bottom, left:right]
+
+    def get_face_crop(self, frame):
+        """ Detection stage: returns sub-image of the selected face or None """
+        return self.crop(frame, self.select_face(self.detect(frame), frame.shape))
+
+    def get_live_face_crop(self, frame_depth):
+        """ Detection stage with depth: (frame, depth) to sub-image of the selected live face or None """
+        frame, depth = frame_depth
+        face_location = self.select_face(self.detect(frame), frame.shape)
+        if not self.is_live(frame, depth, face_location):
+            return None
+        return self.crop(frame, face_location)
+
+    @staticmethod
+    def encode(face_crop):
+        """ Encoding stage: returns list of encodings found on the face sub-image """
+        if face_crop is None or not face_crop.size:
+            return []
+        metrics.registry.inc('encodes')
+        with metrics.registry.timer('encode'):
+            # the crop is the face box itself, no need to detect the face on it once again
+            crop_h, crop_w = face_crop.shape[:2]
+            return face_recognition.face_encodings(face_crop, known_face_locations=[(0, crop_w, crop_h, 0)])
+
+    def identify(self, strangers_face_encodings):
+        """ Matching stage: returns file name of the first matched known face or None """
+        # the gallery can be swapped by the database watcher, all faces are matched against the same one
+        gallery = self.gallery
+        with metrics.registry.timer('match'):
             for strangers_face_encoding in strangers_face_encodings:
-                match = face_recognition.compare_faces(self.face_encodings, strangers_face_encoding)
-                n = min(len(match), len(self.get_file_names()))
-                for i in range(n):
-                    if match[i]:
-                        name = self.get_file_names()[i]
-                        break
+                if self.recent is not None:
+                    found = self.recent.lookup(strangers_face_encoding, gallery)
+                    if found is not None:
+                        return found[0]
+                start = time.time()
+                matches = self.match(strangers_face_encoding, gallery=gallery)
+                if self.recent is not None:
+                    self.recent.add_scan(time.time() - start)
+                if matches:
+                    name, _ = matches[0]
+                    if self.recent is not None:
+                        self.recent.add(name, gallery)
+                    return name
+            return None
+
+    def recognize_detailed(self, frame, depth=None):
+        """ Returns all face boxes, the selected box, its best match and distance to it """
+        gallery = self.gallery
+        face_locations = self.detect(frame)
+        face_location = self.select_face(face_locations, frame.shape)
+        result = {'boxes': face_locations, 'box': face_location, 'match': None, 'best': None, 'distance': None}
+        if not self.is_live(frame, depth, face_location):
+            result['spoof'] = True
+            return result
+        for encoding in self.encode(self.crop(frame, face_location)):
+            # the nearest known face is reported even if it is too far to be a match
+            matches = gallery.match(encoding, np.inf)
+            if matches:
+                result['best'], result['distance'] = matches[0]
+                if result['distance'] <= self.tolerance:
+                    result['match'] = result['best']
+            break
+        return result
+
+    def recognize(self, frame, depth=None):
+        try:
+            face_location = self.select_face(self.detect(frame), frame.shape)
+            self.face_present = face_location is not None
+            if not self.is_live(frame, depth, face_location):
+                # not passed to the tracker, so a spoof never inherits identity of a tracked face
+                return None
+            if self.tracker is None:
+                return self.identify(self.encode(self.crop(frame, face_location)))
+            tracks = self.tracker.update([face_location] if face_location is not None else [])
+            if not tracks:
+                return None
+            # the same face as on previous frames: identity is carried forward unless the box was missed or jumped
+            if not self.tracker.needs_encoding(tracks[0]):
+                return tracks[0].identity
+            name = self.identify(self.encode(self.crop(frame, face_location)))
+            self.tracker.set_identity(tracks[0], name)
             return name
         except Exception as ex:
             raise Exception('Something goes wrong: {}'.format(ex))
-
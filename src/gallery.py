@@ -0,0 +1,338 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import copy
+import time
+import logging
+import numpy as np
+
+log = logging.getLogger('fr3onn')
+
+
+STORAGES = ('float32', 'float16', 'int8')
+
+
+class Gallery:
+    """ Known face encodings in one preallocated matrix with a parallel id array
+
+    Removed rows are tombstoned and reclaimed by compact(), so append and remove are amortized O(1).
+    The matrix is float32 or, to save memory, float16 or int8 with a per-dimension scale;
+    quantized rows are converted to float32 block by block while distances are computed.
+    """
+    ENCODING_SIZE = 128
+    DTYPES = {'float32': np.float32, 'float16': np.float16, 'int8': np.int8}
+    # scale of an int8 gallery until it is fitted to the first encodings: dlib encodings are mostly within +-0.5
+    INT8_SCALE = 0.5 / 127
+    # a grown scale is widened by a margin, so rows enrolled one by one are rarely requantized
+    INT8_HEADROOM = 1.25
+    MIN_INT8_SCALE = 1e-4 / 127
+    BLOCK_SIZE = 1024
+
+    def __init__(self, capacity=256, storage='float32'):
+        if storage not in STORAGES:
+            raise Exception('Unknown gallery storage: {}'.format(storage))
+        self.storage = storage
+        self.matrix = np.zeros((capacity, self.ENCODING_SIZE), dtype=self.DTYPES[storage])
+        self.norms = np.zeros(capacity, dtype=np.float32)
+        self.scale = np.full(self.ENCODING_SIZE, self.INT8_SCALE, dtype=np.float32) if storage == 'int8' else None
+        self.scale_fitted = False
+        self.ids = np.empty(capacity, dtype=object)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.rows = {}
+        self.size = 0
+        self.index = None
+        # changed by every update, so caches of gallery rows know they are stale
+        self.version = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, id_):
+        return id_ in self.rows
+
+    def copy(self):
+        """ Independent copy, including the index """
+        return copy.deepcopy(self)
+
+    def get_capacity(self):
+        return len(self.matrix)
+
+    def get_memory_size(self):
+        """ Bytes taken by encodings and their norms """
+        return self.matrix[:self.size].nbytes + self.norms[:self.size].nbytes + \
+            (self.scale.nbytes if self.scale is not None else 0)
+
+    def fit_scale(self, encodings):
+        """ int8: follows max-abs of every dimension, so no value is clipped
+
+        A new or cleared gallery takes the scale of the first encodings. Later a dimension whose values
+        exceed the scale gets a wider one and its stored values are requantized.
+        """
+        if self.scale is None or not len(encodings):
+            return
+        needed = np.abs(np.asarray(encodings, dtype=np.float32)).reshape(-1, self.ENCODING_SIZE).max(axis=0) / 127
+        if not self.scale_fitted:
+            self.scale = np.maximum(needed, self.MIN_INT8_SCALE).astype(np.float32)
+            self.scale_fitted = True
+            return
+        grown = needed > self.scale
+        if not grown.any():
+            return
+        scale = self.scale.copy()
+        scale[grown] = needed[grown] * self.INT8_HEADROOM
+        columns = self.matrix[:self.size][:, grown].astype(np.float32) * (self.scale[grown] / scale[grown])
+        self.matrix[:self.size, grown] = np.rint(columns).astype(np.int8)
+        self.scale = scale
+        values = self.dequantize(self.matrix[:self.size])
+        self.norms[:self.size] = (values * values).sum(axis=1)
+        self.version += 1
+        log.debug('Scale of {} gallery dimensions was widened, {} rows were requantized.'
+                  .format(int(grown.sum()), self.size))
+        if self.index is not None and self.index.is_trained():
+            self.build_index()
+
+    def quantize(self, encodings):
+        encodings = np.asarray(encodings, dtype=np.float32)
+        if self.scale is None:
+            return encodings.astype(self.matrix.dtype)
+        return np.clip(np.rint(encodings / self.scale), -127, 127).astype(np.int8)
+
+    def dequantize(self, rows):
+        if self.scale is None:
+            return rows.astype(np.float32)
+        return rows.astype(np.float32) * self.scale
+
+    def reserve(self, capacity):
+        if capacity <= self.get_capacity():
+            return
+        matrix = np.zeros((capacity, self.ENCODING_SIZE), dtype=self.matrix.dtype)
+        matrix[:self.size] = self.matrix[:self.size]
+        norms = np.zeros(capacity, dtype=self.norms.dtype)
+        norms[:self.size] = self.norms[:self.size]
+        ids = np.empty(capacity, dtype=object)
+        ids[:self.size] = self.ids[:self.size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.size] = self.alive[:self.size]
+        self.matrix, self.norms, self.ids, self.alive = matrix, norms, ids, alive
+
+    def append(self, id_, encoding):
+        if id_ in self.rows:
+            self.remove(id_)
+        if self.size == self.get_capacity():
+            self.reserve(max(2 * self.get_capacity(), 1))
+        row = self.size
+        self.fit_scale([encoding])
+        self.matrix[row] = self.quantize(encoding)
+        # norms of the stored values, so distances are consistent with the quantized dot products
+        value = self.dequantize(self.matrix[row])
+        self.norms[row] = np.dot(value, value)
+        self.ids[row] = id_
+        self.alive[row] = True
+        self.rows[id_] = row
+        self.size += 1
+        self.version += 1
+        if self.index is not None and self.index.is_trained():
+            self.index.add(row, value)
+
+    def extend(self, ids, encodings):
+        self.reserve(self.size + len(ids))
+        # the scale is fitted to all encodings at once, not widened row by row
+        self.fit_scale(encodings)
+        for id_, encoding in zip(ids, encodings):
+            self.append(id_, encoding)
+
+    def remove(self, id_):
+        row = self.rows.pop(id_, None)
+        if row is None:
+            return False
+        self.alive[row] = False
+        self.ids[row] = None
+        self.version += 1
+        # reclaim tombstones once they take more than a half of the used rows
+        if self.size - len(self.rows) > max(len(self.rows), 64):
+            self.compact()
+        return True
+
+    def compact(self):
+        rows = np.flatnonzero(self.alive[:self.size])
+        n = len(rows)
+        if self.index is not None and self.index.is_trained():
+            mapping = np.full(self.size, -1, dtype=np.int64)
+            mapping[rows] = np.arange(n)
+            self.index.remap(mapping)
+        self.matrix[:n] = self.matrix[rows]
+        self.norms[:n] = self.norms[rows]
+        self.ids[:n] = self.ids[rows]
+        self.ids[n:self.size] = None
+        self.alive[:n] = True
+        self.alive[n:self.size] = False
+        self.size = n
+        self.rows = {id_: row for row, id_ in enumerate(self.ids[:n])}
+
+    def clear(self):
+        self.ids[:self.size] = None
+        self.alive[:self.size] = False
+        self.rows = {}
+        self.size = 0
+        self.scale_fitted = False
+        self.version += 1
+        if self.index is not None:
+            self.index.reset()
+
+    def set_index(self, index):
+        """ Enables approximate search with index (e.g. IVFIndex), None switches back to exact search """
+        self.index = index
+        if index is not None and len(self):
+            self.build_index()
+
+    def build_index(self):
+        if self.index is None:
+            return
+        if len(self) < self.index.get_min_size():
+            self.index.reset()
+            log.info('Gallery has {} encodings, at least {} are needed for ANN index. Exact search is used.'
+                     .format(len(self), self.index.get_min_size()))
+            return
+        self.index.build(self.get_encodings(), np.flatnonzero(self.alive[:self.size]))
+
+    def get_ids(self):
+        return list(self.ids[:self.size][self.alive[:self.size]])
+
+    def get_encodings(self):
+        return self.dequantize(self.matrix[:self.size][self.alive[:self.size]])
+
+    def get_encoding(self, id_):
+        return self.dequantize(self.matrix[self.rows[id_]])
+
+    def dot(self, encoding):
+        """ Dot products of encoding (or of every row of a matrix of encodings) with every used row """
+        if self.scale is not None:
+            # (q * scale) . e = q . (scale * e)
+            encoding = encoding * self.scale
+        # rows x queries for a matrix of encodings
+        encoding = encoding.T
+        if self.matrix.dtype == np.float32:
+            return self.matrix[:self.size].dot(encoding)
+        # blocks of quantized rows are converted in cache, the whole matrix is never expanded
+        products = np.empty((self.size,) + encoding.shape[1:], dtype=np.float32)
+        for start in range(0, self.size, self.BLOCK_SIZE):
+            stop = min(start + self.BLOCK_SIZE, self.size)
+            products[start:stop] = self.matrix[start:stop].astype(np.float32).dot(encoding)
+        return products
+
+    def distances(self, encoding):
+        """ Euclidean distances from encoding to every used row, tombstones get inf """
+        encoding = np.asarray(encoding, dtype=np.float32)
+        # |a - b|^2 = |a|^2 - 2ab + |b|^2, one matrix-vector product for the whole gallery
+        squared = self.norms[:self.size] - 2 * self.dot(encoding) + encoding.dot(encoding)
+        distances = np.sqrt(np.maximum(squared, 0))
+        distances[~self.alive[:self.size]] = np.inf
+        return distances
+
+    def match(self, encoding, tolerance=0.6, k=1):
+        """ Returns up to k (id, distance) pairs closer than tolerance, nearest first """
+        if not self.rows:
+            return []
+        if self.index is not None and self.index.is_trained():
+            # only candidates from probed cells are scored
+            candidates, distances = self.index.search(encoding, limit=max(32, 8 * k))
+            alive = self.alive[candidates]
+            candidates = candidates[alive]
+            if self.index.is_exact():
+                distances = np.sqrt(distances[alive])
+            else:
+                encoding = np.asarray(encoding, dtype=np.float32)
+                distances = np.linalg.norm(self.dequantize(self.matrix[candidates]) - encoding, axis=1)
+        else:
+            distances = self.distances(encoding)
+            candidates = np.arange(len(distances))
+        if not len(distances):
+            return []
+        k = min(k, len(distances))
+        order = np.argpartition(distances, k - 1)[:k] if k < len(distances) else np.arange(len(distances))
+        order = order[np.argsort(distances[order])]
+        return [(self.ids[candidates[i]], float(distances[i])) for i in order if distances[i] <= tolerance]
+
+    def match_batch(self, encodings, tolerance=0.6):
+        """ Nearest (id, distance) for every encoding, (None, None) if it is farther than tolerance
+
+        Exact search scores all encodings with one matrix product.
+        """
+        if not self.rows or not len(encodings):
+            return [(None, None)] * len(encodings)
+        if self.index is not None and self.index.is_trained():
+            return [self.best_match(encoding, tolerance) for encoding in encodings]
+        encodings = np.asarray(encodings, dtype=np.float32)
+        squared = self.norms[:self.size, None] - 2 * self.dot(encodings) + (encodings * encodings).sum(axis=1)
+        squared[~self.alive[:self.size]] = np.inf
+        nearest = squared.argmin(axis=0)
+        distances = np.sqrt(np.maximum(squared[nearest, np.arange(len(encodings))], 0))
+        return [(self.ids[row], float(distance)) if distance <= tolerance else (None, None)
+                for row, distance in zip(nearest, distances)]
+
+    def best_match(self, encoding, tolerance=0.6):
+        matches = self.match(encoding, tolerance)
+        return matches[0] if matches else (None, None)
+
+
+def storage_report(encodings, queries, tolerance=0.6, storages=STORAGES):
+    """ Compares memory, latency and distances of every gallery storage with exact float64 distances """
+    encodings = np.asarray(encodings, dtype=np.float64)
+    galleries = []
+    for storage in storages:
+        gallery = Gallery(len(encodings), storage)
+        gallery.extend(list(range(len(encodings))), encodings)
+        galleries.append(gallery)
+    stats = [{'latency': 0.0, 'max_error': 0.0, 'error': 0.0, 'agreement': 0, 'flips': 0} for _ in storages]
+    for query in np.asarray(queries, dtype=np.float64):
+        exact = np.linalg.norm(encodings - query, axis=1)
+        for gallery, line in zip(galleries, stats):
+            start = time.time()
+            distances = gallery.distances(query)
+            line['latency'] += time.time() - start
+            errors = np.abs(distances - exact)
+            line['max_error'] = max(line['max_error'], float(errors.max()))
+            line['error'] += float(errors.mean())
+            line['agreement'] += int(distances.argmin() == exact.argmin())
+            # access decision at tolerance differs from float64
+            line['flips'] += int((distances.min() <= tolerance) != (exact.min() <= tolerance))
+    count = float(max(len(queries), 1))
+    report = [{'storage': 'float64', 'bytes': encodings.nbytes, 'latency_ms': None, 'max_error': 0.0,
+               'mean_error': 0.0, 'nearest_agreement': 1.0, 'decision_flips': 0}]
+    for gallery, line in zip(galleries, stats):
+        report.append({'storage': gallery.storage, 'bytes': gallery.get_memory_size(),
+                       'latency_ms': line['latency'] / count * 1000, 'max_error': line['max_error'],
+                       'mean_error': line['error'] / count, 'nearest_agreement': line['agreement'] / count,
+                       'decision_flips': line['flips']})
+    return report
+
+
+def log_storage_report(report):
+    log.info('Gallery storage vs exact float64 distances:')
+    log.info('  storage      memory, KB   saved   latency, ms   max error   mean error   nearest   flips')
+    for line in report:
+        log.info('  {:<9}   {:>11.1f}   {:>4.0f}%   {:>11}   {:>9.5f}   {:>10.5f}   {:>7.3f}   {:>5}'.format(
+            line['storage'], line['bytes'] / 1024.0, 100.0 * (1 - line['bytes'] / float(report[0]['bytes'])),
+            '{:.3f}'.format(line['latency_ms']) if line['latency_ms'] is not None else '-',
+            line['max_error'], line['mean_error'], line['nearest_agreement'], line['decision_flips']))
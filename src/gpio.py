@@ -0,0 +1,117 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+
+from src.lazy import lazy_import, is_available
+
+# mraa is imported by the first use of a pin, not at start
+mraa = lazy_import('mraa')
+
+DIR_OUT = 0
+DIR_IN = 1
+# edge values are the same as in mraa
+EDGE_NONE = 0
+EDGE_BOTH = 1
+EDGE_RISING = 2
+EDGE_FALLING = 3
+
+
+class FakeGpio:
+    """ In-memory GPIO pin with the same interface as mraa.Gpio
+
+    Inputs read 1 by default: buttons and door sensor of FR3ONN are active low.
+    Every write is recorded with its time, so tests and benchmarks can check the lock pulses.
+    set_input simulates a signal on an input and calls the interrupt handler on matching edge.
+    """
+
+    def __init__(self, pin):
+        self.pin = pin
+        self.direction = None
+        self.value = 1
+        self.writes = []
+        self.isr_edge = EDGE_NONE
+        self.isr_func = None
+        self.isr_args = None
+
+    def dir(self, direction):
+        self.direction = direction
+        if direction == DIR_OUT:
+            self.value = 0
+
+    def write(self, value):
+        self.value = value
+        self.writes.append((time.time(), value))
+
+    def read(self):
+        return self.value
+
+    def isr(self, edge, func, args):
+        self.isr_edge = edge
+        self.isr_func = func
+        self.isr_args = args
+
+    def isrExit(self):
+        self.isr_edge = EDGE_NONE
+        self.isr_func = None
+
+    def set_input(self, value):
+        previous, self.value = self.value, value
+        if self.isr_func is None or previous == value:
+            return
+        rising = value > previous
+        if self.isr_edge == EDGE_BOTH or (self.isr_edge == EDGE_RISING and rising) or \
+                (self.isr_edge == EDGE_FALLING and not rising):
+            self.isr_func(self.isr_args)
+
+
+class FakeGpioBackend:
+    """ Hardware-free replacement of mraa module, pins are kept to be inspected """
+    DIR_OUT = DIR_OUT
+    DIR_IN = DIR_IN
+    EDGE_NONE = EDGE_NONE
+    EDGE_BOTH = EDGE_BOTH
+    EDGE_RISING = EDGE_RISING
+    EDGE_FALLING = EDGE_FALLING
+
+    def __init__(self):
+        self.pins = {}
+
+    def Gpio(self, pin):
+        self.pins[pin] = FakeGpio(pin)
+        return self.pins[pin]
+
+
+BACKENDS = ('mraa', 'fake')
+
+
+def get_backend(name='mraa'):
+    """ Returns an object with Gpio, DIR_OUT and DIR_IN attributes: mraa module itself or a fake """
+    if name == 'fake':
+        return FakeGpioBackend()
+    if name == 'mraa':
+        if not is_available('mraa'):
+            raise Exception('mraa module is not available, use fake GPIO backend to run without Intel Joule')
+        return mraa
+    raise Exception('Unknown GPIO backend {}, expected one of {}'.format(name, ', '.join(BACKENDS)))
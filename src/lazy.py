@@ -0,0 +1,103 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import logging
+import importlib
+import importlib.util
+import threading
+
+log = logging.getLogger('fr3onn')
+
+
+class LazyModule:
+    """ Stands for a module which is imported on first use of any of its attributes
+
+    Heavy modules (cv2, dlib models of face_recognition, mraa) are not loaded when fr3onn modules are imported,
+    so startup steps which do not need them are not delayed. load() imports the module at once, e.g. in
+    a background thread. Concurrent imports are serialized by the import lock of Python.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __repr__(self):
+        return '<lazy module {}>'.format(self._name)
+
+
+def lazy_import(name):
+    return LazyModule(name)
+
+
+def load(module):
+    """ Imports a lazy module and returns the module itself, returns other modules as is """
+    return module._load() if isinstance(module, LazyModule) else module
+
+
+def is_available(name):
+    """ Whether a module can be imported, without importing it """
+    return importlib.util.find_spec(name) is not None
+
+
+class StartupTask:
+    """ A startup step run in a background thread, its time and error are kept for the startup log """
+
+    def __init__(self, name, func, *args):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.thread = None
+        self.elapsed = None
+        self.error = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        start = time.time()
+        try:
+            self.func(*self.args)
+        except Exception as ex:
+            self.error = ex
+        self.elapsed = time.time() - start
+
+    def is_done(self):
+        return self.thread is not None and not self.thread.is_alive()
+
+    def wait(self):
+        """ Waits for the step, its error is raised in the calling thread """
+        self.thread.join()
+        if self.error is not None:
+            raise Exception('Failed to start {}: {}'.format(self.name, self.error))
@@ -0,0 +1,92 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import logging
+import numpy as np
+
+log = logging.getLogger('fr3onn')
+
+
+class DepthLiveness:
+    """ Rejects flat faces (photos, screens) by the depth relief of the face box
+
+    A plane is fitted to up to samples x samples depth points of the box by least squares; a real face
+    deviates from any plane by its nose, eyes and cheeks, a photo does not, even if it is tilted.
+    """
+
+    def __init__(self, min_relief=0.005, samples=32, min_valid=0.5):
+        self.min_relief = min_relief
+        self.samples = samples
+        self.min_valid = min_valid
+        self.checked = 0
+        self.rejected = 0
+        self.missing = 0
+        self.time = 0.0
+
+    def get_relief(self, depth, face_location, frame_shape=None):
+        """ RMS distance in meters from depth points of the face box to their plane, None if depth is missing """
+        top, right, bottom, left = face_location
+        if frame_shape is not None and tuple(frame_shape[:2]) != depth.shape[:2]:
+            # depth of another resolution, but aligned to the frame
+            scale_y = depth.shape[0] / float(frame_shape[0])
+            scale_x = depth.shape[1] / float(frame_shape[1])
+            top, bottom = int(top * scale_y), int(bottom * scale_y)
+            left, right = int(left * scale_x), int(right * scale_x)
+        box = depth[max(top, 0):bottom, max(left, 0):right]
+        if not box.size:
+            return None
+        step_y = max(box.shape[0] // self.samples, 1)
+        step_x = max(box.shape[1] // self.samples, 1)
+        box = box[::step_y, ::step_x]
+        y, x = np.nonzero(box > 0)
+        if len(y) < max(self.min_valid * box.size, 3):
+            return None
+        z = box[y, x].astype(np.float64)
+        points = np.column_stack((x, y, np.ones(len(x))))
+        plane, _, _, _ = np.linalg.lstsq(points, z, rcond=None)
+        return float(np.sqrt(np.mean((points.dot(plane) - z) ** 2)))
+
+    def is_live(self, depth, face_location, frame_shape=None):
+        """ A face without depth of its frame (an empty depth) is not live: it can not be checked """
+        start = time.time()
+        if depth.size:
+            relief = self.get_relief(depth, face_location, frame_shape)
+        else:
+            relief = None
+            self.missing += 1
+        live = relief is not None and relief >= self.min_relief
+        self.time += time.time() - start
+        self.checked += 1
+        if not live:
+            self.rejected += 1
+        return live
+
+    def get_stats(self):
+        return {'checked': self.checked, 'rejected': self.rejected, 'missing': self.missing,
+                'time_ms': self.time / self.checked * 1000 if self.checked else 0.0}
+
+    def log_stats(self):
+        log.info('  Liveness: {checked} faces checked, {rejected} rejected as flat or without depth ({missing}), '
+                 '{time_ms:.3f} ms per check.'.format(**self.get_stats()))
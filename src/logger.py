@@ -24,15 +24,30 @@
 
 import logging
 import logging.config
+import logging.handlers
 import inspect
+import copy
+import atexit
+import queue
+import threading
+import time
 import os
 import types
+import multiprocessing
 
+# listener thread writing records to summary log and console
+_listener = None
+# queue of records logged by worker processes and the thread passing them to the listener
+_worker_records = None
+_worker_listener = None
 
-def init_logger(logdir=None):
+
+def init_logger(logdir=None, max_bytes=10 * 1024 * 1024, backup_count=5, rate_limit_interval=60):
     if logdir is None:
         logdir = 'logs'
 
+    stop_logger()
+
     os.makedirs(logdir, exist_ok=True)
 
     logger_config = {
@@ -55,11 +70,12 @@ def init_logger(logdir=None):
             },
             'summary': {
                 'level': 'DEBUG',
-                'class': 'logging.FileHandler',
+                'class': 'logging.handlers.RotatingFileHandler',
                 'filename': os.path.join(logdir, "summary.log"),
                 'encoding': 'utf-8',
                 'formatter': 'custom',
-                'mode': 'w',
+                'maxBytes': max_bytes,
+                'backupCount': backup_count,
             },
         },
         'loggers': {
@@ -73,12 +89,90 @@ def init_logger(logdir=None):
 
     logging.config.dictConfig(logger_config)
 
+    # file and console I/O is moved off the hot path: records are put to a queue
+    # and written by a listener thread
+    start_listener(rate_limit_interval)
+
     # hack for indentation in logs
     decorate_logger(logging.Logger, logging.Logger._log)
 
     fix_logger_for_linux_cmd()
 
 
+def start_listener(rate_limit_interval=60):
+    global _listener
+    logger = logging.getLogger('fr3onn')
+    handlers = logger.handlers[:]
+    for handler in handlers:
+        logger.removeHandler(handler)
+    records = queue.Queue(-1)
+    queue_handler = RecordQueueHandler(records)
+    queue_handler.set_name('queue')
+    if rate_limit_interval:
+        queue_handler.addFilter(RateLimitFilter(rate_limit_interval))
+    logger.addHandler(queue_handler)
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logger():
+    """ Writes all queued records and stops the listener thread """
+    global _listener, _worker_records, _worker_listener
+    if _listener is None:
+        return
+    if _worker_listener is not None:
+        _worker_listener.stop()
+        _worker_records = None
+        _worker_listener = None
+    logger = logging.getLogger('fr3onn')
+    for handler in logger.handlers:
+        for log_filter in handler.filters:
+            if isinstance(log_filter, RateLimitFilter):
+                log_filter.flush(handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+atexit.register(stop_logger)
+
+
+def get_worker_records():
+    """ Queue for records of worker processes, pass it to init_worker_logger() in the pool initializer
+
+    Records of workers go through the queue handler of this process, so they are rate limited and written
+    by the listener like the others. Returns None if the listener is not started, e.g. in tests.
+    """
+    global _worker_records, _worker_listener
+    if _listener is None:
+        return None
+    if _worker_listener is None:
+        handler = next((handler for handler in logging.getLogger('fr3onn').handlers
+                        if handler.get_name() == 'queue'), None)
+        if handler is None:
+            return None
+        # a queue of the fork context can not be sent to forkserver or spawn workers, the other way it can
+        _worker_records = multiprocessing.get_context('spawn').SimpleQueue()
+        _worker_listener = WorkerRecordListener(_worker_records, handler)
+        _worker_listener.start()
+    return _worker_records
+
+
+def init_worker_logger(records):
+    """ Sends records of a worker process to the parent, runs in the pool initializer
+
+    A forked worker inherits handlers whose queue is not read by any listener in the child, they are replaced.
+    """
+    logger = logging.getLogger('fr3onn')
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+    if records is None:
+        return
+    logger.addHandler(WorkerQueueHandler(records))
+    logger.setLevel(logging.DEBUG)
+
+
 def decorate_logger(logger, func):
     def my_decorator(self, level, msg, args, exc_info=None, extra=None):
         msg = ' ' * self._indent + str(msg)
@@ -139,7 +233,7 @@ def remove_summary():
 
     handlers = logger.handlers[:]
     for handler in handlers:
-        if (handler._name == 'summary') or (handler._name == 'console'):
+        if handler.get_name() in ('summary', 'console', 'queue'):
             logger.removeHandler(handler)
 
 
@@ -176,21 +270,123 @@ class UniqueFileHandler(object):
         raise AttributeError
 
 
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    """ Puts records to the queue unformatted, handlers of the listener format them with their own formatters
+
+    QueueHandler formats records by itself and drops exc_info, so tracebacks lose the layout of CustomFormatter.
+    Only arguments are merged into the message, they may be changed by the caller before the record is written.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class WorkerQueueHandler(RecordQueueHandler):
+    """ Puts records of a worker process to a multiprocessing queue
+
+    The queue is a SimpleQueue written without a feeder thread, so a record is not lost if the pool
+    terminates the worker right after logging. Tracebacks can not be pickled, they are formatted in
+    the worker with the layout of CustomFormatter.
+    """
+
+    def enqueue(self, record):
+        self.queue.put(record)
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        if record.exc_info:
+            formatter = CustomFormatter()
+            record.exc_text = formatter.format_exception_better(formatter.formatException(record.exc_info))
+            record.exc_info = None
+        return record
+
+
+class WorkerRecordListener(logging.handlers.QueueListener):
+    """ Passes records of worker processes from a SimpleQueue to the queue handler of this process """
+
+    def dequeue(self, block):
+        return self.queue.get()
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def format_repeats(message, count, elapsed):
+    return '{} ({} repeats suppressed in {:.0f} s)'.format(message, count, elapsed)
+
+
+class RateLimitFilter(logging.Filter):
+    """ Suppresses repeats of records logged with extra={'rate_limit': True}
+
+    The first record passes, identical ones within interval seconds are counted, and the next one
+    after the interval passes with the number of suppressed repeats, e.g.
+    "**Access DENIED** (340 repeats suppressed in 60 s)". Counters left at shutdown are written by flush().
+    """
+
+    def __init__(self, interval=60):
+        super().__init__()
+        self.interval = interval
+        self.repeats = {}
+        # records are filtered by every logging thread, counters are flushed by the thread stopping the logger
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, 'rate_limit', False):
+            return True
+        key = (record.levelno, record.getMessage())
+        now = record.created
+        with self.lock:
+            if key not in self.repeats:
+                self.repeats[key] = [now, 0]
+                return True
+            start, count = self.repeats[key]
+            if now - start < self.interval:
+                self.repeats[key][1] += 1
+                return False
+            self.repeats[key] = [now, 0]
+        if count:
+            record.msg = format_repeats(record.getMessage(), count, now - start)
+            record.args = ()
+        return True
+
+    def flush(self, handler):
+        """ Emits counters of suppressed records, e.g. on shutdown """
+        with self.lock:
+            repeats = self.repeats
+            self.repeats = {}
+        for (level, message), (start, count) in repeats.items():
+            if count:
+                record = logging.LogRecord('fr3onn', level, __file__, 0,
+                                           format_repeats(message, count, time.time() - start), (), None)
+                handler.handle(record)
+
+
 class CustomFormatter(logging.Formatter):
     def __init__(self, fmt=None, datefmt=None):
         super().__init__(fmt, datefmt)
         self.baseline = len(inspect.stack())
+        self.last_second = None
+        self.last_time = None
+
+    def format_time(self, record):
+        # records within the same second share the formatted time
+        second = int(record.created)
+        if second != self.last_second:
+            self.last_time = time.strftime('%Y-%m-%d %H:%M:%S', self.converter(record.created))
+            self.last_second = second
+        return self.last_time
 
     def format(self, record):
         record.indent = ''
-        record.message = record.getMessage().split('\n')
-        s = ""
-        for i in record.message:
-            if len(i.strip()) > 0:
-                s += "[%s] %s %s %s\n" % (self.formatTime(record, '%Y-%m-%d %H:%M:%S'),
-                                          record.levelname.ljust(8),
-                                          record.indent, i)
-        s = s[:-1]
+        record.message = record.getMessage()
+        prefix = '[%s] %s %s ' % (self.format_time(record), record.levelname.ljust(8), record.indent)
+        if '\n' not in record.message:
+            s = prefix + record.message if record.message.strip() else ''
+        else:
+            s = '\n'.join(prefix + i for i in record.message.split('\n') if i.strip())
         if record.exc_info:
             # Cache the traceback text to avoid converting it multiple times
             # (it's constant anyway)
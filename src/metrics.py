@@ -0,0 +1,232 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import bisect
+import logging
+import threading
+import collections
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+log = logging.getLogger('fr3onn')
+
+PREFIX = 'fr3onn_'
+# latency buckets in seconds, from camera read to dlib encode on a slow board
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, value=1):
+        with self.lock:
+            self.value += value
+
+
+class Histogram:
+    """ Cumulative Prometheus-style buckets plus rolling window of recent samples for percentiles """
+
+    def __init__(self, name, help_text, labels=None, window=1000, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels or {}
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.window = collections.deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+            self.window.append(value)
+
+    def get_percentile(self, percent):
+        with self.lock:
+            samples = sorted(self.window)
+        if not samples:
+            return 0.0
+        return samples[min(int(len(samples) * percent / 100.0), len(samples) - 1)]
+
+
+class Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        self.histogram.observe(time.time() - self.start)
+
+
+class Metrics:
+    """ Registry of counters and per-stage latency histograms """
+
+    def __init__(self):
+        self.counters = collections.OrderedDict()
+        self.histograms = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def counter(self, name, help_text=''):
+        with self.lock:
+            if name not in self.counters:
+                self.counters[name] = Counter(name, help_text)
+            return self.counters[name]
+
+    def histogram(self, stage):
+        with self.lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = Histogram('stage_latency_seconds', 'Latency of processing stages',
+                                                   {'stage': stage})
+            return self.histograms[stage]
+
+    def timer(self, stage):
+        return Timer(self.histogram(stage))
+
+    def inc(self, name, value=1):
+        self.counter(name).inc(value)
+
+    def take(self):
+        """ Returns (counters, samples) gathered since the last call and resets them
+
+        Worker processes have their own registry: they send these back with results, the parent adds them
+        to its registry with merge().
+        """
+        with self.lock:
+            counters = list(self.counters.values())
+            histograms = list(self.histograms.items())
+        values = {}
+        for counter in counters:
+            with counter.lock:
+                if counter.value:
+                    values[counter.name] = counter.value
+                    counter.value = 0
+        samples = {}
+        for stage, histogram in histograms:
+            with histogram.lock:
+                if histogram.window:
+                    samples[stage] = list(histogram.window)
+                histogram.window.clear()
+                histogram.counts = [0] * (len(histogram.buckets) + 1)
+                histogram.sum = 0.0
+                histogram.count = 0
+        return values, samples
+
+    def merge(self, taken):
+        values, samples = taken
+        for name, value in values.items():
+            self.inc(name, value)
+        for stage, stage_samples in samples.items():
+            histogram = self.histogram(stage)
+            for value in stage_samples:
+                histogram.observe(value)
+
+    def to_prometheus(self):
+        lines = []
+        for counter in list(self.counters.values()):
+            name = PREFIX + counter.name + '_total'
+            lines.append('# HELP {} {}'.format(name, counter.help_text or counter.name.replace('_', ' ')))
+            lines.append('# TYPE {} counter'.format(name))
+            lines.append('{} {}'.format(name, counter.value))
+        histograms = list(self.histograms.values())
+        if histograms:
+            name = PREFIX + histograms[0].name
+            lines.append('# HELP {} {}'.format(name, histograms[0].help_text))
+            lines.append('# TYPE {} histogram'.format(name))
+        for histogram in histograms:
+            name = PREFIX + histogram.name
+            labels = ','.join('{}="{}"'.format(key, value) for key, value in sorted(histogram.labels.items()))
+            with histogram.lock:
+                counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+            cumulative = 0
+            for bound, bucket_count in zip(list(histogram.buckets) + ['+Inf'], counts):
+                cumulative += bucket_count
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, bound, cumulative))
+            lines.append('{}_sum{{{}}} {}'.format(name, labels, total))
+            lines.append('{}_count{{{}}} {}'.format(name, labels, count))
+        return '\n'.join(lines) + '\n'
+
+    def get_summary(self):
+        counters = ', '.join('{} {}'.format(counter.name.replace('_', ' '), counter.value)
+                             for counter in list(self.counters.values()))
+        stages = ', '.join('{} p50 {:.1f} ms p99 {:.1f} ms'.format(stage, histogram.get_percentile(50) * 1000,
+                                                                 histogram.get_percentile(99) * 1000)
+                           for stage, histogram in list(self.histograms.items()) if histogram.count)
+        return 'Metrics: {}; {}'.format(counters, stages) if stages else 'Metrics: {}'.format(counters)
+
+
+registry = Metrics()
+for counter_name, counter_help in (('frames_seen', 'Frames read from cameras'),
+                                   ('frames_processed', 'Frames passed through recognition'),
+                                   ('frames_dropped', 'Frames skipped or dropped without recognition'),
+                                   ('matches', 'Frames with access provided'),
+                                   ('denials', 'Frames with access denied'),
+                                   ('encodes', 'Face encodings computed'),
+                                   ('lock_pulses', 'Lock openings'),
+                                   ('spoofs', 'Faces rejected by liveness check'),
+                                   ('depth_missing', 'Faces rejected without depth of their frame')):
+    registry.counter(counter_name, counter_help)
+
+
+class MetricsServer:
+    """ Serves registry in Prometheus text format on http://127.0.0.1:<port>/metrics """
+
+    def __init__(self, port, metrics=registry, host='127.0.0.1'):
+        self.metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path not in ('/', '/metrics'):
+                    handler.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode('utf-8')
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass
+
+        self.server = HTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        log.info('Metrics are available on http://{}:{}/metrics'.format(*self.server.server_address))
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
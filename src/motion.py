@@ -0,0 +1,86 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import logging
+import numpy as np
+
+from src.lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+
+log = logging.getLogger('fr3onn')
+
+
+class MotionDetector:
+    """ Cheap scene change detector: differencing of downsampled grayscale frame with running background
+
+    A frame is considered active when the fraction of changed pixels exceeds threshold. The detector stays
+    active for hold_frames frames after the last change, so a person standing still is still recognized.
+    """
+
+    def __init__(self, threshold=0.01, pixel_threshold=25, width=160, learning_rate=0.05, hold_frames=30):
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.width = width
+        self.learning_rate = learning_rate
+        self.hold_frames = hold_frames
+        self.background = None
+        self.hold = 0
+        self.frames = 0
+        self.active_frames = 0
+        self.last_change = 0.0
+
+    def get_small_frame(self, frame):
+        scale = self.width / float(frame.shape[1])
+        small = cv2.resize(frame, (self.width, max(int(frame.shape[0] * scale), 1)), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        # blur removes sensor noise which would be taken as motion otherwise
+        return cv2.GaussianBlur(small, (5, 5), 0).astype(np.float32)
+
+    def is_active(self, frame):
+        self.frames += 1
+        small = self.get_small_frame(frame)
+        if self.background is None or self.background.shape != small.shape:
+            self.background = small
+            self.hold = self.hold_frames
+            self.active_frames += 1
+            return True
+        changed = np.abs(small - self.background) > self.pixel_threshold
+        self.last_change = float(changed.mean())
+        cv2.accumulateWeighted(small, self.background, self.learning_rate)
+        if self.last_change > self.threshold:
+            self.hold = self.hold_frames
+        elif self.hold > 0:
+            self.hold -= 1
+        active = self.hold > 0
+        if active:
+            self.active_frames += 1
+        return active
+
+    def get_stats(self):
+        return {'frames': self.frames, 'active_frames': self.active_frames, 'last_change': self.last_change}
+
+    def log_stats(self):
+        log.info('Motion detector: {active_frames} of {frames} frames were active.'.format(**self.get_stats()))
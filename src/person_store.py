@@ -0,0 +1,322 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import numpy as np
+
+from src.utils import Utils
+
+log = logging.getLogger('fr3onn')
+
+IMAGE_PATTERN = r'^.*\.(jpg|png|tiff|bmp)$'
+# files written by DataBase.add_person: <name>-<uuid4>.jpg, the name itself may contain '-'
+UUID_NAME_PATTERN = re.compile(r'^(.+)-[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.I)
+
+
+class PersonStore:
+    """ SQLite store of persons, their images and face encodings, kept in the database folder
+
+    Image paths are stored relative to the database folder and are indexed, as well as person names,
+    so lookups do not walk the folder. Encodings are kept as blobs with size, mtime and SHA-1 of the
+    image, the store serves as encoding cache of FaceRecognition (NULL blob means no face).
+    """
+    FILE_NAME = 'persons.sqlite3'
+    SCHEMA_VERSION = 1
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS persons (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            created REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS images (
+            id INTEGER PRIMARY KEY,
+            person_id INTEGER NOT NULL REFERENCES persons(id) ON DELETE CASCADE,
+            path TEXT NOT NULL UNIQUE,
+            added REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS images_person_id ON images(person_id);
+        CREATE TABLE IF NOT EXISTS encodings (
+            image_id INTEGER PRIMARY KEY REFERENCES images(id) ON DELETE CASCADE,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            sha1 TEXT NOT NULL,
+            encoding BLOB);
+    '''
+
+    def __init__(self, db_dir):
+        self.db_dir = db_dir
+        self.lock = threading.RLock()
+        self.connection = None
+        self.open()
+
+    def get_path(self):
+        return os.path.join(self.db_dir, self.FILE_NAME)
+
+    def open(self):
+        try:
+            self.connection = sqlite3.connect(self.get_path(), check_same_thread=False)
+            self.connection.execute('PRAGMA foreign_keys = ON')
+            self.connection.execute('PRAGMA journal_mode = WAL')
+            version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+            self.connection.executescript(self.SCHEMA)
+        except Exception as ex:
+            raise Exception('Unable to open person store: {}'.format(ex))
+        if version < self.SCHEMA_VERSION:
+            log.info('Person store was created in {}, importing images of the database folder...'
+                     .format(self.get_path()))
+            self.import_folder()
+            with self.connection:
+                self.connection.execute('PRAGMA user_version = {}'.format(self.SCHEMA_VERSION))
+        else:
+            # the folder is not walked: images copied by hand are found by --db_rescan or the database watcher
+            log.info('Person store: {} persons, {} images.'.format(self.count('persons'), self.count('images')))
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.commit()
+                self.connection.close()
+                self.connection = None
+
+    def count(self, table):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM {}'.format(table)).fetchone()[0]
+
+    @staticmethod
+    def parse_person_name(path):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        match = UUID_NAME_PATTERN.match(stem)
+        # hand-made files are <name>.jpg, only a uuid suffix is not a part of the name
+        return match.group(1) if match else stem
+
+    def get_relative_path(self, path):
+        return os.path.relpath(os.path.abspath(path), os.path.abspath(self.db_dir))
+
+    def get_full_path(self, relative_path):
+        return os.path.join(self.db_dir, relative_path)
+
+    @staticmethod
+    def get_file_hash(path):
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    def import_folder(self, rehash=False):
+        """ Synchronizes the store with the database folder: adds new images and drops missing ones
+
+        Encodings of images with another size or mtime are dropped if their content has changed, so they
+        are encoded again. Only such images are hashed, unless rehash is set: then every encoded image is.
+        Returns numbers of imported, missing and changed images.
+        """
+        paths = Utils.get_files_from_folder_recursively(self.db_dir, pattern=IMAGE_PATTERN)
+        relative_paths = set(self.get_relative_path(path) for path in paths)
+        with self.lock, self.connection:
+            known = set(row[0] for row in self.connection.execute('SELECT path FROM images'))
+            for relative_path in sorted(relative_paths - known):
+                self.insert_image(self.parse_person_name(relative_path), relative_path)
+            missing = known - relative_paths
+            self.connection.executemany('DELETE FROM images WHERE path = ?', [(path,) for path in missing])
+            # persons without images are left from deleted files
+            self.connection.execute('DELETE FROM persons WHERE id NOT IN (SELECT DISTINCT person_id FROM images)')
+            changed = [(image_id,) for image_id in self.find_changed(rehash)]
+            self.connection.executemany('DELETE FROM encodings WHERE image_id = ?', changed)
+        log.info('Person store: {} images imported, {} missing images removed, {} changed images will be encoded '
+                 'again.'.format(len(relative_paths - known), len(missing), len(changed)))
+        return len(relative_paths - known), len(missing), len(changed)
+
+    def find_changed(self, rehash=False):
+        """ Must be called inside a transaction, returns ids of encoded images whose content has changed """
+        changed = []
+        rows = self.connection.execute('SELECT images.id, images.path, size, mtime, sha1 FROM encodings '
+                                       'JOIN images ON images.id = encodings.image_id').fetchall()
+        for image_id, relative_path, size, mtime, sha1 in rows:
+            path = self.get_full_path(relative_path)
+            try:
+                stat = os.stat(path)
+                if stat.st_size != size:
+                    changed.append(image_id)
+                elif stat.st_mtime != mtime or rehash:
+                    # file was touched or copied, the encoding is kept if the content is the same
+                    if self.get_file_hash(path) != sha1:
+                        changed.append(image_id)
+                    elif stat.st_mtime != mtime:
+                        self.connection.execute('UPDATE encodings SET mtime = ? WHERE image_id = ?',
+                                                (stat.st_mtime, image_id))
+            except OSError:
+                changed.append(image_id)
+        return changed
+
+    def insert_image(self, name, relative_path):
+        """ Must be called inside a transaction """
+        now = time.time()
+        self.connection.execute('INSERT OR IGNORE INTO persons (name, created) VALUES (?, ?)', (name, now))
+        person_id = self.connection.execute('SELECT id FROM persons WHERE name = ?', (name,)).fetchone()[0]
+        cursor = self.connection.execute('INSERT OR IGNORE INTO images (person_id, path, added) VALUES (?, ?, ?)',
+                                         (person_id, relative_path, now))
+        if cursor.rowcount:
+            return cursor.lastrowid
+        return self.get_image_id(relative_path)
+
+    def get_image_id(self, relative_path):
+        row = self.connection.execute('SELECT id FROM images WHERE path = ?', (relative_path,)).fetchone()
+        return row[0] if row else None
+
+    def add_image(self, name, path):
+        with self.lock, self.connection:
+            return self.insert_image(name, self.get_relative_path(path))
+
+    def remove_image(self, path):
+        """ Removes the image with its encoding, the person goes away with the last image """
+        with self.lock, self.connection:
+            row = self.connection.execute('SELECT id, person_id FROM images WHERE path = ?',
+                                          (self.get_relative_path(path),)).fetchone()
+            if row is None:
+                return False
+            self.connection.execute('DELETE FROM images WHERE id = ?', (row[0],))
+            self.connection.execute('DELETE FROM persons WHERE id = ? AND NOT EXISTS '
+                                    '(SELECT 1 FROM images WHERE person_id = ?)', (row[1], row[1]))
+        return True
+
+    def remove_person(self, name):
+        """ Removes the person with all images and encodings, returns paths of removed images """
+        with self.lock, self.connection:
+            person_id = self.get_person_id(name)
+            if person_id is None:
+                return []
+            paths = [row[0] for row in
+                     self.connection.execute('SELECT path FROM images WHERE person_id = ?', (person_id,))]
+            self.connection.execute('DELETE FROM persons WHERE id = ?', (person_id,))
+        return [self.get_full_path(path) for path in paths]
+
+    def get_person_id(self, name):
+        with self.lock:
+            row = self.connection.execute('SELECT id FROM persons WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def get_person_name(self, path):
+        with self.lock:
+            row = self.connection.execute('SELECT persons.name FROM images JOIN persons ON persons.id = '
+                                          'images.person_id WHERE images.path = ?',
+                                          (self.get_relative_path(path),)).fetchone()
+        return row[0] if row else None
+
+    def get_persons(self):
+        with self.lock:
+            return [row[0] for row in self.connection.execute('SELECT name FROM persons ORDER BY name')]
+
+    def get_images(self, name=None):
+        with self.lock:
+            if name is None:
+                rows = self.connection.execute('SELECT path FROM images ORDER BY id')
+            else:
+                rows = self.connection.execute('SELECT images.path FROM images JOIN persons ON persons.id = '
+                                               'images.person_id WHERE persons.name = ? ORDER BY images.id', (name,))
+            return [self.get_full_path(row[0]) for row in rows]
+
+    def get(self, path):
+        """ Returns (found, encoding); encoding is None for images without a face """
+        with self.lock:
+            row = self.connection.execute('SELECT encodings.image_id, size, mtime, sha1, encoding FROM encodings '
+                                          'JOIN images ON images.id = encodings.image_id WHERE images.path = ?',
+                                          (self.get_relative_path(path),)).fetchone()
+        if row is None:
+            return False, None
+        image_id, size, mtime, sha1, blob = row
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False, None
+        if stat.st_size != size:
+            return False, None
+        if stat.st_mtime != mtime:
+            # file was touched or copied, compare content before re-encoding
+            if self.get_file_hash(path) != sha1:
+                return False, None
+            with self.lock:
+                self.connection.execute('UPDATE encodings SET mtime = ? WHERE image_id = ?', (stat.st_mtime, image_id))
+        if blob is None:
+            return True, None
+        return True, np.frombuffer(blob, dtype=np.float64).copy()
+
+    def get_many(self, paths):
+        """ Returns (found, encoding) of every path like get(), with one query and without touching the files
+
+        Encodings are rows of one contiguous matrix. The store is trusted: files changed by hand
+        are found by --db_rescan or the database watcher.
+        """
+        with self.lock:
+            rows = self.connection.execute('SELECT images.path, encodings.encoding FROM encodings '
+                                           'JOIN images ON images.id = encodings.image_id').fetchall()
+        blobs = [blob for _, blob in rows if blob is not None]
+        matrix = np.frombuffer(b''.join(blobs), dtype=np.float64).reshape(len(blobs), -1) if blobs else None
+        encodings = {}
+        row = 0
+        for relative_path, blob in rows:
+            encodings[relative_path] = matrix[row] if blob is not None else None
+            row += blob is not None
+        results = []
+        for path in paths:
+            relative_path = self.get_relative_path(path)
+            results.append((relative_path in encodings, encodings.get(relative_path)))
+        return results
+
+    def put(self, path, encoding):
+        """ Stores the encoding of the image, written to disk on save() """
+        stat = os.stat(path)
+        blob = np.asarray(encoding, dtype=np.float64).tobytes() if encoding is not None else None
+        with self.lock:
+            relative_path = self.get_relative_path(path)
+            image_id = self.get_image_id(relative_path)
+            if image_id is None:
+                image_id = self.insert_image(self.parse_person_name(path), relative_path)
+            self.connection.execute('INSERT OR REPLACE INTO encodings (image_id, size, mtime, sha1, encoding) '
+                                    'VALUES (?, ?, ?, ?, ?)',
+                                    (image_id, stat.st_size, stat.st_mtime, self.get_file_hash(path), blob))
+
+    def remove(self, path):
+        with self.lock:
+            self.connection.execute('DELETE FROM encodings WHERE image_id IN (SELECT id FROM images WHERE path = ?)',
+                                    (self.get_relative_path(path),))
+
+    def prune(self, paths):
+        """ Drops encodings of images which are not in paths anymore """
+        relative_paths = set(self.get_relative_path(path) for path in paths)
+        with self.lock:
+            rows = self.connection.execute('SELECT images.id, images.path FROM encodings '
+                                           'JOIN images ON images.id = encodings.image_id').fetchall()
+            self.connection.executemany('DELETE FROM encodings WHERE image_id = ?',
+                                        [(image_id,) for image_id, path in rows if path not in relative_paths])
+
+    def save(self):
+        with self.lock:
+            try:
+                self.connection.commit()
+            except Exception as ex:
+                log.error('Failed to save person store: {}'.format(ex))
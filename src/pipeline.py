@@ -0,0 +1,268 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import queue
+import logging
+import threading
+
+from src import metrics
+from src.enrollment import get_pool_context
+from src.logger import get_worker_records, init_worker_logger
+
+log = logging.getLogger('fr3onn')
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+DROP_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+_worker_func = None
+
+
+def _init_worker(func, records):
+    # each worker process unpickles the stage function once instead of once per item
+    global _worker_func
+    init_worker_logger(records)
+    _worker_func = func
+
+
+def _call_worker(value):
+    # metrics of the worker process are sent back with the result, so the parent reports them
+    result = _worker_func(value)
+    return result, metrics.registry.take()
+
+
+class Stage:
+    """ Pipeline stage: func is applied to items by workers threads or processes
+
+    Input queue of the stage holds at most queue_size items, drop_policy defines
+    what happens when it is full: block the producer (backpressure), drop the
+    oldest queued item or drop the new one.
+
+    Worker processes are not forked (see get_pool_context), func is pickled once per
+    worker: a module-level function or a method of a picklable object. Its changes to
+    the object stay in the worker, only counters and latencies of metrics.registry come back.
+    """
+
+    def __init__(self, name, func, workers=1, processes=False, queue_size=None, drop_policy=BLOCK):
+        if drop_policy not in DROP_POLICIES:
+            raise Exception('Unknown drop policy {}, expected one of {}'.format(drop_policy, ', '.join(DROP_POLICIES)))
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.processes = processes
+        self.queue = queue.Queue(queue_size or 2 * workers)
+        self.drop_policy = drop_policy
+        self.pool = None
+        self.threads = []
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.busy_time = 0.0
+
+    def start(self, target):
+        if self.processes:
+            self.pool = get_pool_context().Pool(self.workers, initializer=_init_worker,
+                                                initargs=(self.func, get_worker_records()))
+        self.threads = [threading.Thread(target=target, args=(self,), name='{}-{}'.format(self.name, i), daemon=True)
+                        for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if self.pool is not None:
+            # workers are idle once the threads are joined, they exit without losing queued log records
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def run(self, value):
+        if self.pool is not None:
+            result, taken = self.pool.apply(_call_worker, (value,))
+            metrics.registry.merge(taken)
+            return result
+        return self.func(value)
+
+
+class Pipeline:
+    """ Runs items through stages concurrently and returns results in submission order
+
+    Items dropped by a stage or failed with an exception are skipped in the output.
+    """
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.running = False
+        self.condition = threading.Condition()
+        self.results = {}
+        self.next_input = 0
+        self.next_output = 0
+        self.completed = 0
+        self.latency = 0.0
+
+    def start(self):
+        self.running = True
+        for stage in self.stages:
+            stage.start(self.work)
+
+    def stop(self):
+        self.running = False
+        for stage in self.stages:
+            stage.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def put(self, value):
+        """ Submits value to the first stage, returns its sequence number or None if it was dropped """
+        with self.condition:
+            seq = self.next_input
+            self.next_input += 1
+        return seq if self.enqueue(0, (seq, time.time(), value)) else None
+
+    def enqueue(self, index, item):
+        stage = self.stages[index]
+        if stage.drop_policy == BLOCK:
+            while self.running:
+                try:
+                    stage.queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            self.skip(item[0])
+            return False
+        while True:
+            try:
+                stage.queue.put_nowait(item)
+                return True
+            except queue.Full:
+                pass
+            if stage.drop_policy == DROP_NEWEST:
+                stage.dropped += 1
+                self.skip(item[0])
+                return False
+            try:
+                oldest = stage.queue.get_nowait()
+                stage.dropped += 1
+                self.skip(oldest[0])
+            except queue.Empty:
+                pass
+
+    def work(self, stage):
+        index = self.stages.index(stage)
+        while self.running:
+            try:
+                seq, submitted, value = stage.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            start = time.time()
+            try:
+                value = stage.run(value)
+            except Exception as ex:
+                stage.errors += 1
+                log.error('Pipeline stage {} failed on item {}: {}'.format(stage.name, seq, ex))
+                self.skip(seq)
+                continue
+            finally:
+                stage.busy_time += time.time() - start
+            stage.processed += 1
+            if index + 1 < len(self.stages):
+                self.enqueue(index + 1, (seq, submitted, value))
+            else:
+                self.deliver(seq, submitted, value)
+
+    def deliver(self, seq, submitted, value):
+        with self.condition:
+            self.results[seq] = (True, value)
+            self.completed += 1
+            latency = time.time() - submitted
+            self.latency = 0.9 * self.latency + 0.1 * latency if self.latency else latency
+            self.condition.notify_all()
+
+    def skip(self, seq):
+        with self.condition:
+            self.results[seq] = (False, None)
+            self.condition.notify_all()
+
+    def get_ready(self):
+        """ Returns all (seq, result) pairs which are ready in order, does not block """
+        ready = []
+        with self.condition:
+            while self.next_output in self.results:
+                ok, value = self.results.pop(self.next_output)
+                if ok:
+                    ready.append((self.next_output, value))
+                self.next_output += 1
+        return ready
+
+    def get(self, timeout=None):
+        """ Waits for the next result in order, returns (seq, result) or None on timeout """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            while True:
+                while self.next_output in self.results:
+                    ok, value = self.results.pop(self.next_output)
+                    self.next_output += 1
+                    if ok:
+                        return self.next_output - 1, value
+                remaining = None if deadline is None else deadline - time.time()
+                if self.next_output == self.next_input or (remaining is not None and remaining <= 0):
+                    return None
+                self.condition.wait(remaining)
+
+    def flush(self, timeout=None):
+        """ Waits until every submitted item is processed or dropped, returns False on timeout
+
+        Results stay in the pipeline until they are taken by get_ready() or get().
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            # results holds only items from next_output on, so it is complete when its size is the number in flight
+            while len(self.results) < self.next_input - self.next_output:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def get_stats(self):
+        return {'submitted': self.next_input, 'completed': self.completed, 'latency': self.latency,
+                'stages': [{'name': stage.name, 'processed': stage.processed, 'dropped': stage.dropped,
+                            'errors': stage.errors, 'busy_time': stage.busy_time} for stage in self.stages]}
+
+    def log_stats(self):
+        stats = self.get_stats()
+        log.info('Pipeline: {submitted} items submitted, {completed} completed, latency {:.1f} ms.'
+                 .format(stats['latency'] * 1000, **stats))
+        for stage in stats['stages']:
+            log.info('  {name:<8} processed {processed}, dropped {dropped}, errors {errors}, busy {busy_time:.1f} s'
+                     .format(**stage))
@@ -0,0 +1,114 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import logging
+import collections
+import numpy as np
+
+log = logging.getLogger('fr3onn')
+
+
+class RecentIdentities:
+    """ LRU cache of recently granted gallery entries, matched before the whole gallery
+
+    Encodings of cached entries are kept in a small float32 matrix. A face closer than the strict
+    tolerance to one of them is accepted at once, otherwise the whole gallery is matched as usual.
+    The cache is emptied whenever the gallery is changed or replaced, so removed persons are never matched.
+    """
+
+    def __init__(self, capacity=32, tolerance=0.4):
+        self.capacity = capacity
+        self.tolerance = tolerance
+        self.entries = collections.OrderedDict()
+        self.ids = []
+        self.matrix = None
+        self.gallery = None
+        self.version = None
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_time = 0.0
+        self.scans = 0
+        self.scan_time = 0.0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.ids = []
+        self.matrix = None
+
+    def check(self, gallery):
+        if gallery is not self.gallery or gallery.version != self.version:
+            self.clear()
+            self.gallery = gallery
+            self.version = gallery.version
+
+    def lookup(self, encoding, gallery):
+        """ Returns (id, distance) of a cached entry within the strict tolerance or None """
+        start = time.time()
+        self.check(gallery)
+        self.lookups += 1
+        found = None
+        if self.entries:
+            distances = np.linalg.norm(self.matrix - np.asarray(encoding, dtype=np.float32), axis=1)
+            best = int(np.argmin(distances))
+            if distances[best] <= self.tolerance:
+                found = self.ids[best], float(distances[best])
+                self.entries.move_to_end(found[0])
+                self.hits += 1
+        self.lookup_time += time.time() - start
+        return found
+
+    def add_scan(self, elapsed):
+        """ Time of a full gallery match after a miss, used to estimate the time saved by hits """
+        self.scans += 1
+        self.scan_time += elapsed
+
+    def add(self, id_, gallery):
+        self.check(gallery)
+        if id_ in self.entries:
+            self.entries.move_to_end(id_)
+            return
+        if id_ not in gallery:
+            return
+        self.entries[id_] = gallery.get_encoding(id_)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        self.ids = list(self.entries)
+        self.matrix = np.array([self.entries[id_] for id_ in self.ids], dtype=np.float32)
+
+    def get_stats(self):
+        scan_ms = self.scan_time / self.scans * 1000 if self.scans else 0.0
+        return {'size': len(self), 'lookups': self.lookups, 'hits': self.hits,
+                'hit_rate': self.hits / float(self.lookups) * 100 if self.lookups else 0.0,
+                'lookup_ms': self.lookup_time / self.lookups * 1000 if self.lookups else 0.0, 'scan_ms': scan_ms,
+                # misses pay for the lookup on top of the full scan
+                'saved_ms': self.hits * scan_ms - self.lookup_time * 1000}
+
+    def log_stats(self):
+        log.info('  Recent identities: {hits} of {lookups} faces matched from cache ({hit_rate:.0f}%), '
+                 'lookup {lookup_ms:.3f} ms, full match {scan_ms:.3f} ms, {saved_ms:.1f} ms saved.'
+                 .format(**self.get_stats()))
@@ -0,0 +1,126 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import logging
+
+log = logging.getLogger('fr3onn')
+
+
+class CameraScheduler:
+    """ Fair split of recognition capacity between doors
+
+    The next door is the one with a fresh frame which got the least recognition time so far.
+    """
+
+    def __init__(self, doors, poll_interval=0.005):
+        self.doors = doors
+        self.poll_interval = poll_interval
+
+    def next(self):
+        while True:
+            candidates = [door for door in self.doors if door.camera.has_new_frame()]
+            if candidates:
+                return min(candidates, key=lambda door: door.busy_time)
+            time.sleep(self.poll_interval)
+
+
+class FrameScheduler:
+    """ Picks frames of one door to recognize against an end-to-end latency budget
+
+    A face which appears right after a recognition has started waits for the next one, so the worst
+    latency is interval + recognition latency. While a face is present (or was seen within face_hold
+    seconds), frames are recognized back to back; in an empty scene the interval grows to
+    budget - latency, the longest one which still meets the budget. Without a budget every frame is recognized.
+    """
+
+    def __init__(self, name, latency_budget=1.0, face_hold=2.0, smoothing=0.2):
+        self.name = name
+        self.latency_budget = latency_budget
+        self.face_hold = face_hold
+        self.smoothing = smoothing
+        self.latency = 0.0
+        self.last_start = 0.0
+        self.last_face = None
+        self.face_mode = False
+        self.processed = 0
+        self.skipped = 0
+        self.face_frames = 0
+        self.start_time = time.time()
+
+    def is_face_mode(self, now):
+        return self.last_face is not None and now - self.last_face <= self.face_hold
+
+    def get_idle_interval(self):
+        return max(self.latency_budget - self.latency, 0.0) if self.latency_budget is not None else 0.0
+
+    def get_interval(self, now=None):
+        if self.is_face_mode(now or time.time()):
+            return 0.0
+        return self.get_idle_interval()
+
+    def should_process(self, now=None):
+        now = now or time.time()
+        if now - self.last_start >= self.get_interval(now):
+            self.last_start = now
+            return True
+        self.skipped += 1
+        return False
+
+    def update(self, latency, face_present, now=None):
+        """ Called after recognition of a frame with its latency and whether it had a face """
+        now = now or time.time()
+        self.processed += 1
+        self.latency = latency if not self.latency else \
+            (1 - self.smoothing) * self.latency + self.smoothing * latency
+        if face_present:
+            self.last_face = now
+            self.face_frames += 1
+        face_mode = self.is_face_mode(now)
+        if face_mode != self.face_mode:
+            self.face_mode = face_mode
+            if face_mode:
+                log.info('Door {}: face is present, recognizing every frame.'.format(self.name),
+                         extra={'rate_limit': True})
+            else:
+                log.info('Door {}: scene is empty, recognition backs off.'.format(self.name),
+                         extra={'rate_limit': True})
+
+    def get_stats(self):
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        total = self.processed + self.skipped
+        return {'name': self.name, 'processed': self.processed, 'skipped': self.skipped,
+                'share': self.processed / float(total) if total else 0.0, 'fps': self.processed / elapsed,
+                'latency_ms': self.latency * 1000, 'idle_interval_ms': self.get_idle_interval() * 1000,
+                'face_frames': self.face_frames,
+                'over_budget': self.latency_budget is not None and self.latency > self.latency_budget}
+
+    def log_stats(self):
+        stats = self.get_stats()
+        log.info('Door {name} scheduler: {processed} frames recognized, {skipped} skipped ({share:.0%} recognized, '
+                 '{fps:.1f} fps), latency {latency_ms:.1f} ms, idle interval {idle_interval_ms:.0f} ms, '
+                 '{face_frames} frames with a face.'.format(**stats))
+        if stats['over_budget']:
+            log.warning('Recognition latency of door {} exceeds budget of {:.0f} ms.'
+                        .format(self.name, self.latency_budget * 1000))
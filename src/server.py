@@ -0,0 +1,446 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import json
+import time
+import queue
+import signal
+import socket
+import logging
+import argparse
+import threading
+import traceback
+import http.client
+import urllib.parse
+import numpy as np
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from src.lazy import lazy_import
+from src.face_recognition import FaceRecognition
+from src.gallery import STORAGES
+from src.detector import create_detector
+from src.db import DataBase
+from src.enrollment import get_pool_context
+from src.utils import Utils, DefaultHelpParser
+from src.logger import init_logger, get_worker_records, init_worker_logger
+from src import metrics
+
+cv2 = lazy_import('cv2')
+
+log = logging.getLogger('fr3onn')
+
+# --server value which runs the server in the launcher process for testing on one machine
+LOOPBACK = 'loopback'
+
+
+_face_recognition = None
+
+
+def _init_worker(face_recognition, records):
+    # every worker process loads its own detector and encoder models once,
+    # Ctrl+C stops the server, which closes the pool when requests in progress are answered
+    global _face_recognition
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    init_worker_logger(records)
+    _face_recognition = face_recognition
+    _face_recognition.prepare()
+
+
+def _detect_and_encode_in_worker(image, detect):
+    # metrics of the worker process are sent back with the result, so the server reports them
+    return detect_and_encode(_face_recognition, image, detect), metrics.registry.take()
+
+
+def detect_and_encode(face_recognition, image, detect):
+    """ Returns (face_locations, face_location, encodings) of a frame, or of a face crop if detect is False """
+    if not detect:
+        return [], None, face_recognition.encode(image)
+    face_locations = face_recognition.detect(image)
+    face_location = face_recognition.select_face(face_locations, image.shape)
+    return face_locations, face_location, face_recognition.encode(face_recognition.crop(image, face_location))
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Request:
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class RecognitionServer:
+    """ Serves recognition of JPEG frames and face crops over HTTP
+
+    POST /recognize takes a frame, POST /identify takes a face crop, both answer with JSON:
+    boxes, box, match, person, best and distance. Requests are decoded by their own threads,
+    detection and encoding run in a pool of worker processes, each with its own models.
+    With workers=0 they run in the request threads and share one detector and dlib model,
+    so they are serialized by a lock. Encodings of concurrent requests are collected for up
+    to max_wait seconds (or max_batch of them) and matched against the gallery with one matrix product.
+    """
+
+    def __init__(self, face_recognition, get_person_name=None, port=8500, host='127.0.0.1', max_batch=16,
+                 max_wait=0.005, workers=0):
+        self.face_recognition = face_recognition
+        self.get_person_name = get_person_name or DataBase.get_formatted_person_name
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.workers = workers
+        self.pool = None
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.running = False
+        self.batches = 0
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are written separately, Nagle with delayed ACK would add 40 ms to every answer
+            disable_nagle_algorithm = True
+
+            def do_GET(handler):
+                if handler.path == '/health':
+                    handler.send_json({'status': 'ok', 'encodings': len(server.face_recognition.gallery)})
+                elif handler.path == '/stats':
+                    handler.send_json(server.get_stats())
+                else:
+                    handler.send_error(404)
+
+            def do_POST(handler):
+                if handler.path not in ('/recognize', '/identify'):
+                    handler.send_error(404)
+                    return
+                try:
+                    body = handler.rfile.read(int(handler.headers.get('Content-Length', 0)))
+                    image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+                    if image is None:
+                        raise Exception('body is not an image')
+                except Exception as ex:
+                    handler.send_error(400, str(ex))
+                    return
+                try:
+                    handler.send_json(server.recognize(image, handler.path == '/recognize'))
+                except Exception as ex:
+                    log.error('Failed to recognize request: {}'.format(ex))
+                    handler.send_error(500, str(ex))
+
+            def send_json(handler, value):
+                body = json.dumps(value).encode('utf-8')
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'application/json')
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.http_thread = threading.Thread(target=self.server.serve_forever, name='server', daemon=True)
+        self.batch_thread = threading.Thread(target=self.run_batches, name='server-batch', daemon=True)
+
+    def get_url(self):
+        return 'http://{}:{}'.format(*self.server.server_address)
+
+    def start(self):
+        self.running = True
+        if self.workers:
+            # the gallery stays in this process, workers get only the detector
+            self.pool = get_pool_context().Pool(self.workers, initializer=_init_worker,
+                                                initargs=(self.face_recognition.get_detection_copy(),
+                                                          get_worker_records()))
+        self.batch_thread.start()
+        self.http_thread.start()
+        log.info('Recognition server is available on {}, {} detection workers'.format(self.get_url(), self.workers))
+
+    def stop(self):
+        """ Stops serving, requests waiting for a match fail """
+        self.running = False
+        self.queue.put(None)
+        if self.http_thread.is_alive():
+            self.server.shutdown()
+        self.server.server_close()
+        if self.batch_thread.is_alive():
+            self.batch_thread.join()
+        else:
+            self.fail_pending()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def recognize(self, image, detect=True):
+        """ Runs in a request thread: detection and encoding, then waits for the batched match """
+        face_recognition = self.face_recognition
+        result = {'boxes': [], 'box': None, 'match': None, 'person': None, 'best': None, 'distance': None}
+        if self.pool is not None:
+            (face_locations, face_location, encodings), taken = self.pool.apply(_detect_and_encode_in_worker,
+                                                                                (image, detect))
+            metrics.registry.merge(taken)
+        else:
+            with self.lock:
+                face_locations, face_location, encodings = detect_and_encode(face_recognition, image, detect)
+        result['boxes'] = [list(box) for box in face_locations]
+        result['box'] = list(face_location) if face_location is not None else None
+        if not len(encodings):
+            return result
+        request = Request(encodings[0])
+        self.queue.put(request)
+        # a request put after the batch thread has failed the pending ones is not left waiting
+        while not request.done.wait(0.1):
+            if not self.batch_thread.is_alive():
+                self.fail_pending()
+        if request.error is not None:
+            raise Exception(request.error)
+        best, distance = request.result
+        result['best'], result['distance'] = best, distance
+        if best is not None and distance <= face_recognition.tolerance:
+            result['match'] = best
+            result['person'] = self.get_person_name(best)
+        return result
+
+    def run_batches(self):
+        while self.running:
+            request = self.queue.get()
+            if request is None:
+                break
+            batch = [request]
+            deadline = time.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    request = self.queue.get(timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    self.running = False
+                    break
+                batch.append(request)
+            try:
+                with metrics.registry.timer('match'):
+                    # the nearest face is reported even if it is too far to be a match
+                    results = self.face_recognition.gallery.match_batch([r.encoding for r in batch], np.inf)
+            except Exception as ex:
+                log.error('Failed to match batch: {}'.format(ex))
+                results = [(None, None)] * len(batch)
+            self.batches += 1
+            self.requests += len(batch)
+            for request, result in zip(batch, results):
+                request.result = result
+                request.done.set()
+        self.fail_pending()
+
+    def fail_pending(self):
+        """ Releases requests left in the queue when the server is stopped """
+        while True:
+            try:
+                request = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            if request is not None:
+                request.error = 'recognition server is stopped'
+                request.done.set()
+
+    def get_stats(self):
+        return {'batches': self.batches, 'requests': self.requests,
+                'batch_size': self.requests / float(self.batches) if self.batches else 0.0}
+
+    def log_stats(self):
+        log.info('Recognition server: {requests} faces matched in {batches} batches, {batch_size:.1f} per batch.'
+                 .format(**self.get_stats()))
+
+
+class RecognitionClient:
+    """ Door side of the recognition server with recognize() of FaceRecognition
+
+    Sends whole frames, or only face crops if face_recognition is given to detect faces locally.
+    A failed request is logged and treated as no match, so the door stays locked without the server.
+    """
+
+    def __init__(self, url, face_recognition=None, timeout=2.0, jpeg_quality=90):
+        url = urllib.parse.urlparse(url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.face_recognition = face_recognition
+        self.timeout = timeout
+        self.jpeg_quality = jpeg_quality
+        self.connection = None
+        self.tracker = None
+        self.face_present = False
+        self.errors = 0
+
+    def post(self, path, image):
+        ok, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise Exception('unable to encode JPEG')
+        body = jpeg.tobytes()
+        # the connection is kept alive, reconnect once if the server has closed it
+        for attempt in range(2):
+            try:
+                if self.connection is None:
+                    self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                    self.connection.connect()
+                    self.connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.connection.request('POST', path, body, {'Content-Type': 'image/jpeg'})
+                response = self.connection.getresponse()
+                data = response.read()
+                if response.status != 200:
+                    raise Exception('{} {}'.format(response.status, response.reason))
+                return json.loads(data.decode('utf-8'))
+            except (http.client.HTTPException, OSError):
+                if self.connection is not None:
+                    self.connection.close()
+                    self.connection = None
+                if attempt:
+                    raise
+
+    def recognize_detailed(self, frame, depth=None):
+        if self.face_recognition is None:
+            return self.post('/recognize', frame)
+        face_locations = self.face_recognition.detect(frame)
+        face_location = self.face_recognition.select_face(face_locations, frame.shape)
+        # liveness is checked on the door, the server gets only live faces
+        if face_location is None or not self.face_recognition.is_live(frame, depth, face_location):
+            return {'boxes': face_locations, 'box': face_location, 'match': None, 'person': None, 'best': None,
+                    'distance': None}
+        result = self.post('/identify', self.face_recognition.crop(frame, face_location))
+        result['boxes'], result['box'] = face_locations, face_location
+        return result
+
+    def recognize(self, frame, depth=None):
+        """ Returns the name of the matched person or None """
+        try:
+            result = self.recognize_detailed(frame, depth)
+            self.face_present = result['box'] is not None
+            # the person is resolved by the server, the door may have no database of its own
+            return result['person']
+        except Exception as ex:
+            self.face_present = False
+            self.errors += 1
+            log.warning('Recognition server {}:{} failed: {}'.format(self.host, self.port, ex),
+                        extra={'rate_limit': True})
+            return None
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def create_parser():
+    parser = DefaultHelpParser(prog='fr3onn server', description='Recognition server for thin door units',
+                               formatter_class=argparse.RawTextHelpFormatter, add_help=True)
+    parser.add_argument('--host', metavar='HOST', required=False, default='127.0.0.1',
+                        help='Address to listen on, 127.0.0.1 by default (0.0.0.0 to serve LAN)')
+    parser.add_argument('--port', metavar='PORT', required=False, default=8500, type=int,
+                        help='Port to listen on, 8500 by default')
+    parser.add_argument('-d', '--db_dir', metavar='DB_DIR', required=False, default=None,
+                        help='Path to database, <FR3ONN_DIR>/db by default')
+    parser.add_argument('--db_rescan', required=False, action='store_true',
+                        help='Compare database folder with the store: import images copied by hand,\n'
+                             'forget deleted ones and encode changed ones again. Not done on a normal start')
+    parser.add_argument('-w', '--workers', metavar='WORKERS', required=False, default=None, type=int,
+                        help='Number of processes to encode database images, all cores by default')
+    parser.add_argument('-s', '--detection_scale', metavar='DETECTION_SCALE', required=False, default=1.0,
+                        type=float, help='Scale of frame copy used for face detection, 1.0 by default')
+    parser.add_argument('-g', '--detection_grayscale', action='store_true',
+                        help='Detect faces on grayscale copy of frame')
+    parser.add_argument('--detector', metavar='DETECTOR', required=False, default='hog',
+                        help='Face detector: hog (by default), cnn, haar, lbp, dnn\n'
+                             'or two of them cascaded, e.g. haar+hog')
+    parser.add_argument('--cascade_model', metavar='CASCADE_MODEL', required=False, default=None,
+                        help='Path to cascade XML for haar and lbp detectors, OpenCV data by default')
+    parser.add_argument('--dnn_model', metavar='DNN_MODEL', required=False, default=None,
+                        help='Path to model of dnn detector')
+    parser.add_argument('--dnn_config', metavar='DNN_CONFIG', required=False, default=None,
+                        help='Path to config of dnn detector')
+    parser.add_argument('--dnn_confidence', metavar='DNN_CONFIDENCE', required=False, default=0.5, type=float,
+                        help='Minimal confidence of dnn detector, 0.5 by default')
+    parser.add_argument('--gallery_storage', metavar='GALLERY_STORAGE', required=False, default='float32',
+                        choices=STORAGES, help='Storage of known face encodings: float32 (by default), float16 or int8')
+    parser.add_argument('--templates', required=False, action='store_true',
+                        help='Match against per-person templates instead of every image')
+    parser.add_argument('--template_medoids', metavar='TEMPLATE_MEDOIDS', required=False, default=2, type=int,
+                        help='Number of medoids in addition to centroid in a person template, 2 by default')
+    parser.add_argument('--detection_workers', metavar='DETECTION_WORKERS', required=False, default=None, type=int,
+                        help='Number of processes detecting and encoding faces of requests, all cores by default.\n'
+                             '0 runs them one at a time in the server process')
+    parser.add_argument('--max_batch', metavar='MAX_BATCH', required=False, default=16, type=int,
+                        help='Maximal number of faces matched at once, 16 by default')
+    parser.add_argument('--max_wait', metavar='MAX_WAIT', required=False, default=5.0, type=float,
+                        help='Time in ms to wait for other requests to join a batch, 5 by default')
+    parser.add_argument('--stats_interval', metavar='STATS_INTERVAL', required=False, default=60.0, type=float,
+                        help='Interval in seconds of logging of server statistics, 60 by default')
+    return parser
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    utils = Utils()
+    log_folder = os.path.join(os.getcwd(), 'logs', utils.get_formatted_datetime())
+    init_logger(log_folder)
+    server = None
+    try:
+        log.info(utils.line_double)
+        log.info('Face Recognition with 3D imaging, OpenCV and Neural Nets: recognition server')
+        log.info(utils.line_double)
+        log.info('Log folder:  {}'.format(log_folder))
+        log.info(utils.line_double)
+        db = DataBase()
+        db.set_db_dir(args.db_dir)
+        if args.db_rescan:
+            db.rescan()
+        face_recognition = FaceRecognition(detection_scale=args.detection_scale,
+                                           detection_grayscale=args.detection_grayscale,
+                                           gallery_storage=args.gallery_storage,
+                                           detector=create_detector(args.detector, args.cascade_model, args.dnn_model,
+                                                                    args.dnn_config, args.dnn_confidence))
+        face_recognition.prepare()
+        if args.templates:
+            face_recognition.set_templates(args.template_medoids, db.get_person_name)
+        face_recognition.initialize_face_encodings(db.get_all_persons(), db.get_encoding_cache(), args.workers)
+        workers = args.detection_workers if args.detection_workers is not None else os.cpu_count() or 1
+        server = RecognitionServer(face_recognition, db.get_person_name, args.port, args.host, args.max_batch,
+                                   args.max_wait / 1000.0, workers)
+        server.start()
+        while True:
+            time.sleep(args.stats_interval)
+            server.log_stats()
+    except KeyboardInterrupt:
+        log.info('Recognition server was stopped.')
+    except Exception as ex:
+        log.error('Something goes wrong **FAILED**:\n{} '.format(ex))
+        log.error('Error: {}'.format(traceback.format_exc()))
+        return -2
+    finally:
+        if server is not None:
+            server.stop()
+            server.log_stats()
+    return 0
@@ -0,0 +1,117 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import logging
+import numpy as np
+
+from src.ann import kmeans, squared_distances
+
+log = logging.getLogger('fr3onn')
+
+TEMPLATE_PREFIX = 'template:'
+
+
+def get_template_id(name, i):
+    return '{}{}:{}'.format(TEMPLATE_PREFIX, i, name)
+
+
+def get_template_person(template_id):
+    """ Returns person name of a template id or None if the id is an image path """
+    if not template_id.startswith(TEMPLATE_PREFIX):
+        return None
+    return template_id[len(TEMPLATE_PREFIX):].split(':', 1)[1]
+
+
+def build_templates(encodings, medoids=2):
+    """ Centroid of the encodings plus up to medoids samples which represent clusters of them """
+    encodings = np.asarray(encodings, dtype=np.float64)
+    if len(encodings) == 1:
+        return [encodings[0]]
+    templates = [encodings.mean(axis=0)]
+    if medoids >= len(encodings):
+        return templates + list(encodings)
+    if medoids:
+        # e.g. with and without glasses: the nearest sample to each cluster centre is its medoid
+        centroids = kmeans(encodings, medoids)
+        nearest = squared_distances(encodings.astype(np.float32), centroids).argmin(axis=0)
+        templates += [encodings[i] for i in sorted(set(nearest))]
+    return templates
+
+
+class PersonTemplates:
+    """ Raw encodings of every image grouped by person, gallery gets only per-person templates
+
+    One person with many images costs 1 + medoids comparisons per frame instead of one per image.
+    """
+
+    def __init__(self, get_person_name, medoids=2):
+        self.get_person_name = get_person_name
+        self.medoids = medoids
+        self.encodings = {}
+        self.persons = {}
+
+    def __len__(self):
+        return len(self.encodings)
+
+    def add(self, image, encoding):
+        """ Returns names of persons whose templates have to be rebuilt """
+        names = {self.remove(image)}
+        name = self.get_person_name(image)
+        self.persons[image] = name
+        self.encodings.setdefault(name, {})[image] = np.asarray(encoding)
+        names.add(name)
+        names.discard(None)
+        return names
+
+    def remove(self, image):
+        name = self.persons.pop(image, None)
+        if name is not None:
+            del self.encodings[name][image]
+            if not self.encodings[name]:
+                del self.encodings[name]
+        return name
+
+    def clear(self):
+        self.encodings = {}
+        self.persons = {}
+
+    def get_templates(self, name):
+        """ Returns (ids, encodings) of templates of the person, nothing if the person has no images """
+        encodings = self.encodings.get(name)
+        if not encodings:
+            return [], []
+        templates = build_templates(list(encodings.values()), self.medoids)
+        return [get_template_id(name, i) for i in range(len(templates))], templates
+
+    def update_gallery(self, gallery, names):
+        """ Replaces templates of names in gallery """
+        for name in names:
+            i = 0
+            while gallery.remove(get_template_id(name, i)):
+                i += 1
+            ids, templates = self.get_templates(name)
+            gallery.extend(ids, templates)
+
+    def get_persons(self):
+        return list(self.encodings)
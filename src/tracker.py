@@ -0,0 +1,145 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import logging
+
+log = logging.getLogger('fr3onn')
+
+
+def iou(a, b):
+    """ Intersection over union of two (top, right, bottom, left) boxes """
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    union = (a[1] - a[3]) * (a[2] - a[0]) + (b[1] - b[3]) * (b[2] - b[0]) - intersection
+    return intersection / float(union) if union > 0 else 0.0
+
+
+class Track:
+    def __init__(self, track_id, box, now):
+        self.track_id = track_id
+        self.box = box
+        self.identity = None
+        self.verified_at = None
+        self.missed = 0
+        self.hits = 1
+        self.created_at = now
+        # missed or jumped since the last encoding: it may be another person now
+        self.suspect = False
+
+
+class FaceTracker:
+    """ Associates face boxes of consecutive frames by IoU and carries identity forward
+
+    A track needs encoding when it is new, when verify_interval seconds passed since the last
+    encoding, or retry_interval seconds for tracks which were not recognized. A track is lost
+    after max_missed frames without a matching box. Identity is not carried over a frame where
+    the track was missed, or where its box moved or changed size by more than max_jump of its size:
+    another person may have stepped into the box, so the face is encoded again.
+    """
+
+    def __init__(self, verify_interval=2.0, retry_interval=0.5, iou_threshold=0.3, max_missed=5, max_jump=0.25):
+        self.verify_interval = verify_interval
+        self.retry_interval = retry_interval
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.max_jump = max_jump
+        self.tracks = []
+        self.next_track_id = 0
+        self.frames = 0
+        self.encodes = 0
+        self.encodes_saved = 0
+        self.encodes_forced = 0
+        self.tracks_created = 0
+        self.tracks_lost = 0
+
+    def update(self, boxes, now=None):
+        """ Matches boxes of the current frame with tracks, returns list of tracks in the same order """
+        now = time.time() if now is None else now
+        self.frames += 1
+        matched = []
+        free = list(self.tracks)
+        for box in boxes:
+            best = max(free, key=lambda track: iou(track.box, box), default=None)
+            if best is not None and iou(best.box, box) >= self.iou_threshold:
+                free.remove(best)
+                if best.missed or self.is_jump(best.box, box):
+                    best.suspect = True
+                best.box = box
+                best.missed = 0
+                best.hits += 1
+                matched.append(best)
+            else:
+                track = Track(self.next_track_id, box, now)
+                self.next_track_id += 1
+                self.tracks_created += 1
+                self.tracks.append(track)
+                matched.append(track)
+        for track in free:
+            track.missed += 1
+            if track.missed > self.max_missed:
+                self.tracks.remove(track)
+                self.tracks_lost += 1
+        return matched
+
+    def is_jump(self, previous, box):
+        """ Whether box moved or changed size too much since the previous frame to be the same face """
+        previous_height, previous_width = max(previous[2] - previous[0], 1), max(previous[1] - previous[3], 1)
+        height, width = box[2] - box[0], box[1] - box[3]
+        if abs(height - previous_height) > self.max_jump * previous_height or \
+                abs(width - previous_width) > self.max_jump * previous_width:
+            return True
+        shift_y = abs(box[0] + box[2] - previous[0] - previous[2]) / 2.0
+        shift_x = abs(box[1] + box[3] - previous[1] - previous[3]) / 2.0
+        return max(shift_y, shift_x) > self.max_jump * max(previous_height, previous_width)
+
+    def needs_encoding(self, track, now=None):
+        now = time.time() if now is None else now
+        if track.verified_at is None:
+            return True
+        if track.suspect:
+            self.encodes_forced += 1
+            return True
+        interval = self.verify_interval if track.identity is not None else self.retry_interval
+        if now - track.verified_at >= interval:
+            return True
+        self.encodes_saved += 1
+        return False
+
+    def set_identity(self, track, identity, now=None):
+        track.identity = identity
+        track.suspect = False
+        track.verified_at = time.time() if now is None else now
+        self.encodes += 1
+
+    def get_stats(self):
+        return {'frames': self.frames, 'encodes': self.encodes, 'encodes_saved': self.encodes_saved,
+                'encodes_forced': self.encodes_forced, 'tracks_created': self.tracks_created,
+                'tracks_lost': self.tracks_lost, 'tracks_active': len(self.tracks)}
+
+    def log_stats(self):
+        log.info('Tracker: {frames} frames, {tracks_created} tracks created, {tracks_lost} lost, '
+                 '{encodes} encodes done, {encodes_saved} saved, {encodes_forced} forced by a missed or jumped box.'
+                 .format(**self.get_stats()))
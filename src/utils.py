@@ -22,9 +22,20 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import argparse
 import datetime
 import os
 import re
+import sys
+
+
+class DefaultHelpParser(argparse.ArgumentParser):
+    # Display help message in case of error
+    # http://stackoverflow.com/questions/4042452/display-help-message-with-python-argparse-when-script-is-called-without-any-argu
+    def error(self, message):
+        sys.stderr.write('error: %s\n' % message)
+        self.print_help()
+        sys.exit(-2)
 
 
 class Utils:
@@ -0,0 +1,260 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import re
+import time
+import logging
+import threading
+
+from src.person_store import IMAGE_PATTERN
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+log = logging.getLogger('fr3onn')
+
+
+class DatabaseWatcher:
+    """ Keeps the gallery in sync with the database folder while recognition is running
+
+    Changes are detected with inotify (inotify_simple package) or, without it, by polling
+    mtimes of the folders every interval seconds: only folders whose entries were added, removed
+    or renamed are listed and their images are compared by size and mtime. An image overwritten
+    in place does not change its folder, so every full_scan_interval seconds all images are
+    compared. New and changed images are encoded,
+    removed ones are evicted, then a copy of the gallery with the changes is swapped into
+    every FaceRecognition at once, so a running recognize never sees a half-updated gallery.
+    """
+
+    def __init__(self, db, face_recognitions, interval=2.0, settle_time=1.0, workers=None, use_inotify=True,
+                 full_scan_interval=60.0):
+        self.db = db
+        self.face_recognitions = face_recognitions
+        self.interval = interval
+        self.full_scan_interval = full_scan_interval
+        self.last_full_scan = 0.0
+        # copying of large files produces a series of events, wait for quiet before syncing
+        self.settle_time = settle_time
+        self.workers = workers
+        self.use_inotify = use_inotify and inotify_simple is not None
+        self.files = {}
+        # mtimes of the database folder and its subfolders, polling lists only the changed ones
+        self.folders = {}
+        self.inotify = None
+        self.watches = {}
+        self.pending = set()
+        self.full_scan = False
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+        self.syncs = 0
+        self.added = 0
+        self.removed = 0
+
+    @staticmethod
+    def is_image(path):
+        return re.match(IMAGE_PATTERN, os.path.basename(path), re.I) is not None
+
+    @staticmethod
+    def get_stat(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime
+
+    @staticmethod
+    def get_mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def scan(self):
+        self.folders = {}
+        self.last_full_scan = time.time()
+        files = {}
+        for path in self.list_folder(self.db.get_db_dir()):
+            stat = self.get_stat(path)
+            if stat is not None:
+                files[path] = stat
+        return files
+
+    def list_folder(self, folder):
+        """ Images of folder and of its new subfolders, mtimes of the folders are remembered """
+        # mtime is taken before listing, so an entry added meanwhile changes the folder once again
+        mtime = self.get_mtime(folder)
+        if mtime is None:
+            self.folders.pop(folder, None)
+            return set()
+        self.folders[folder] = mtime
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            return set()
+        paths = set()
+        for entry in entries:
+            if entry.is_dir():
+                if entry.path not in self.folders:
+                    paths |= self.list_folder(entry.path)
+            elif self.is_image(entry.path):
+                paths.add(entry.path)
+        return paths
+
+    def get_changed_files(self):
+        """ Polling: images of the folders whose mtime has changed, known ones included to find deleted images """
+        paths = set()
+        for folder, mtime in list(self.folders.items()):
+            if self.get_mtime(folder) == mtime:
+                continue
+            paths |= self.list_folder(folder)
+            paths |= set(path for path in self.files if os.path.dirname(path) == folder)
+        return paths
+
+    def start(self, paths):
+        """ paths are the images the gallery was initialized from """
+        if self.thread is not None:
+            return
+        self.files = {}
+        for path in paths:
+            stat = self.get_stat(path)
+            if stat is not None:
+                self.files[path] = stat
+        if self.use_inotify:
+            try:
+                self.inotify = inotify_simple.INotify()
+                for root, dir_names, file_names in os.walk(self.db.get_db_dir()):
+                    self.add_watch(root)
+            except Exception as ex:
+                log.warning('inotify is not available, database folder will be polled: {}'.format(ex))
+                self.inotify = None
+        self.running = True
+        # anything added between initialization and start is picked up by the first scan
+        self.full_scan = True
+        self.thread = threading.Thread(target=self.run, name='db-watcher', daemon=True)
+        self.thread.start()
+        log.info('Watching database folder {} ({}).'
+                 .format(self.db.get_db_dir(), 'inotify' if self.inotify is not None else
+                         'polling every {} s'.format(self.interval)))
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+    def request_sync(self):
+        """ Makes the watcher rescan the folder now, e.g. after the launcher added an image """
+        self.full_scan = True
+        self.wakeup.set()
+
+    def add_watch(self, path):
+        flags = inotify_simple.flags
+        mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM | flags.DELETE | flags.CREATE
+        self.watches[self.inotify.add_watch(path, mask)] = path
+
+    def read_events(self, timeout):
+        """ Collects changed paths from inotify events, returns True if there were any """
+        events = self.inotify.read(timeout=int(timeout * 1000))
+        for event in events:
+            root = self.watches.get(event.wd)
+            if root is None:
+                continue
+            path = os.path.join(root, event.name)
+            if event.mask & inotify_simple.flags.ISDIR:
+                # folders moved or created with files in them: rescan everything
+                if event.mask & inotify_simple.flags.CREATE and os.path.isdir(path):
+                    self.add_watch(path)
+                self.full_scan = True
+            elif self.is_image(path):
+                self.pending.add(path)
+        return bool(events)
+
+    def run(self):
+        while self.running:
+            try:
+                if self.inotify is not None:
+                    if self.read_events(self.interval):
+                        while self.running and self.read_events(self.settle_time):
+                            pass
+                else:
+                    self.wakeup.wait(self.interval)
+                    if time.time() - self.last_full_scan >= self.full_scan_interval:
+                        self.full_scan = True
+                    elif not self.full_scan:
+                        self.pending |= self.get_changed_files()
+                self.wakeup.clear()
+                if self.running and (self.full_scan or self.pending):
+                    self.sync()
+            except Exception as ex:
+                log.error('Failed to update database from folder: {}'.format(ex))
+                time.sleep(self.interval)
+
+    def sync(self):
+        if self.full_scan:
+            self.full_scan = False
+            self.pending = set()
+            files = self.scan()
+            paths = set(files) | set(self.files)
+        else:
+            paths, self.pending = self.pending, set()
+            files = {path: self.get_stat(path) for path in paths}
+        added = sorted(path for path in paths if files.get(path) is not None and files[path] != self.files.get(path))
+        removed = sorted(path for path in paths if files.get(path) is None and path in self.files)
+        if not added and not removed:
+            return
+        self.apply(added, removed)
+        for path in removed:
+            del self.files[path]
+        for path in added:
+            self.files[path] = files[path]
+
+    def apply(self, added, removed):
+        started = time.time()
+        store = self.db.store
+        for path in removed:
+            store.remove_image(path)
+        for path in added:
+            store.add_image(store.parse_person_name(path), path)
+        face_recognition = self.face_recognitions[0]
+        encodings = face_recognition.get_encodings(added, self.workers) if added else []
+        face_recognition.publish_gallery(added, encodings, removed, self.face_recognitions)
+        gallery = face_recognition.gallery
+        store.save()
+        self.syncs += 1
+        self.added += len(added)
+        self.removed += len(removed)
+        log.info('Database was updated in {:.1f} s: {} images added or changed, {} removed, {} encodings in gallery.'
+                 .format(time.time() - started, len(added), len(removed), len(gallery)))
+
+    def log_stats(self):
+        log.info('Database watcher: {} updates, {} images added or changed, {} removed.'
+                 .format(self.syncs, self.added, self.removed))
@@ -0,0 +1,63 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import sys
+import types
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.detector import Detector  # noqa: E402
+
+FACE_BOX = (100, 300, 300, 100)
+
+
+class FixedDetector(Detector):
+    """ Finds the same face box on every frame, no dlib or OpenCV models are needed """
+    name = 'fixed'
+
+    def __init__(self, boxes=(FACE_BOX,)):
+        Detector.__init__(self)
+        self.boxes = list(boxes)
+
+    def find(self, image):
+        return list(self.boxes)
+
+
+def encode_mean(face_crop, known_face_locations=None, num_jitters=1):
+    """ Encoding of a crop is its mean brightness in every dimension, so test frames choose their person """
+    return [np.full(128, face_crop.mean() / 255.0)]
+
+
+@pytest.fixture
+def fake_encoder(monkeypatch):
+    """ Replaces face_recognition module used by FaceRecognition.encode """
+    from src import face_recognition as module
+    monkeypatch.setattr(module, 'face_recognition', types.SimpleNamespace(face_encodings=encode_mean))
+
+
+def make_frame(brightness, shape=(480, 640, 3)):
+    return np.full(shape, brightness, dtype=np.uint8)
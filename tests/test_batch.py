@@ -0,0 +1,86 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import json
+import multiprocessing
+import numpy as np
+import pytest
+
+from conftest import FixedDetector, make_frame
+from src import batch
+from src.batch import BatchProcessor
+from src.face_recognition import FaceRecognition
+
+
+@pytest.fixture
+def processor(monkeypatch, fake_encoder):
+    # forked workers inherit the fake encoder
+    monkeypatch.setattr(batch, 'get_pool_context', lambda: multiprocessing.get_context('fork'))
+    face_recognition = FaceRecognition(detector=FixedDetector())
+    face_recognition.gallery.extend(['db/Alice.jpg', 'db/Bob.jpg'],
+                                    [np.full(128, 64 / 255.0), np.full(128, 192 / 255.0)])
+    return face_recognition
+
+
+def read_results(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_image_folder_results_are_written_in_order(processor, tmp_path):
+    cv2 = pytest.importorskip('cv2')
+    folder = tmp_path / 'images'
+    os.makedirs(str(folder))
+    for i, brightness in enumerate([64, 192, 128, 64, 192]):
+        cv2.imwrite(str(folder / '{:02d}.png'.format(i)), make_frame(brightness))
+    output = str(tmp_path / 'results.jsonl')
+    summary = BatchProcessor(processor, workers=2, chunk_size=2).run([str(folder)], output)
+    results = read_results(output)
+    assert [os.path.basename(result['source']) for result in results] == ['00.png', '01.png', '02.png', '03.png',
+                                                                         '04.png']
+    assert [result['person'] for result in results] == ['Alice', 'Bob', None, 'Alice', 'Bob']
+    assert results[2]['best'] is not None and results[2]['distance'] > processor.tolerance
+    assert results[0]['box'] == [100, 300, 300, 100]
+    assert summary['frames'] == 5
+    assert summary['matches'] == 4
+    assert summary['errors'] == 0
+
+
+def test_video_frames_are_split_into_chunks_by_step(processor, tmp_path):
+    cv2 = pytest.importorskip('cv2')
+    path = str(tmp_path / 'door.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10.0, (640, 480))
+    if not writer.isOpened():
+        pytest.skip('OpenCV can not write MJPG video')
+    for i in range(10):
+        writer.write(make_frame(64 if i < 5 else 192))
+    writer.release()
+    output = str(tmp_path / 'results.jsonl')
+    summary = BatchProcessor(processor, workers=2, step=2, chunk_size=2).run([path], output)
+    results = read_results(output)
+    assert [result['frame'] for result in results] == [0, 2, 4, 6, 8]
+    assert [result['person'] for result in results] == ['Alice'] * 3 + ['Bob'] * 2
+    assert results[1]['timestamp'] == pytest.approx(0.2)
+    assert summary['frames'] == 5
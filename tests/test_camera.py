@@ -0,0 +1,91 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import threading
+import numpy as np
+
+from src.camera import Camera
+
+
+class FakeCapture:
+    """ Frames 1..count, each filled with its number, delivered at fps; then the stream ends """
+
+    def __init__(self, count, fps=200.0):
+        self.count = count
+        self.interval = 1.0 / fps
+        self.frames = 0
+        self.finished = threading.Event()
+
+    def read(self):
+        time.sleep(self.interval)
+        if self.frames == self.count:
+            self.finished.set()
+            return False, None
+        self.frames += 1
+        return True, np.full((4, 4, 3), self.frames, dtype=np.uint8)
+
+    def release(self):
+        pass
+
+
+def create_camera(capture):
+    camera = Camera(threaded=True, lazy=True)
+    camera.cam = capture
+    camera.start()
+    return camera
+
+
+def test_consumer_gets_the_freshest_frame():
+    capture = FakeCapture(40)
+    camera = create_camera(capture)
+    try:
+        frame, timestamp, sequence = camera.get_frame_info()
+        assert frame[0, 0, 0] == sequence
+        # recognition is slower than capture: frames captured meanwhile are dropped
+        time.sleep(0.05)
+        frame, next_timestamp, next_sequence = camera.get_frame_info()
+        assert next_sequence > sequence + 1
+        assert frame[0, 0, 0] == next_sequence
+        assert next_timestamp > timestamp
+        assert camera.dropped_frames == next_sequence - sequence - 1
+        assert capture.finished.wait(5.0)
+        # the end of the stream is the freshest frame
+        assert camera.get_frame() is None
+        stats = camera.get_stats()
+        assert stats['captured'] == 41
+        assert stats['fps'] > 0
+    finally:
+        camera.stop()
+
+
+def test_get_frame_waits_for_a_new_frame():
+    camera = create_camera(FakeCapture(3, fps=10.0))
+    try:
+        sequences = [camera.get_frame_info()[2] for _ in range(3)]
+        assert sequences == [1, 2, 3]
+        assert camera.dropped_frames == 0
+        assert camera.get_frame() is None
+    finally:
+        camera.stop()
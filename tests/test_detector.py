@@ -0,0 +1,123 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import pickle
+import numpy as np
+import pytest
+
+from conftest import FixedDetector, FACE_BOX, make_frame
+from src import detector
+from src.detector import CascadedDetector, CascadeDetector, DlibDetector, DnnDetector, create_detector, \
+    is_valid_detector
+
+
+class ModelDetector(FixedDetector):
+    """ Counts model loads """
+    loads = 0
+
+    def load(self):
+        ModelDetector.loads += 1
+        return object()
+
+
+class CropDetector(FixedDetector):
+    """ Records the regions it was given and finds a face in the middle of each one """
+
+    def __init__(self):
+        FixedDetector.__init__(self)
+        self.regions = []
+
+    def find(self, image):
+        self.regions.append(image.shape[:2])
+        height, width = image.shape[:2]
+        return [(height // 4, width * 3 // 4, height * 3 // 4, width // 4)]
+
+
+def test_create_detector():
+    assert isinstance(create_detector('hog'), DlibDetector)
+    assert create_detector('cnn').name == 'cnn'
+    assert isinstance(create_detector('lbp'), CascadeDetector)
+    assert isinstance(create_detector('dnn', dnn_model='face.caffemodel'), DnnDetector)
+    cascaded = create_detector('haar+hog')
+    assert isinstance(cascaded, CascadedDetector)
+    assert cascaded.name == 'haar+hog'
+    with pytest.raises(Exception):
+        create_detector('mtcnn')
+
+
+def test_valid_detector_names():
+    assert is_valid_detector('hog')
+    assert is_valid_detector('haar+cnn')
+    assert not is_valid_detector('haar+hog+cnn')
+    assert not is_valid_detector('mtcnn')
+
+
+def test_dnn_detector_needs_a_model():
+    with pytest.raises(Exception, match='--dnn_model'):
+        DnnDetector(None).prepare()
+
+
+def test_model_is_loaded_once_and_not_pickled():
+    ModelDetector.loads = 0
+    model_detector = ModelDetector()
+    model_detector.prepare()
+    model_detector.prepare()
+    assert ModelDetector.loads == 1
+    copy = pickle.loads(pickle.dumps(model_detector))
+    assert copy.model is None
+    copy.prepare()
+    assert ModelDetector.loads == 2
+
+
+def test_stats():
+    fixed = FixedDetector([FACE_BOX, (0, 50, 50, 0)])
+    fixed.detect(make_frame(0))
+    fixed.detect(make_frame(0))
+    stats = fixed.get_stats()
+    assert stats['frames'] == 2
+    assert stats['faces'] == 4
+
+
+def test_cascaded_detector_verifies_proposals(monkeypatch):
+    monkeypatch.setattr(detector, 'cv2', pytest.importorskip('cv2'))
+    proposer = FixedDetector([(100, 140, 140, 100), (300, 560, 400, 460), (102, 142, 142, 102)])
+    verifier = CropDetector()
+    cascaded = CascadedDetector(proposer, verifier, margin=0.25, min_size=96)
+    boxes = cascaded.detect(make_frame(0))
+    # small regions are upscaled for the verifier
+    assert all(min(region) >= 96 for region in verifier.regions)
+    assert len(verifier.regions) == 3
+    # the third proposal is the same face as the first one
+    assert len(boxes) == 2
+    # the middle half of the region 90..150 found on its upscaled copy, in frame coordinates
+    top, right, bottom, left = boxes[0]
+    assert abs(top - 105) <= 1 and abs(right - 135) <= 1 and abs(bottom - 135) <= 1 and abs(left - 105) <= 1
+    assert cascaded.get_stats()['proposals'] == 3
+
+
+def test_cascaded_detector_rejects_regions_without_face():
+    proposer = FixedDetector([(0, 200, 200, 0)])
+    cascaded = CascadedDetector(proposer, FixedDetector([]))
+    assert cascaded.detect(np.zeros((200, 200, 3), dtype=np.uint8)) == []
+    assert cascaded.get_stats()['rejected'] == 1
@@ -0,0 +1,75 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import types
+import multiprocessing
+import numpy as np
+
+from src import enrollment
+
+
+def load_image_file(image):
+    if 'broken' in image:
+        raise IOError('cannot identify image file {}'.format(image))
+    index = int(image.split('-')[1].split('.')[0])
+    # later images finish first, so results arrive out of order
+    time.sleep(0.001 * (20 - index))
+    return np.full((4, 4, 3), index, dtype=np.uint8)
+
+
+def face_encodings(face):
+    index = int(face[0, 0, 0])
+    # every fifth image has no face
+    return [np.full(128, index / 100.0)] if index % 5 else []
+
+
+def use_fake_face_recognition(monkeypatch):
+    monkeypatch.setattr(enrollment, 'face_recognition',
+                        types.SimpleNamespace(load_image_file=load_image_file, face_encodings=face_encodings))
+    # forked workers inherit the fake module
+    monkeypatch.setattr(enrollment, 'get_pool_context', lambda: multiprocessing.get_context('fork'))
+
+
+def test_results_keep_order_of_images(monkeypatch):
+    use_fake_face_recognition(monkeypatch)
+    images = ['db/person-{}.jpg'.format(i) for i in range(20)]
+    for workers in (1, 4):
+        results = enrollment.encode_images(images, workers)
+        assert [error for _, error in results] == [None] * 20
+        for i, (encoding, _) in enumerate(results):
+            if i % 5:
+                assert encoding[0] == i / 100.0
+            else:
+                assert encoding is None
+
+
+def test_broken_image_does_not_abort_encoding(monkeypatch):
+    use_fake_face_recognition(monkeypatch)
+    images = ['db/person-1.jpg', 'db/broken-2.jpg', 'db/person-3.jpg']
+    results = enrollment.encode_images(images, workers=2)
+    assert results[0][0][0] == 0.01
+    assert results[1] == (None, 'cannot identify image file db/broken-2.jpg')
+    assert results[2][0][0] == 0.03
+    assert enrollment.encode_images([], workers=2) == []
@@ -0,0 +1,76 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+import pytest
+
+from conftest import FixedDetector, make_frame
+from src.face_recognition import FaceRecognition
+
+
+class RecordingDetector(FixedDetector):
+    """ Finds the same boxes on every image and remembers the shape of the image it got """
+
+    def find(self, image):
+        self.shape = image.shape
+        return FixedDetector.find(self, image)
+
+
+def test_boxes_found_on_a_downscaled_copy_are_mapped_back():
+    pytest.importorskip('cv2')
+    detector = RecordingDetector([(50, 150, 150, 50), (200, 330, 245, 310)])
+    face_recognition = FaceRecognition(detection_scale=0.5, detection_grayscale=True, detector=detector)
+    frame = make_frame(128)
+    assert face_recognition.detect(frame) == [(100, 300, 300, 100), (400, 640, 480, 620)]
+    assert detector.shape == (240, 320)
+    # the face is encoded on the crop of the full resolution frame
+    assert face_recognition.get_face_crop(frame).shape == (200, 200, 3)
+
+
+def test_face_closest_to_the_centre_is_selected_in_original_pixels():
+    frame_shape = (480, 640, 3)
+    # 80 px left of the centre vs 60 px above it: x and y are not swapped
+    left = (200, 280, 280, 200)
+    above = (140, 360, 220, 280)
+    assert FaceRecognition.select_face([left, above], frame_shape) == above
+    assert FaceRecognition.select_face([above, left], frame_shape) == above
+    # faces of at most 64 x 64 pixels are ignored
+    assert FaceRecognition.select_face([(220, 352, 284, 288)], frame_shape) is None
+    assert FaceRecognition.select_face([(220, 353, 285, 288), left], frame_shape) == (220, 353, 285, 288)
+
+
+def test_new_face_is_published_in_a_new_gallery(monkeypatch):
+    face_recognition = FaceRecognition(detector=FixedDetector())
+    face_recognition.gallery.extend(['db/Alice.jpg'], [np.full(128, 0.25)])
+    door = FaceRecognition(gallery=face_recognition.gallery, detector=FixedDetector())
+    monkeypatch.setattr(face_recognition, 'get_encoding', lambda image: np.full(128, 0.75))
+    gallery = face_recognition.gallery
+    face_recognition.add_new_face_encodings(['db/Bob.jpg'], [face_recognition, door])
+    # recognition in progress keeps matching against the gallery it has started with
+    assert gallery.get_ids() == ['db/Alice.jpg']
+    assert face_recognition.gallery is not gallery
+    assert door.gallery is face_recognition.gallery
+    assert face_recognition.gallery.get_ids() == ['db/Alice.jpg', 'db/Bob.jpg']
+    face_recognition.remove_face_encoding('db/Alice.jpg', [door])
+    assert door.gallery.get_ids() == ['db/Bob.jpg']
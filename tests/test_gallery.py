@@ -0,0 +1,184 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+
+import numpy as np
+
+from src.ann import IVFIndex
+from src.gallery import Gallery, STORAGES
+from src.templates import PersonTemplates
+
+
+def create_encodings(people, samples, seed=0):
+    """ Encodings spread like dlib ones: within +-0.3, samples of a person close to each other """
+    rng = np.random.RandomState(seed)
+    centers = rng.uniform(-0.25, 0.25, size=(people, Gallery.ENCODING_SIZE))
+    return centers.repeat(samples, axis=0) + rng.normal(scale=0.01, size=(people * samples, Gallery.ENCODING_SIZE))
+
+
+def test_quantized_distances_are_close_to_float32():
+    encodings = create_encodings(20, 1)
+    queries = encodings + np.random.RandomState(1).normal(scale=0.01, size=encodings.shape)
+    reference = Gallery()
+    reference.extend(list(range(len(encodings))), encodings)
+    for storage in STORAGES:
+        gallery = Gallery(storage=storage)
+        gallery.extend(list(range(len(encodings))), encodings)
+        for query in queries:
+            assert np.allclose(gallery.distances(query), reference.distances(query), atol=0.02)
+
+
+def test_int8_gallery_enrolled_one_by_one():
+    encodings = create_encodings(10, 1)
+    float32, int8 = Gallery(), Gallery(storage='int8')
+    # an empty database: the first person alone must not define quantization of the next ones
+    for i, encoding in enumerate(encodings):
+        float32.extend([i], [encoding])
+        int8.extend([i], [encoding])
+    for i, encoding in enumerate(encodings):
+        query = encoding + 0.01
+        assert int8.match(query, 0.6)[0][0] == i
+        assert abs(int8.distances(query)[i] - float32.distances(query)[i]) < 0.02
+
+
+def test_int8_values_beyond_half_are_not_clipped():
+    encodings = create_encodings(10, 1)
+    encodings[:, 0] = np.linspace(0.1, 0.9, len(encodings))
+    float32, int8 = Gallery(), Gallery(storage='int8')
+    float32.extend(list(range(5)), encodings[:5])
+    int8.extend(list(range(5)), encodings[:5])
+    scale = int8.scale[0]
+    # enrolled later with larger values of the first dimension: its scale is widened
+    for i, encoding in enumerate(encodings[5:], 5):
+        float32.append(i, encoding)
+        int8.append(i, encoding)
+    assert scale * 127 < 0.9 <= int8.scale[0] * 127
+    assert np.abs(int8.get_encodings() - encodings).max() < 0.01
+    for i, encoding in enumerate(encodings):
+        assert int8.match(encoding, 0.6)[0][0] == i
+        assert abs(int8.distances(encoding + 0.01)[i] - float32.distances(encoding + 0.01)[i]) < 0.02
+
+
+def test_int8_templates_added_person_by_person():
+    encodings = create_encodings(5, 3)
+    images = ['{}-{}.jpg'.format(i // 3, i) for i in range(len(encodings))]
+    galleries = {}
+    for storage in ('float32', 'int8'):
+        # templates put encodings of one person to the gallery at a time
+        templates = PersonTemplates(lambda image: image.split('-')[0], medoids=1)
+        gallery = Gallery(storage=storage)
+        for image, encoding in zip(images, encodings):
+            templates.update_gallery(gallery, sorted(templates.add(image, encoding)))
+        galleries[storage] = gallery
+    for encoding in encodings:
+        exact = galleries['float32'].match(encoding, 0.6)[0]
+        quantized = galleries['int8'].match(encoding, 0.6)[0]
+        assert quantized[0] == exact[0]
+        assert abs(quantized[1] - exact[1]) < 0.02
+
+
+def test_removed_ids_are_not_matched():
+    encodings = create_encodings(100, 1)
+    gallery = Gallery(capacity=4)
+    gallery.extend(list(range(100)), encodings)
+    for i in range(0, 100, 2):
+        assert gallery.remove(i)
+    assert not gallery.remove(0)
+    assert len(gallery) == 50
+    gallery.compact()
+    assert gallery.size == 50
+    assert gallery.get_ids() == list(range(1, 100, 2))
+    for i in range(100):
+        matches = [id_ for id_, _ in gallery.match(encodings[i], 0.6, k=3)]
+        assert (i in matches) == (i % 2 == 1)
+    assert np.allclose(gallery.get_encoding(51), encodings[51], atol=1e-6)
+
+
+def test_match_batch_is_the_same_as_match():
+    encodings = create_encodings(30, 2)
+    gallery = Gallery()
+    gallery.extend(list(range(len(encodings))), encodings)
+    gallery.remove(3)
+    queries = list(encodings + 0.005) + [np.full(128, 0.4)]
+    batch = gallery.match_batch(queries, 0.6)
+    assert batch[-1] == (None, None)
+    for query, (id_, distance) in zip(queries[:-1], batch):
+        expected_id, expected_distance = gallery.best_match(query, 0.6)
+        assert id_ == expected_id
+        assert abs(distance - expected_distance) < 1e-4
+
+
+def test_version_changes_with_every_update():
+    gallery = Gallery()
+    versions = [gallery.version]
+    gallery.extend(['a', 'b'], create_encodings(2, 1))
+    versions.append(gallery.version)
+    gallery.remove('a')
+    versions.append(gallery.version)
+    gallery.clear()
+    versions.append(gallery.version)
+    assert len(set(versions)) == len(versions)
+
+
+def test_ivf_index_with_all_cells_probed_is_exact():
+    encodings = create_encodings(300, 2)
+    gallery = Gallery()
+    gallery.extend(list(range(len(encodings))), encodings)
+    queries = encodings[::7] + 0.005
+    exact = [gallery.best_match(query, 0.6) for query in queries]
+    gallery.set_index(IVFIndex(nlist=16, nprobe=16))
+    assert gallery.index.is_trained()
+    assert [gallery.best_match(query, 0.6)[0] for query in queries] == [id_ for id_, _ in exact]
+
+
+def test_ivf_index_follows_gallery_updates():
+    encodings = create_encodings(200, 1)
+    gallery = Gallery()
+    gallery.extend(list(range(150)), encodings[:150])
+    gallery.set_index(IVFIndex(nlist=8, nprobe=2))
+    # added after the index was built, removed ones are never returned
+    gallery.extend(list(range(150, 200)), encodings[150:])
+    for i in range(0, 200, 3):
+        gallery.remove(i)
+    found = sum(gallery.best_match(encodings[i], 0.6)[0] == i for i in range(200) if i % 3)
+    assert found >= 0.9 * len([i for i in range(200) if i % 3])
+    assert all(gallery.best_match(encodings[i], 0.6)[0] != i for i in range(0, 200, 3))
+
+
+def test_product_quantized_index_finds_nearest():
+    encodings = create_encodings(300, 1)
+    gallery = Gallery()
+    gallery.extend(list(range(len(encodings))), encodings)
+    gallery.set_index(IVFIndex(nlist=4, nprobe=4, pq_m=8))
+    assert not gallery.index.is_exact()
+    found = [gallery.best_match(encodings[i] + 0.005, 0.6)[0] == i for i in range(0, 300, 5)]
+    assert sum(found) >= 0.9 * len(found)
+
+
+def test_small_gallery_uses_exact_search():
+    gallery = Gallery()
+    gallery.extend(list(range(10)), create_encodings(10, 1))
+    gallery.set_index(IVFIndex(nlist=64))
+    assert not gallery.index.is_trained()
+    assert gallery.best_match(create_encodings(10, 1)[4], 0.6)[0] == 4
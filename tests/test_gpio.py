@@ -0,0 +1,142 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import pytest
+
+from src import gpio
+from src.controller import GpioController
+from src.gpio import FakeGpio, FakeGpioBackend
+
+
+class PolledGpio(FakeGpio):
+    """ A pin without edge interrupts """
+
+    def isr(self, edge, func, args):
+        raise Exception('no interrupts')
+
+
+class PolledGpioBackend(FakeGpioBackend):
+    def Gpio(self, pin):
+        self.pins[pin] = PolledGpio(pin)
+        return self.pins[pin]
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+@pytest.fixture
+def backend():
+    return FakeGpioBackend()
+
+
+@pytest.fixture
+def controller(backend):
+    controller = GpioController(backend)
+    controller.start()
+    yield controller
+    controller.stop()
+
+
+def test_output_is_written_only_on_change(backend, controller):
+    light = controller.output(32)
+    light.write(1)
+    light.write(1)
+    light.write(0)
+    assert [value for _, value in backend.pins[32].writes] == [1, 0]
+
+
+def test_pulse_does_not_block_and_ends(backend, controller):
+    lock = controller.output(20)
+    start = time.time()
+    controller.pulse(lock, 0.05)
+    assert time.time() - start < 0.05
+    assert backend.pins[20].read() == 1
+    assert wait_for(lambda: backend.pins[20].read() == 0)
+    writes = backend.pins[20].writes
+    assert [value for _, value in writes] == [1, 0]
+    assert writes[1][0] - writes[0][0] >= 0.05
+
+
+def test_pulse_during_pulse_extends_it(backend, controller):
+    lock = controller.output(20)
+    controller.pulse(lock, 0.1)
+    time.sleep(0.05)
+    controller.pulse(lock, 0.1)
+    time.sleep(0.08)
+    # the first pulse is over, the second one is not
+    assert backend.pins[20].read() == 1
+    assert wait_for(lambda: backend.pins[20].read() == 0)
+    assert [value for _, value in backend.pins[20].writes] == [1, 0]
+
+
+def test_stop_closes_the_lock(backend):
+    controller = GpioController(backend)
+    controller.start()
+    lock = controller.output(20)
+    controller.pulse(lock, 10.0)
+    controller.stop()
+    assert backend.pins[20].read() == 0
+
+
+def test_press_is_delivered_by_interrupt(backend, controller):
+    presses = []
+    button = controller.input(18, lambda: presses.append(time.time()))
+    assert button.read() == 1
+    backend.pins[18].set_input(0)
+    assert len(presses) == 1
+    assert button.read() == 0
+    backend.pins[18].set_input(1)
+    # a bounce right after the press is ignored
+    backend.pins[18].set_input(0)
+    assert len(presses) == 1
+    assert not controller.polled
+
+
+def test_pin_without_interrupts_is_polled():
+    backend = PolledGpioBackend()
+    controller = GpioController(backend, poll_interval=0.005)
+    controller.start()
+    try:
+        presses = []
+        sensor = controller.input(26, lambda: presses.append(1))
+        assert controller.polled == [sensor]
+        backend.pins[26].set_input(0)
+        assert wait_for(lambda: presses == [1])
+        assert sensor.read() == 0
+    finally:
+        controller.stop()
+
+
+def test_backends(monkeypatch):
+    assert isinstance(gpio.get_backend('fake'), FakeGpioBackend)
+    with pytest.raises(Exception):
+        gpio.get_backend('serial')
+    monkeypatch.setattr(gpio, 'is_available', lambda name: False)
+    with pytest.raises(Exception, match='mraa module is not available'):
+        gpio.get_backend('mraa')
@@ -0,0 +1,137 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+
+from conftest import FACE_BOX, FixedDetector, make_frame
+from src import metrics
+from src.camera import Camera
+from src.depth import SyntheticDepth, MISSING_DEPTH
+from src.face_recognition import FaceRecognition
+from src.liveness import DepthLiveness
+from src.pipeline import Pipeline, Stage, DROP_OLDEST
+
+
+SHAPE = (480, 640)
+
+
+def test_face_relief_is_live():
+    liveness = DepthLiveness()
+    assert liveness.is_live(SyntheticDepth().read(SHAPE), FACE_BOX)
+    assert liveness.get_stats()['rejected'] == 0
+
+
+def test_flat_and_tilted_photos_are_rejected():
+    liveness = DepthLiveness()
+    assert not liveness.is_live(SyntheticDepth(flat=True, tilt=0.0).read(SHAPE), FACE_BOX)
+    # a tilted photo is still a plane
+    assert not liveness.is_live(SyntheticDepth(flat=True, tilt=0.3).read(SHAPE), FACE_BOX)
+    assert liveness.get_stats()['checked'] == 2
+    assert liveness.get_stats()['rejected'] == 2
+
+
+def test_relief_threshold():
+    depth = SyntheticDepth(relief=0.004).read(SHAPE)
+    relief = DepthLiveness().get_relief(depth, FACE_BOX)
+    assert 0 < relief
+    assert DepthLiveness(min_relief=relief / 2).is_live(depth, FACE_BOX)
+    assert not DepthLiveness(min_relief=relief * 2).is_live(depth, FACE_BOX)
+
+
+def test_missing_depth_is_rejected():
+    depth = SyntheticDepth().read(SHAPE).copy()
+    top, right, bottom, left = FACE_BOX
+    # no depth for most of the face, e.g. out of range of the camera
+    depth[top:bottom - 20, left:right] = 0
+    liveness = DepthLiveness()
+    assert liveness.get_relief(depth, FACE_BOX) is None
+    assert not liveness.is_live(depth, FACE_BOX)
+    # a box out of the depth frame
+    assert not liveness.is_live(SyntheticDepth().read(SHAPE), (500, 700, 600, 660))
+
+
+def test_depth_of_another_resolution_is_scaled():
+    liveness = DepthLiveness()
+    small = SyntheticDepth().read((240, 320))
+    relief = liveness.get_relief(small, FACE_BOX, SHAPE + (3,))
+    assert relief == liveness.get_relief(small, tuple(value // 2 for value in FACE_BOX))
+    assert not liveness.is_live(SyntheticDepth(flat=True).read((240, 320)), FACE_BOX, SHAPE + (3,))
+
+
+def create_face_recognition():
+    face_recognition = FaceRecognition(detector=FixedDetector())
+    face_recognition.set_liveness(DepthLiveness())
+    # the test frames encode to 0.5 in every dimension
+    face_recognition.gallery.extend(['person.jpg'], [np.full(128, 128 / 255.0)])
+    return face_recognition
+
+
+def run_pipeline(face_recognition, items):
+    pipeline = Pipeline([Stage('detect', face_recognition.get_live_face_crop, drop_policy=DROP_OLDEST),
+                         Stage('encode', face_recognition.encode),
+                         Stage('match', face_recognition.identify)])
+    results = []
+    with pipeline:
+        for item in items:
+            pipeline.put(item)
+            result = pipeline.get(timeout=5.0)
+            assert result is not None
+            results.append(result[1])
+    return results
+
+
+def test_flat_face_is_rejected_by_pipeline(fake_encoder):
+    face_recognition = create_face_recognition()
+    frame = make_frame(128)
+    flat = SyntheticDepth(flat=True).read(frame.shape[:2])
+    relief = SyntheticDepth().read(frame.shape[:2])
+    assert run_pipeline(face_recognition, [(frame, flat), (frame, relief)]) == [None, 'person.jpg']
+    assert face_recognition.liveness.get_stats()['checked'] == 2
+    assert face_recognition.liveness.get_stats()['rejected'] == 1
+
+
+def test_flat_face_is_rejected_before_encoding(fake_encoder):
+    face_recognition = create_face_recognition()
+    frame = make_frame(128)
+    assert face_recognition.recognize(frame, SyntheticDepth(flat=True).read(frame.shape[:2])) is None
+    assert face_recognition.recognize_detailed(frame, SyntheticDepth(flat=True).read(frame.shape[:2]))['spoof']
+    assert face_recognition.recognize(frame, SyntheticDepth().read(frame.shape[:2])) == 'person.jpg'
+    # frames without depth are not checked
+    assert face_recognition.recognize(frame) == 'person.jpg'
+
+
+def test_face_without_depth_of_a_depth_camera_is_rejected(fake_encoder):
+    face_recognition = create_face_recognition()
+    frame = make_frame(128)
+    missing = metrics.registry.counter('depth_missing').value
+    # e.g. recorded depth is shorter than the video
+    camera = Camera(depth='synthetic', lazy=True)
+    assert camera.get_depth() is MISSING_DEPTH
+    assert face_recognition.recognize(frame, camera.get_depth()) is None
+    assert run_pipeline(face_recognition, [(frame, MISSING_DEPTH)]) == [None]
+    assert face_recognition.liveness.get_stats()['missing'] == 2
+    assert face_recognition.liveness.get_stats()['rejected'] == 2
+    assert metrics.registry.counter('depth_missing').value == missing + 2
+    # a camera without depth is not checked
+    assert Camera(lazy=True).get_depth() is None
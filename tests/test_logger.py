@@ -0,0 +1,141 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import sys
+import pickle
+import logging
+import threading
+import multiprocessing
+import pytest
+
+from src.logger import RateLimitFilter, WorkerQueueHandler, init_logger, stop_logger, get_worker_records, \
+    init_worker_logger
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def make_record(message, created):
+    record = logging.LogRecord('fr3onn', logging.INFO, __file__, 0, message, (), None)
+    record.created = created
+    record.rate_limit = True
+    return record
+
+
+@pytest.fixture
+def logger(tmp_path):
+    init_logger(str(tmp_path))
+    yield logging.getLogger('fr3onn')
+    stop_logger()
+    for handler in logging.getLogger('fr3onn').handlers[:]:
+        logging.getLogger('fr3onn').removeHandler(handler)
+
+
+def read_summary(tmp_path):
+    stop_logger()
+    with open(os.path.join(str(tmp_path), 'summary.log'), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_repeats_are_counted_the_same_way_on_both_paths():
+    rate_limit = RateLimitFilter(60)
+    passed = [rate_limit.filter(record) and record.getMessage()
+              for record in [make_record('**Access DENIED**', created) for created in (0, 1, 2, 3, 61, 62)]]
+    assert passed == ['**Access DENIED**', False, False, False, '**Access DENIED** (3 repeats suppressed in 61 s)',
+                      False]
+    handler = ListHandler()
+    rate_limit.flush(handler)
+    assert len(handler.messages) == 1
+    assert handler.messages[0].startswith('**Access DENIED** (1 repeats suppressed in ')
+
+
+def test_repeats_from_many_threads_are_all_counted():
+    rate_limit = RateLimitFilter(60)
+    passed = []
+
+    def log_denied():
+        passed.extend(record for record in [make_record('**Access DENIED**', 1) for _ in range(1000)]
+                      if rate_limit.filter(record))
+
+    threads = [threading.Thread(target=log_denied) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    handler = ListHandler()
+    rate_limit.flush(handler)
+    assert len(passed) == 1
+    assert handler.messages[0].startswith('**Access DENIED** (7999 repeats suppressed in ')
+
+
+def test_other_records_are_not_limited():
+    rate_limit = RateLimitFilter(60)
+    record = logging.LogRecord('fr3onn', logging.INFO, __file__, 0, 'Adding a person', (), None)
+    assert rate_limit.filter(record)
+    assert rate_limit.filter(record)
+
+
+def test_traceback_is_formatted_by_listener(logger, tmp_path):
+    try:
+        raise ValueError('broken frame')
+    except ValueError:
+        logger.error('Failed to recognize %s', 'frame 7', exc_info=True)
+    text = read_summary(tmp_path)
+    assert 'ERROR    ' in text
+    assert 'Failed to recognize frame 7' in text
+    assert '          | Traceback (most recent call last):' in text
+    assert '          | ValueError: broken frame' in text
+
+
+def test_suppressed_repeats_are_written_on_stop(logger, tmp_path):
+    for _ in range(5):
+        logger.info('**Access DENIED**', extra={'rate_limit': True})
+    text = read_summary(tmp_path)
+    assert text.count('**Access DENIED**') == 2
+    assert '**Access DENIED** (4 repeats suppressed in ' in text
+
+
+def test_records_of_worker_processes_are_written_by_listener(logger, tmp_path):
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1, initializer=init_worker_logger, initargs=(get_worker_records(),)) as pool:
+        pool.apply(logging.getLogger('fr3onn').warning, ('Failed to encode %s', 'image 3'))
+    assert 'WARNING  ' in read_summary(tmp_path)
+    assert 'Failed to encode image 3' in read_summary(tmp_path)
+
+
+def test_worker_traceback_is_formatted_before_pickling():
+    try:
+        raise ValueError('broken image')
+    except ValueError:
+        record = logging.LogRecord('fr3onn', logging.ERROR, __file__, 0, 'Failed', (), sys.exc_info())
+    record = pickle.loads(pickle.dumps(WorkerQueueHandler(None).prepare(record)))
+    assert record.exc_info is None
+    assert '          | ValueError: broken image' in record.exc_text
@@ -0,0 +1,80 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import urllib.request
+import urllib.error
+import pytest
+
+from src.metrics import Metrics, MetricsServer
+
+
+def create_metrics():
+    metrics = Metrics()
+    metrics.counter('frames_seen', 'Frames read from cameras')
+    metrics.inc('frames_seen', 3)
+    metrics.inc('lock_pulses')
+    for value in (0.003, 0.02, 7.0):
+        metrics.histogram('detect').observe(value)
+    return metrics
+
+
+def test_prometheus_text_format():
+    lines = create_metrics().to_prometheus().split('\n')
+    assert lines[:6] == ['# HELP fr3onn_frames_seen_total Frames read from cameras',
+                         '# TYPE fr3onn_frames_seen_total counter',
+                         'fr3onn_frames_seen_total 3',
+                         '# HELP fr3onn_lock_pulses_total lock pulses',
+                         '# TYPE fr3onn_lock_pulses_total counter',
+                         'fr3onn_lock_pulses_total 1']
+    assert lines[6:8] == ['# HELP fr3onn_stage_latency_seconds Latency of processing stages',
+                          '# TYPE fr3onn_stage_latency_seconds histogram']
+    # buckets are cumulative, +Inf counts every sample
+    assert 'fr3onn_stage_latency_seconds_bucket{stage="detect",le="0.001"} 0' in lines
+    assert 'fr3onn_stage_latency_seconds_bucket{stage="detect",le="0.005"} 1' in lines
+    assert 'fr3onn_stage_latency_seconds_bucket{stage="detect",le="0.025"} 2' in lines
+    assert 'fr3onn_stage_latency_seconds_bucket{stage="detect",le="5.0"} 2' in lines
+    assert 'fr3onn_stage_latency_seconds_bucket{stage="detect",le="+Inf"} 3' in lines
+    assert 'fr3onn_stage_latency_seconds_sum{stage="detect"} 7.023' in lines
+    assert 'fr3onn_stage_latency_seconds_count{stage="detect"} 3' in lines
+    assert lines[-1] == ''
+
+
+def test_summary_line():
+    summary = create_metrics().get_summary()
+    assert summary.startswith('Metrics: frames seen 3, lock pulses 1; detect p50 20.0 ms p99 7000.0 ms')
+
+
+def test_endpoint_serves_registry():
+    metrics = create_metrics()
+    server = MetricsServer(0, metrics)
+    server.start()
+    url = 'http://{}:{}'.format(*server.server.server_address)
+    try:
+        response = urllib.request.urlopen(url + '/metrics', timeout=5)
+        assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+        assert response.read().decode('utf-8') == metrics.to_prometheus()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + '/other', timeout=5)
+    finally:
+        server.stop()
@@ -0,0 +1,67 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+import pytest
+
+from conftest import make_frame
+from src.motion import MotionDetector
+
+
+@pytest.fixture(autouse=True)
+def opencv():
+    pytest.importorskip('cv2')
+
+
+def with_person(frame, left=200):
+    frame = frame.copy()
+    frame[100:400, left:left + 160] = 220
+    return frame
+
+
+def test_idle_scene_is_not_active():
+    detector = MotionDetector(hold_frames=3)
+    empty = make_frame(40)
+    # the first frame becomes the background
+    assert [detector.is_active(empty) for _ in range(5)] == [True, True, True, False, False]
+    # sensor noise is below the pixel threshold
+    noisy = np.clip(empty.astype(np.int16) + np.random.RandomState(0).randint(-8, 9, empty.shape), 0, 255)
+    assert not detector.is_active(noisy.astype(np.uint8))
+    assert detector.get_stats()['frames'] == 6
+    assert detector.get_stats()['active_frames'] == 3
+
+
+def test_change_wakes_recognition_up_for_hold_frames():
+    detector = MotionDetector(hold_frames=3)
+    empty = make_frame(40)
+    for _ in range(5):
+        detector.is_active(empty)
+    assert detector.is_active(with_person(empty))
+    assert detector.get_stats()['last_change'] > 0.1
+    # a person standing still: the background learns slowly, the detector stays active
+    assert detector.is_active(with_person(empty))
+    detector = MotionDetector(hold_frames=2, learning_rate=1.0)
+    for _ in range(4):
+        detector.is_active(empty)
+    assert [detector.is_active(with_person(empty)) for _ in range(4)] == [True, True, False, False]
@@ -0,0 +1,119 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import numpy as np
+
+from src import person_store
+from src.person_store import PersonStore
+
+
+def write_file(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+    return str(path)
+
+
+def test_person_name_is_file_name_without_uuid():
+    assert PersonStore.parse_person_name('db/Alice.jpg') == 'Alice'
+    assert PersonStore.parse_person_name('db/Mary-Jane.jpg') == 'Mary-Jane'
+    uuid = '0f0e2a4c-4d7a-4b51-9a59-3c1c5e0b9d2e'
+    assert PersonStore.parse_person_name('db/Mary-Jane-{}.jpg'.format(uuid)) == 'Mary-Jane'
+    assert PersonStore.parse_person_name('db/Registered User 20261017_120000-{}.jpg'.format(uuid)) == \
+        'Registered User 20261017_120000'
+
+
+def test_start_does_not_walk_the_folder(tmp_path, monkeypatch):
+    write_file(tmp_path / 'Alice.jpg', b'alice')
+    PersonStore(str(tmp_path)).close()
+    write_file(tmp_path / 'Bob.jpg', b'bob')
+
+    def walk(*args, **kwargs):
+        raise AssertionError('the folder was walked')
+
+    monkeypatch.setattr(person_store.Utils, 'get_files_from_folder_recursively', walk)
+    store = PersonStore(str(tmp_path))
+    assert store.get_persons() == ['Alice']
+    store.close()
+
+
+def test_rescan_finds_changes_made_by_hand(tmp_path):
+    alice = write_file(tmp_path / 'Alice.jpg', b'alice')
+    bob = write_file(tmp_path / 'Bob.jpg', b'bob')
+    store = PersonStore(str(tmp_path))
+    assert store.get_persons() == ['Alice', 'Bob']
+    store.put(alice, np.full(128, 0.1))
+    store.put(bob, np.full(128, 0.2))
+    store.close()
+
+    # changed by hand while the store was closed
+    os.remove(bob)
+    write_file(tmp_path / 'Mary-Jane.jpg', b'mary')
+    write_file(alice, b'another alice')
+    store = PersonStore(str(tmp_path))
+    assert store.import_folder(rehash=True) == (1, 1, 1)
+    assert store.get_persons() == ['Alice', 'Mary-Jane']
+    assert store.get(alice) == (False, None)
+    assert store.count('encodings') == 0
+    store.close()
+
+
+def test_encodings_are_read_at_once(tmp_path):
+    paths = [write_file(tmp_path / '{}.jpg'.format(name), name.encode()) for name in ('Alice', 'Bob', 'Carol', 'Dave')]
+    store = PersonStore(str(tmp_path))
+    assert store.get_many(paths) == [(False, None)] * 4
+    store.put(paths[0], np.full(128, 0.1))
+    # no face on the image
+    store.put(paths[1], None)
+    store.put(paths[3], np.full(128, 0.3))
+    results = store.get_many(paths + [str(tmp_path / 'Eve.jpg')])
+    assert [found for found, _ in results] == [True, True, False, True, False]
+    assert np.allclose(results[0][1], 0.1) and results[1][1] is None and np.allclose(results[3][1], 0.3)
+    # rows of one matrix
+    assert results[3][1].base is results[0][1].base
+    store.close()
+
+
+def test_rehash_finds_changes_with_the_same_size_and_mtime(tmp_path):
+    alice = write_file(tmp_path / 'Alice.jpg', b'alice')
+    store = PersonStore(str(tmp_path))
+    store.put(alice, np.full(128, 0.1))
+    stat = os.stat(alice)
+    write_file(alice, b'ALICE')
+    os.utime(alice, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert store.import_folder() == (0, 0, 0)
+    assert store.import_folder(rehash=True) == (0, 0, 1)
+    assert store.count('encodings') == 0
+    store.close()
+
+
+def test_touched_image_keeps_its_encoding(tmp_path):
+    alice = write_file(tmp_path / 'Alice.jpg', b'alice')
+    store = PersonStore(str(tmp_path))
+    store.put(alice, np.full(128, 0.1))
+    os.utime(alice, (1000000000, 1000000000))
+    assert store.import_folder() == (0, 0, 0)
+    found, encoding = store.get(alice)
+    assert found and np.allclose(encoding, 0.1)
+    store.close()
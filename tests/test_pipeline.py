@@ -0,0 +1,79 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+
+from src import metrics
+from src.pipeline import Pipeline, Stage, DROP_NEWEST
+
+
+def slow_double(value):
+    time.sleep(0.01)
+    return value * 2
+
+
+def counted_double(value):
+    with metrics.registry.timer('double'):
+        metrics.registry.inc('encodes')
+        return value * 2
+
+
+def test_flush_waits_for_items_in_flight():
+    pipeline = Pipeline([Stage('double', slow_double, workers=2, queue_size=100), Stage('inc', lambda x: x + 1)])
+    with pipeline:
+        for value in range(20):
+            pipeline.put(value)
+        assert pipeline.flush(timeout=5.0)
+        assert pipeline.get_ready() == [(value, value * 2 + 1) for value in range(20)]
+
+
+def test_flush_counts_dropped_items():
+    pipeline = Pipeline([Stage('double', slow_double, queue_size=1, drop_policy=DROP_NEWEST)])
+    with pipeline:
+        submitted = [pipeline.put(value) for value in range(10)]
+        assert pipeline.flush(timeout=5.0)
+        ready = pipeline.get_ready()
+    dropped = [seq for seq in submitted if seq is None]
+    assert dropped
+    assert len(ready) + len(dropped) == 10
+    assert pipeline.next_output == 10
+
+
+def test_flush_times_out():
+    pipeline = Pipeline([Stage('sleep', lambda value: time.sleep(1.0))])
+    with pipeline:
+        pipeline.put(None)
+        assert not pipeline.flush(timeout=0.05)
+
+
+def test_metrics_of_worker_processes_come_back():
+    encodes = metrics.registry.counter('encodes').value
+    pipeline = Pipeline([Stage('double', counted_double, workers=2, processes=True)])
+    with pipeline:
+        for value in range(5):
+            pipeline.put(value)
+        assert pipeline.flush(timeout=30.0)
+        assert pipeline.get_ready() == [(value, value * 2) for value in range(5)]
+    assert metrics.registry.counter('encodes').value == encodes + 5
+    assert metrics.registry.histogram('double').count == 5
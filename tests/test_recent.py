@@ -0,0 +1,74 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+
+from src.gallery import Gallery
+from src.recent import RecentIdentities
+
+
+def create_gallery(count=4):
+    gallery = Gallery()
+    gallery.extend(['{}.jpg'.format(i) for i in range(count)], [np.full(128, i / 10.0) for i in range(count)])
+    return gallery
+
+
+def test_cached_identity_is_matched():
+    gallery = create_gallery()
+    recent = RecentIdentities(capacity=2, tolerance=0.4)
+    assert recent.lookup(np.full(128, 0.1), gallery) is None
+    recent.add('1.jpg', gallery)
+    found = recent.lookup(np.full(128, 0.1) + 0.01, gallery)
+    assert found[0] == '1.jpg'
+    assert abs(found[1] - np.sqrt(128) * 0.01) < 1e-5
+    # farther than the strict tolerance from every cached entry
+    assert recent.lookup(np.full(128, 0.2), gallery) is None
+    assert recent.get_stats()['hits'] == 1
+    assert recent.get_stats()['lookups'] == 3
+
+
+def test_least_recently_used_is_evicted():
+    gallery = create_gallery()
+    recent = RecentIdentities(capacity=2)
+    recent.add('0.jpg', gallery)
+    recent.add('1.jpg', gallery)
+    assert recent.lookup(np.full(128, 0.0), gallery)[0] == '0.jpg'
+    recent.add('2.jpg', gallery)
+    assert list(recent.entries) == ['0.jpg', '2.jpg']
+
+
+def test_cache_is_cleared_when_gallery_changes():
+    gallery = create_gallery()
+    recent = RecentIdentities()
+    recent.add('1.jpg', gallery)
+    gallery.remove('1.jpg')
+    assert recent.lookup(np.full(128, 0.1), gallery) is None
+    assert not len(recent)
+    recent.add('1.jpg', gallery)
+    assert not len(recent)
+    recent.add('2.jpg', gallery)
+    assert len(recent) == 1
+    # a new gallery, e.g. loaded by the database watcher
+    assert recent.lookup(np.full(128, 0.2), create_gallery()) is None
+    assert not len(recent)
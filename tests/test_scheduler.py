@@ -0,0 +1,78 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import types
+
+from src.scheduler import CameraScheduler, FrameScheduler
+
+
+def test_empty_scene_backs_off_to_the_budget():
+    scheduler = FrameScheduler('0', latency_budget=1.0, face_hold=2.0, smoothing=1.0)
+    assert scheduler.should_process(now=100.0)
+    scheduler.update(0.2, False, now=100.2)
+    # a face appearing right after a recognition waits at most budget - latency, then is recognized
+    assert abs(scheduler.get_interval(now=100.2) - 0.8) < 1e-9
+    assert not scheduler.should_process(now=100.5)
+    assert scheduler.should_process(now=100.81)
+    assert scheduler.get_stats()['skipped'] == 1
+
+
+def test_face_is_recognized_every_frame_until_hold_expires():
+    scheduler = FrameScheduler('0', latency_budget=1.0, face_hold=2.0, smoothing=1.0)
+    assert scheduler.should_process(now=100.0)
+    scheduler.update(0.2, True, now=100.2)
+    assert scheduler.should_process(now=100.25)
+    scheduler.update(0.2, False, now=100.45)
+    assert scheduler.should_process(now=102.0)
+    scheduler.update(0.2, False, now=102.2)
+    # the face has gone more than face_hold seconds ago
+    assert not scheduler.should_process(now=102.3)
+    assert scheduler.get_stats()['face_frames'] == 1
+
+
+def test_latency_over_budget():
+    scheduler = FrameScheduler('0', latency_budget=0.1, smoothing=1.0)
+    scheduler.update(0.3, False, now=100.0)
+    assert scheduler.get_interval(now=100.0) == 0.0
+    assert scheduler.get_stats()['over_budget']
+
+
+def test_every_frame_without_budget():
+    scheduler = FrameScheduler('0', latency_budget=None, smoothing=1.0)
+    for i in range(5):
+        assert scheduler.should_process(now=100.0 + i * 0.01)
+        scheduler.update(0.5, False, now=100.0 + i * 0.01)
+    stats = scheduler.get_stats()
+    assert stats['skipped'] == 0
+    assert stats['idle_interval_ms'] == 0
+    assert not stats['over_budget']
+
+
+def create_door(new_frame, busy_time):
+    return types.SimpleNamespace(camera=types.SimpleNamespace(has_new_frame=lambda: new_frame), busy_time=busy_time)
+
+
+def test_door_with_least_recognition_time_is_next():
+    idle, busy, waiting = create_door(True, 1.0), create_door(True, 5.0), create_door(False, 0.0)
+    assert CameraScheduler([busy, waiting, idle]).next() is idle
@@ -0,0 +1,124 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import threading
+import numpy as np
+
+from conftest import FixedDetector, make_frame
+from src.face_recognition import FaceRecognition
+from src.server import RecognitionServer, RecognitionClient, Request
+
+
+class ExclusiveDetector(FixedDetector):
+    """ Counts detections which overlap in time """
+
+    def __init__(self):
+        FixedDetector.__init__(self)
+        self.active = 0
+        self.overlaps = 0
+
+    def find(self, image):
+        self.active += 1
+        if self.active > 1:
+            self.overlaps += 1
+        time.sleep(0.01)
+        self.active -= 1
+        return FixedDetector.find(self, image)
+
+
+def create_server(detector=None):
+    face_recognition = FaceRecognition(detector=detector or FixedDetector())
+    face_recognition.gallery.extend(['db/Alice.jpg', 'db/Bob.jpg'],
+                                    [np.full(128, 64 / 255.0), np.full(128, 192 / 255.0)])
+    server = RecognitionServer(face_recognition, port=0, max_wait=0.001)
+    server.start()
+    return server
+
+
+def test_client_gets_person_name(fake_encoder):
+    server = create_server()
+    client = RecognitionClient(server.get_url())
+    try:
+        assert client.recognize(make_frame(64)) == 'Alice'
+        assert client.face_present
+        assert client.recognize(make_frame(192)) == 'Bob'
+        # too far from both persons
+        assert client.recognize(make_frame(128)) is None
+        result = client.recognize_detailed(make_frame(192))
+        assert result['match'] == 'db/Bob.jpg'
+        assert result['box'] == [100, 300, 300, 100]
+    finally:
+        client.close()
+        server.stop()
+    assert server.get_stats()['requests'] == 4
+
+
+def test_failed_server_is_no_match():
+    client = RecognitionClient('http://127.0.0.1:1', timeout=0.5)
+    assert client.recognize(make_frame(64)) is None
+    assert client.errors == 1
+    assert not client.face_present
+
+
+def test_concurrent_requests_do_not_share_detector(fake_encoder):
+    detector = ExclusiveDetector()
+    server = create_server(detector)
+    results = []
+
+    def run():
+        client = RecognitionClient(server.get_url())
+        results.extend(client.recognize(make_frame(64)) for _ in range(5))
+        client.close()
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.stop()
+    assert results == ['Alice'] * 20
+    assert detector.frames == 20
+    assert detector.overlaps == 0
+
+
+def test_stop_releases_waiting_requests():
+    server = RecognitionServer(FaceRecognition(detector=FixedDetector()), port=0)
+    request = Request(np.full(128, 0.25))
+    server.queue.put(request)
+    server.stop()
+    assert request.done.is_set()
+    assert request.error == 'recognition server is stopped'
+
+
+def test_request_after_stop_fails(fake_encoder):
+    server = create_server()
+    server.stop()
+    try:
+        server.recognize(make_frame(64))
+        assert False
+    except Exception as ex:
+        assert str(ex) == 'recognition server is stopped'
@@ -0,0 +1,71 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import sys
+import time
+import subprocess
+import pytest
+
+from src.lazy import lazy_import, load, StartupTask
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_heavy_modules_are_not_imported_at_start():
+    code = 'import sys, launcher; print(" ".join(sorted(m for m in ("cv2", "dlib", "face_recognition", "mraa") ' \
+           'if m in sys.modules)))'
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT)
+    assert output.decode('utf-8').strip() == ''
+
+
+def test_module_is_imported_on_first_use(tmp_path, monkeypatch):
+    with open(str(tmp_path / 'heavy_model.py'), 'w') as f:
+        f.write('loaded = True\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    module = lazy_import('heavy_model')
+    assert 'heavy_model' not in sys.modules
+    assert module.loaded
+    assert load(module) is sys.modules['heavy_model']
+    monkeypatch.delitem(sys.modules, 'heavy_model')
+
+
+def test_startup_steps_run_concurrently():
+    started = time.time()
+    tasks = [StartupTask(name, time.sleep, 0.2).start() for name in ('camera', 'GPIO', 'gallery')]
+    assert not any(task.is_done() for task in tasks)
+    for task in tasks:
+        task.wait()
+    assert time.time() - started < 0.5
+    assert all(task.is_done() and task.elapsed >= 0.2 for task in tasks)
+
+
+def test_failed_step_is_raised_by_wait():
+    def open_camera():
+        raise IOError('no such device')
+
+    task = StartupTask('camera 0', open_camera).start()
+    with pytest.raises(Exception) as error:
+        task.wait()
+    assert str(error.value) == 'Failed to start camera 0: no such device'
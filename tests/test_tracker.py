@@ -0,0 +1,121 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+from src.tracker import FaceTracker, iou
+
+BOX = (100, 300, 300, 100)
+
+
+def move(box, dx, dy=0):
+    top, right, bottom, left = box
+    return top + dy, right + dx, bottom + dy, left + dx
+
+
+def test_iou():
+    assert iou(BOX, BOX) == 1.0
+    assert iou(BOX, move(BOX, 400)) == 0.0
+    assert abs(iou(BOX, move(BOX, 100)) - 1 / 3.0) < 1e-9
+
+
+def test_moving_face_keeps_its_track():
+    tracker = FaceTracker()
+    track = tracker.update([BOX], now=0.0)[0]
+    box = BOX
+    for i in range(1, 10):
+        box = move(box, 10)
+        assert tracker.update([box], now=i * 0.1) == [track]
+    assert track.box == box
+    assert track.hits == 10
+    assert tracker.get_stats()['tracks_created'] == 1
+
+
+def test_distant_faces_get_own_tracks():
+    tracker = FaceTracker()
+    first, second = tracker.update([BOX, move(BOX, 300)], now=0.0)
+    assert first is not second
+    assert tracker.update([move(BOX, 300), BOX], now=0.1) == [second, first]
+
+
+def test_encoding_intervals():
+    tracker = FaceTracker(verify_interval=2.0, retry_interval=0.5)
+    track = tracker.update([BOX], now=0.0)[0]
+    assert tracker.needs_encoding(track, now=0.0)
+    tracker.set_identity(track, 'Alice.jpg', now=0.0)
+    assert not tracker.needs_encoding(track, now=1.0)
+    assert tracker.needs_encoding(track, now=2.0)
+    # unknown faces are retried sooner
+    tracker.set_identity(track, None, now=2.0)
+    assert not tracker.needs_encoding(track, now=2.4)
+    assert tracker.needs_encoding(track, now=2.5)
+    assert tracker.get_stats()['encodes'] == 2
+    assert tracker.get_stats()['encodes_saved'] == 2
+
+
+def test_track_is_lost_after_max_missed_frames():
+    tracker = FaceTracker(max_missed=2)
+    tracker.update([BOX], now=0.0)
+    tracker.update([], now=0.1)
+    tracker.update([], now=0.2)
+    assert len(tracker.tracks) == 1
+    tracker.update([], now=0.3)
+    assert not tracker.tracks
+    assert tracker.get_stats()['tracks_lost'] == 1
+
+
+def test_missed_track_is_encoded_again():
+    tracker = FaceTracker(verify_interval=2.0)
+    track = tracker.update([BOX], now=0.0)[0]
+    tracker.set_identity(track, 'Alice.jpg', now=0.0)
+    # the face was not found on one frame, e.g. somebody else stepped in
+    tracker.update([], now=0.1)
+    assert tracker.update([BOX], now=0.2) == [track]
+    assert tracker.needs_encoding(track, now=0.2)
+    tracker.set_identity(track, 'Bob.jpg', now=0.2)
+    assert not tracker.needs_encoding(track, now=0.3)
+    assert tracker.get_stats()['encodes_forced'] == 1
+
+
+def test_jumped_box_is_encoded_again():
+    tracker = FaceTracker(verify_interval=2.0)
+    track = tracker.update([BOX], now=0.0)[0]
+    tracker.set_identity(track, 'Alice.jpg', now=0.0)
+    # a larger face overlapping the granted one: the same track by IoU, but not the same face
+    larger = (60, 340, 340, 60)
+    assert tracker.update([larger], now=0.1) == [track]
+    assert tracker.needs_encoding(track, now=0.1)
+    tracker.set_identity(track, None, now=0.1)
+    # a shifted face of the same size
+    assert tracker.update([move(larger, 80)], now=0.2) == [track]
+    assert tracker.needs_encoding(track, now=0.2)
+
+
+def test_small_motion_keeps_identity():
+    tracker = FaceTracker(verify_interval=2.0)
+    track = tracker.update([BOX], now=0.0)[0]
+    tracker.set_identity(track, 'Alice.jpg', now=0.0)
+    box = BOX
+    for i in range(1, 10):
+        box = move(box, 15, 5)
+        tracker.update([box], now=i * 0.1)
+        assert not tracker.needs_encoding(track, now=i * 0.1)
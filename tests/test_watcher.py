@@ -0,0 +1,106 @@
+# MIT License
+#
+# Copyright 2017-2018 Dmitry Vodopyanov, dmitry.vodopyanov@gmail.com
+# Copyright 2017-2018 Artem Kashkanov, radiolokn@gmail.com
+# Copyright 2017-2018 Sergey Shtin, sergey.shtin@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import numpy as np
+
+from conftest import FixedDetector
+from src.db import DataBase
+from src.face_recognition import FaceRecognition
+from src.watcher import DatabaseWatcher
+
+
+def write_file(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def encode_size(images, workers=None, trusted=False):
+    """ Encoding of an image is its file size in every dimension, so a changed file changes its encoding """
+    return [np.full(128, os.path.getsize(image) / 100.0) for image in images]
+
+
+def create_watcher(tmp_path, monkeypatch):
+    os.makedirs(str(tmp_path / 'staff'))
+    write_file(str(tmp_path / 'Alice.jpg'), b'a' * 10)
+    write_file(str(tmp_path / 'staff' / 'Bob.jpg'), b'b' * 20)
+    db = DataBase()
+    db.set_db_dir(str(tmp_path))
+    face_recognition = FaceRecognition(detector=FixedDetector())
+    monkeypatch.setattr(face_recognition, 'get_encodings', encode_size)
+    watcher = DatabaseWatcher(db, [face_recognition], use_inotify=False)
+    watcher.full_scan = True
+    watcher.sync()
+    return db, face_recognition, watcher
+
+
+def poll(watcher):
+    listed = []
+    list_folder = watcher.list_folder
+
+    def spy(folder):
+        listed.append(os.path.relpath(folder, watcher.db.get_db_dir()))
+        return list_folder(folder)
+
+    watcher.list_folder = spy
+    watcher.pending |= watcher.get_changed_files()
+    watcher.list_folder = list_folder
+    if watcher.pending:
+        watcher.sync()
+    return listed
+
+
+def test_images_are_added_changed_and_removed(tmp_path, monkeypatch):
+    db, face_recognition, watcher = create_watcher(tmp_path, monkeypatch)
+    gallery = face_recognition.gallery
+    assert sorted(os.path.basename(path) for path in gallery.get_ids()) == ['Alice.jpg', 'Bob.jpg']
+    write_file(str(tmp_path / 'staff' / 'Carol.jpg'), b'c' * 30)
+    os.remove(str(tmp_path / 'Alice.jpg'))
+    # only the changed folders are listed, their subfolders are not walked
+    assert sorted(poll(watcher)) == ['.', 'staff']
+    assert sorted(os.path.basename(path) for path in face_recognition.gallery.get_ids()) == ['Bob.jpg', 'Carol.jpg']
+    # the gallery in use is not modified, a new one is published
+    assert sorted(os.path.basename(path) for path in gallery.get_ids()) == ['Alice.jpg', 'Bob.jpg']
+    assert sorted(db.store.get_persons()) == ['Bob', 'Carol']
+    assert poll(watcher) == []
+    # overwritten in place: the folder is not changed, the periodic full scan finds the image
+    bob = str(tmp_path / 'staff' / 'Bob.jpg')
+    write_file(bob, b'b' * 40)
+    poll(watcher)
+    assert face_recognition.gallery.get_encoding(bob)[0] == np.float32(0.2)
+    watcher.full_scan = True
+    watcher.sync()
+    assert face_recognition.gallery.get_encoding(bob)[0] == np.float32(0.4)
+    assert watcher.syncs == 3
+    db.store.close()
+
+
+def test_removed_folder_removes_its_images(tmp_path, monkeypatch):
+    db, face_recognition, watcher = create_watcher(tmp_path, monkeypatch)
+    os.remove(str(tmp_path / 'staff' / 'Bob.jpg'))
+    os.rmdir(str(tmp_path / 'staff'))
+    poll(watcher)
+    assert [os.path.basename(path) for path in face_recognition.gallery.get_ids()] == ['Alice.jpg']
+    assert 'staff' not in [os.path.basename(folder) for folder in watcher.folders]
+    db.store.close()